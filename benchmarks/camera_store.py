@@ -0,0 +1,105 @@
+"""
+Compares set/get latency and throughput of the camera store backends.
+
+    python -m benchmarks.camera_store [frame_kb] [frames]
+
+The writer and reader are separate store instances, as they would be in
+separate processes, and every read follows a write so it always fetches a
+new frame. The Redis backend is skipped when no server is reachable.
+"""
+
+import os
+import statistics
+import sys
+import time
+from typing import Callable, List, Tuple
+
+import redis
+
+from src.service.store import (
+    CameraStore,
+    MemoryCameraStore,
+    RedisCameraStore,
+    SharedMemoryCameraStore,
+)
+
+SOURCE = "bench://camera"
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(
+    name: str, writer: CameraStore, reader: CameraStore, frame: bytes, frames: int
+) -> None:
+    set_times: List[float] = []
+    get_times: List[float] = []
+
+    started = time.perf_counter()
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        writer.set_frame_bytes(SOURCE, frame)
+        t1 = time.perf_counter()
+        latest = reader.get_latest(SOURCE)
+        t2 = time.perf_counter()
+        assert latest is not None and len(latest) == len(frame)
+        set_times.append(t1 - t0)
+        get_times.append(t2 - t1)
+    elapsed = time.perf_counter() - started
+
+    # Reads of an unchanged frame hit the reader's cache of the latest frame.
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        reader.get_latest(SOURCE)
+    cached = (time.perf_counter() - t0) / frames
+
+    writer.clear_frames(SOURCE)
+
+    def us(samples: List[float]) -> str:
+        return (
+            f"p50 {statistics.median(samples) * 1e6:8.1f} us  "
+            f"p99 {percentile(samples, 0.99) * 1e6:8.1f} us"
+        )
+
+    print(f"{name}")
+    print(f"  set          {us(set_times)}")
+    print(f"  get (new)    {us(get_times)}")
+    print(f"  get (cached) mean {cached * 1e6:7.1f} us")
+    print(
+        f"  throughput   {frames / elapsed:8.0f} frames/s  "
+        f"{frames * len(frame) / elapsed / (1 << 20):8.1f} MB/s (set + get)"
+    )
+
+
+def backends() -> List[Tuple[str, Callable[[], Tuple[CameraStore, CameraStore]]]]:
+    def memory() -> Tuple[CameraStore, CameraStore]:
+        store = MemoryCameraStore()
+        return store, store
+
+    def shared() -> Tuple[CameraStore, CameraStore]:
+        return SharedMemoryCameraStore(), SharedMemoryCameraStore()
+
+    def redis_store() -> Tuple[CameraStore, CameraStore]:
+        return RedisCameraStore(), RedisCameraStore()
+
+    return [("memory", memory), ("shared memory", shared), ("redis", redis_store)]
+
+
+def main() -> None:
+    frame_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    frame = b"\xff\xd8\xff" + os.urandom(frame_kb * 1024) + b"\xff\xd9"
+
+    print(f"{frames} frames of {frame_kb} KB")
+    for name, factory in backends():
+        try:
+            writer, reader = factory()
+            run(name, writer, reader, frame, frames)
+        except redis.exceptions.ConnectionError:
+            print(f"{name}\n  skipped: server not reachable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Measures how fast robot commands are parsed and serialized by the
+command grammar, against the per-call regex validation it replaced.
+
+    python -m benchmarks.command_parse [rounds]
+
+Each round parses a mix of valid, clamped and invalid commands, the kind
+of lines the model's answers are checked against.
+"""
+
+import re
+import sys
+import time
+from typing import Callable, List, Optional
+
+from src.dev.command import parse_command
+
+COMMANDS = [
+    "vex robot move forward 50 1.5",
+    "vex robot move left 250 0.1",
+    "vex robot move armUp 30",
+    "vex robot set claw 1",
+    "vex robot get arm",
+    "vex motor all stop",
+    "vex battery getCapacity",
+    "vex ping",
+    "vex robot move sideways 40 1",
+    "I think the robot should move forward.",
+]
+
+TEMPLATES = [
+    "vex robot move (forward|backward|left|right|armUp|armDown|clawOpen|clawClose) (1-188) (0.5-3)",
+    "vex motor all stop",
+]
+
+
+def legacy_validate(command: str) -> Optional[str]:
+    """
+    The validation CommandGenerator ran before the grammar: nested
+    functions and uncompiled patterns rebuilt on every call.
+    """
+
+    def validate_command(command: str) -> bool:
+        if not command.startswith("vex robot move"):
+            return True
+        if re.match(r"vex robot move \w+ \d+$", command):
+            command += " 1"
+        for command_template in TEMPLATES:
+            if command_template.startswith("vex robot move"):
+                pattern = (
+                    r"vex robot move (forward|backward|left|right|armUp|armDown|clawOpen|clawClose) "
+                    r"(\d{2,3}) (\d+(.\d+)?)"
+                )
+                if re.fullmatch(pattern, command):
+                    return True
+        return False
+
+    def adjust_command(command: str) -> str:
+        if not command.startswith("vex robot move"):
+            return command
+        if re.match(r"vex robot move \w+ \d+$", command):
+            command += " 1"
+        match = re.search(r"move .* (\d+) (\d+(.\d+)?)", command)
+        if match:
+            velocity = min(max(int(match.group(1)), 10), 188)
+            duration = min(max(float(match.group(2)), 0.5), 3)
+            command_parts = command.split()
+            command_parts[-2] = str(velocity)
+            command_parts[-1] = str(duration)
+            command = " ".join(command_parts)
+        return command
+
+    if not command.startswith("vex "):
+        return None
+    adjusted = adjust_command(command)
+    return adjusted if validate_command(adjusted) else None
+
+
+def grammar_validate(command: str) -> Optional[str]:
+    parsed = parse_command(command)
+    return parsed.serialize() if parsed else None
+
+
+def run(name: str, validate: Callable[[str], Optional[str]], rounds: int) -> None:
+    results: List[Optional[str]] = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        results = [validate(command) for command in COMMANDS]
+    elapsed = time.perf_counter() - started
+
+    parsed = rounds * len(COMMANDS)
+    valid = sum(1 for result in results if result)
+    print(
+        f"{name:<8} {parsed / elapsed:12,.0f} commands/s  "
+        f"{elapsed / parsed * 1e6:6.2f} us each  "
+        f"{valid}/{len(COMMANDS)} valid"
+    )
+
+
+def main() -> None:
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{rounds} rounds of {len(COMMANDS)} commands")
+    run("legacy", legacy_validate, rounds)
+    run("grammar", grammar_validate, rounds)
+
+    for command in COMMANDS:
+        print(f"  {command!r:42} -> {grammar_validate(command)!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Micro-benchmark for the MJPEG frame extractor.
+
+Feeds a recorded MJPEG byte stream through the legacy `bytes` concatenation
+parser and through `MJPEGFrameExtractor` in 8 KB chunks, the same chunk size
+`Camera._fetch_stream` reads from the socket.
+
+    python -m benchmarks.mjpeg_extractor [recording.mjpeg]
+
+Without a recording a synthetic multipart stream of noisy 640x480 JPEGs is used.
+"""
+
+import sys
+import time
+from io import BytesIO
+from typing import Callable, Iterable, List
+
+import numpy as np
+from PIL import Image
+
+from src.dev.mjpeg import MJPEGFrameExtractor
+
+CHUNK_SIZE = 8192
+BOUNDARY = b"--frame"
+
+
+def synthetic_stream(frames: int = 120, width: int = 640, height: int = 480) -> bytes:
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    parts: List[bytes] = []
+
+    for i in range(frames):
+        image = np.roll(base, i * 4, axis=1)
+        buffer = BytesIO()
+        Image.fromarray(image).save(buffer, format="JPEG", quality=80)
+        jpeg = buffer.getvalue()
+        parts.append(
+            BOUNDARY
+            + b"\r\nContent-Type: image/jpeg\r\n"
+            + f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+            + jpeg
+            + b"\r\n"
+        )
+
+    return b"".join(parts)
+
+
+def chunks(stream: bytes) -> Iterable[bytes]:
+    for i in range(0, len(stream), CHUNK_SIZE):
+        yield stream[i : i + CHUNK_SIZE]
+
+
+def legacy_parser(stream: bytes) -> int:
+    frames = 0
+    buffer = b""
+    for chunk in chunks(stream):
+        buffer += chunk
+        start = buffer.find(b"\xff\xd8")
+        end = buffer.find(b"\xff\xd9")
+        if start != -1 and end != -1:
+            buffer = buffer[end + 2 :]
+            frames += 1
+    return frames
+
+
+def extractor_parser(stream: bytes) -> int:
+    frames = 0
+    extractor = MJPEGFrameExtractor(boundary=BOUNDARY)
+    for chunk in chunks(stream):
+        frames += len(extractor.feed(chunk))
+    return frames
+
+
+def extractor_markers_only(stream: bytes) -> int:
+    frames = 0
+    extractor = MJPEGFrameExtractor()
+    for chunk in chunks(stream):
+        frames += len(extractor.feed(chunk))
+    return frames
+
+
+def bench(
+    name: str, parser: Callable[[bytes], int], stream: bytes, rounds: int
+) -> None:
+    best = float("inf")
+    frames = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        frames = parser(stream)
+        best = min(best, time.perf_counter() - started)
+
+    mb = len(stream) / (1 << 20)
+    print(
+        f"{name:<24} {frames:>5} frames  {best * 1000:8.2f} ms  "
+        f"{mb / best:8.1f} MB/s  {best / max(frames, 1) * 1e6:8.1f} us/frame"
+    )
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            stream = f.read()
+    else:
+        stream = synthetic_stream()
+
+    print(f"stream: {len(stream) / (1 << 20):.1f} MB in {CHUNK_SIZE} byte chunks")
+    bench("legacy bytes concat", legacy_parser, stream, rounds=5)
+    bench("extractor (headers)", extractor_parser, stream, rounds=5)
+    bench("extractor (markers)", extractor_markers_only, stream, rounds=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Compares the per-call cost of RateLimiter's quota backends.
+
+    python -m benchmarks.quota [calls]
+
+Each call goes through `admit` and then `record_usage`, as BaseBrain does
+around a model call, so the spending check, fallback and window
+corrections are all paid for. Round trips to Redis are counted, including
+the background flushes. The Redis backends are skipped when no server is
+reachable on localhost.
+"""
+
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, Callable, List, Tuple
+
+import redis
+
+from src.dev.quota import LocalQuota, QuotaBackend, RedisQuota
+from src.dev.ratelimiter import RateLimiter, RateLimitExceeded
+from src.dev.reporting import Reporter
+
+MODEL = "llama3-groq-8b-8192-tool-use-preview"
+TOKENS = 20
+
+
+class CountingRedis(redis.StrictRedis):
+    """
+    Counts round trips: single commands, and pipelines as one each.
+    """
+
+    round_trips = 0
+
+    def execute_command(self, *args: Any, **options: Any) -> Any:
+        CountingRedis.round_trips += 1
+        return super().execute_command(*args, **options)  # type: ignore[no-untyped-call]
+
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> Any:
+        pipeline = super().pipeline(transaction, shard_hint)
+        execute = pipeline.execute
+
+        def counted(raise_on_error: bool = True) -> Any:
+            CountingRedis.round_trips += 1
+            return execute(raise_on_error)
+
+        pipeline.execute = counted  # type: ignore[method-assign]
+        return pipeline
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(name: str, quota: QuotaBackend, calls: int) -> None:
+    limiter = RateLimiter(reporter=Reporter(), max_spend_cad=float("inf"), quota=quota)
+    samples: List[float] = []
+    admitted = 0
+
+    CountingRedis.round_trips = 0
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        try:
+            model: str | None = limiter.admit(MODEL, TOKENS)
+        except RateLimitExceeded:
+            model = None
+        if model:
+            admitted += 1
+            limiter.record_usage(
+                model, TOKENS // 2, TOKENS // 2, reserved_tokens=TOKENS
+            )
+        samples.append(time.perf_counter() - t0)
+
+    quota.close()
+    print(
+        f"{name:<22} p50 {statistics.median(samples) * 1e6:8.1f} us  "
+        f"p99 {percentile(samples, 0.99) * 1e6:8.1f} us  "
+        f"admitted {admitted}/{calls}  "
+        f"round trips {CountingRedis.round_trips}"
+    )
+
+
+def backends() -> List[Tuple[str, Callable[[], QuotaBackend]]]:
+    def client() -> redis.StrictRedis:
+        return CountingRedis(decode_responses=True)
+
+    def prefix() -> str:
+        return f"bench:{uuid.uuid4().hex[:8]}:"
+
+    return [
+        ("local", LocalQuota),
+        ("redis", lambda: RedisQuota(client(), prefix=prefix())),
+        (
+            "redis leased + batched",
+            lambda: RedisQuota(
+                client(), prefix=prefix(), lease_fraction=0.1, flush_interval=0.5
+            ),
+        ),
+    ]
+
+
+def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+
+    print(f"{calls} calls of {TOKENS} tokens to {MODEL}")
+    for name, factory in backends():
+        try:
+            run(name, factory(), calls)
+        except redis.exceptions.ConnectionError:
+            print(f"{name:<22} skipped: server not reachable")
+
+
+if __name__ == "__main__":
+    main()
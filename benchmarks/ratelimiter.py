@@ -0,0 +1,128 @@
+"""
+Drives RateLimiter with a simulated clock and reports the throughput it
+admits against the model's limits, and how long callers wait.
+
+    python -m benchmarks.ratelimiter [model] [tokens_per_call] [minutes]
+
+Calls are issued back to back through `acquire`, so the admitted rate is
+the limiter's ceiling. It should sit at the tighter of the request and
+token per-minute limits, with no call rejected and no 60 s window
+holding more than the limits; the busiest window is reported.
+"""
+
+import asyncio
+import bisect
+import statistics
+import sys
+import time
+from typing import List
+
+from src.dev.ratelimiter import RateLimiter
+from src.dev.reporting import Reporter
+
+
+class SimulatedClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+    async def async_sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def limiter_for(clock: SimulatedClock) -> RateLimiter:
+    return RateLimiter(
+        reporter=Reporter(),
+        clock=clock,
+        sleep=clock.sleep,
+        async_sleep=clock.async_sleep,
+    )
+
+
+def report(
+    label: str,
+    limiter: RateLimiter,
+    model: str,
+    admitted_at: List[float],
+    waits: List[float],
+    tokens: int,
+) -> None:
+    minutes = limiter.clock() / 60
+    limits = limiter.MODEL_LIMITS[model]
+    rate = len(admitted_at) / minutes
+    busiest = max(
+        bisect.bisect_left(admitted_at, at + 60) - index
+        for index, at in enumerate(admitted_at)
+    )
+    print(
+        f"{label:>6}: {len(waits)} calls in {minutes:.1f} simulated min, "
+        f"{rate:.1f} req/min (limit {limits['requests_per_minute']}), "
+        f"{rate * tokens:.0f} tok/min (limit {limits['tokens_per_minute']}), "
+        f"busiest 60 s window {busiest} calls, "
+        f"wait mean {statistics.mean(waits):.2f}s max {max(waits):.2f}s"
+    )
+
+
+def run_blocking(model: str, tokens: int, minutes: float) -> None:
+    clock = SimulatedClock()
+    limiter = limiter_for(clock)
+    admitted_at: List[float] = []
+    waits: List[float] = []
+
+    while clock() < minutes * 60:
+        started = clock()
+        assert limiter.acquire(model, tokens)
+        admitted_at.append(clock())
+        waits.append(clock() - started)
+
+    report("sync", limiter, model, admitted_at, waits, tokens)
+
+
+def run_async(model: str, tokens: int, minutes: float) -> None:
+    clock = SimulatedClock()
+    limiter = limiter_for(clock)
+    admitted_at: List[float] = []
+    waits: List[float] = []
+
+    async def main() -> None:
+        while clock() < minutes * 60:
+            started = clock()
+            assert await limiter.aacquire(model, tokens)
+            admitted_at.append(clock())
+            waits.append(clock() - started)
+
+    asyncio.run(main())
+    report("async", limiter, model, admitted_at, waits, tokens)
+
+
+def run_timeout(model: str, tokens: int) -> None:
+    clock = SimulatedClock()
+    limiter = limiter_for(clock)
+    admitted = 0
+    while limiter.acquire(model, tokens, timeout=0):
+        admitted += 1
+    print(
+        f"timeout: {admitted} calls admitted from an empty window before one "
+        f"would wait {limiter.wait_time(model, tokens):.2f}s"
+    )
+
+
+def main() -> None:
+    model = sys.argv[1] if len(sys.argv) > 1 else "llama-3.2-3b-preview"
+    tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    minutes = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    started = time.perf_counter()
+    run_blocking(model, tokens, minutes)
+    run_async(model, tokens, minutes)
+    run_timeout(model, tokens)
+    print(f"took {time.perf_counter() - started:.2f}s of real time")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,50 @@
-from typing import Any, List, Optional
-from fastapi import FastAPI
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-import requests
-from src.service.util import CameraStore, process_env
+from src.service.store import RedisCameraStore, create_camera_store
+from src.service.util import Frame, process_env
 
 from service import ServiceManager
 from src.dev.camera import Camera
-from src.service.types.misc import GoalSubmission, LogEntry
+from src.dev.cameras import CameraManager, parse_camera_sources
+from src.dev.preprocess import FramePreprocessor
+from src.dev.scene import SceneChangeDetector
+from src.dev.llm import get_runtime
+from src.dev.llmcache import RedisResponseBacking, ResponseCache
+from src.dev.quota import RedisQuota
+from src.dev.visioncache import RedisVisionBacking, VisionCache
+from src.service.types.misc import (
+    CacheStats,
+    GoalSubmission,
+    LogEntry,
+    ModelRouteStats,
+    ResponseCacheStats,
+    UsageReport,
+)
 from src.service.types.request import ExecutionRequest, LogsRequest
 from src.service.types.response import (
     CameraResponse,
+    CamerasResponse,
     ExecutionResponse,
     GoalResponse,
     LogsResponse,
 )
-from src.service.types.status import DeviceStatus, ServiceStatus
+from src.service.types.status import (
+    DeviceStatus,
+    IngestStatus,
+    ServiceStatus,
+    StageOccupancy,
+)
 
 from src.dev.actor import Actor
 from src.dev.brain import BaseBrain
+from src.dev.command import parse_command
 
 from src.dev.gen import CommandGenerator
+from src.dev.hedge import HedgeStats
 from src.dev.goal import Goals
 from src.service.response import Response, ServerError, ServerResponse
 
@@ -33,7 +57,23 @@ camera_src = f"http://{process_env("CAMERA_SOURCE", "10.0.0.74")}:4747/video"
 app = FastAPI()
 
 log = Reporter()
-brain = BaseBrain()
+storage = create_camera_store()
+
+llm_cache = ResponseCache(
+    backing=(
+        RedisResponseBacking(storage.client)
+        if isinstance(storage, RedisCameraStore)
+        else None
+    ),
+    reporter=log,
+)
+
+limiter = get_runtime().limiter
+if isinstance(storage, RedisCameraStore):
+    # Every server and robot on this Redis shares the account's limits.
+    limiter.quota = RedisQuota(storage.client, lease_fraction=0.1, flush_interval=1.0)
+
+brain = BaseBrain(cache=llm_cache)
 
 actor = Actor(reporter=log)
 
@@ -49,9 +89,43 @@ app.add_middleware(
     allow_credentials=True,
 )
 
-storage = CameraStore()
-camera = Camera(reporter=log, stream_url=camera_src, store=storage)
-service_manager = ServiceManager(reporter=log, goals=goals, camera=camera)
+camera_manager = CameraManager(
+    reporter=log,
+    store=storage,
+    max_cameras=int(process_env("MAX_CAMERAS", "4") or 4),
+)
+for camera_name, camera_url in parse_camera_sources(
+    process_env("CAMERAS", f"front={camera_src}") or f"front={camera_src}"
+).items():
+    camera_manager.add(
+        camera_name,
+        camera_url,
+        preprocessor=FramePreprocessor(reporter=log),
+        scene_detector=SceneChangeDetector(),
+    )
+
+if camera_manager.primary is None:
+    raise RuntimeError("No cameras configured.")
+camera = camera_manager.primary
+vision_cache = VisionCache(
+    ttl=600.0,
+    backing=(
+        RedisVisionBacking(storage.client, ttl=600.0)
+        if isinstance(storage, RedisCameraStore)
+        else None
+    ),
+    reporter=log,
+)
+service_manager = ServiceManager(
+    reporter=log,
+    goals=goals,
+    camera=camera,
+    vision_cache=vision_cache,
+    cameras=camera_manager,
+    llm_cache=llm_cache,
+    fused_commands=(process_env("FUSED_COMMANDS", "false") or "").lower()
+    in ("1", "true"),
+)
 
 
 @app.get("/dev/vex/status")
@@ -136,31 +210,37 @@ def dev_vex_execute(
 ) -> Response[ExecutionResponse] | Response[None]:
     global service_commands_ran
 
+    parsed = parse_command(command.command)
+    if parsed is None:
+        return ServerError(
+            "parsing command", {"error": f"Invalid command: {command.command}"}
+        )
+    canonical = parsed.serialize()
+
     try:
         device = DeviceManager()
 
-        device.send_command(command.command)
+        device.send_command(parsed)
         response = device.current_response
 
         if response and isinstance(response, str):
             return ServerResponse(
-                ExecutionResponse(command=command.command, response=response)
+                ExecutionResponse(command=canonical, response=response)
             )
 
-        service_manager.commands_ran.append(command.command)
-        log.log_custom("EXECUTE", command.command)
+        service_manager.commands_ran.append(canonical)
+        log.log_custom("EXECUTE", canonical)
 
         return ServerResponse(
-            ExecutionResponse(command=command.command, response="No response")
+            ExecutionResponse(command=canonical, response="No response")
         )
     except:
         return ServerError("initializing device", {"error": "vex not connected"})
 
 
-@app.get("/dev/camera")
-def dev_camera() -> Response[Any]:
+def _camera_frame(camera: Camera) -> Response[Any]:
     try:
-        latest_frame = storage.get_frame(camera_src)
+        latest_frame = camera.get_video_stream()
 
         if latest_frame is None:
             return ServerError(
@@ -168,12 +248,9 @@ def dev_camera() -> Response[Any]:
                 details={"error": "No frame available from the camera stream."},
             )
 
-        r = requests.get(camera_src, stream=True, timeout=1)
-        status = DeviceStatus(isOnline=r.status_code >= 200 and r.status_code < 300)
-
         data = CameraResponse(
             src=latest_frame,
-            status=status,
+            status=DeviceStatus(isOnline=camera.is_online()),
         )
         return ServerResponse(data)
 
@@ -185,15 +262,99 @@ def dev_camera() -> Response[Any]:
         )
 
 
+def _mjpeg_part(frame: Frame, variant: Optional[str]) -> bytes:
+    data = frame.variant_bytes(variant)
+    return (
+        b"--frame\r\nContent-Type: image/jpeg\r\n"
+        + f"Content-Length: {len(data)}\r\n\r\n".encode()
+        + data
+        + b"\r\n"
+    )
+
+
+async def _camera_stream(camera: Camera, variant: Optional[str]) -> StreamingResponse:
+    subscription = camera.broadcaster.subscribe()
+    latest = await run_in_threadpool(camera.latest_frame)
+
+    async def frames() -> AsyncIterator[bytes]:
+        try:
+            if latest is not None:
+                subscription.last_seq = latest.seq
+                yield _mjpeg_part(latest, variant)
+
+            while True:
+                yield _mjpeg_part(await subscription.next(), variant)
+        finally:
+            camera.broadcaster.unsubscribe(subscription)
+            log.log_info(
+                f"Camera stream viewer left after {subscription.sent} frames ({subscription.dropped} dropped)."
+            )
+
+    return StreamingResponse(
+        frames(), media_type="multipart/x-mixed-replace; boundary=frame"
+    )
+
+
+def _named_camera(name: str) -> Camera:
+    named = camera_manager.get(name)
+    if named is None:
+        raise HTTPException(status_code=404, detail=f"No camera named '{name}'.")
+    return named
+
+
+@app.get("/dev/camera")
+def dev_camera() -> Response[Any]:
+    return _camera_frame(camera)
+
+
+@app.get("/dev/camera/stream")
+async def dev_camera_stream(variant: Optional[str] = None) -> StreamingResponse:
+    return await _camera_stream(camera, variant)
+
+
 @app.get("/dev/camera/status")
 def dev_camera_status() -> Response[Any]:
-    try:
-        r = requests.get(camera_src, timeout=1, stream=True)
+    return ServerResponse(DeviceStatus(isOnline=camera.is_online()))
+
+
+@app.get("/dev/camera/stats")
+def dev_camera_stats() -> Response[IngestStatus]:
+    return ServerResponse(camera.stats.snapshot())
+
+
+@app.get("/dev/cameras")
+def dev_cameras() -> Response[CamerasResponse]:
+    return ServerResponse(
+        CamerasResponse(
+            cameras={
+                name: _named_camera(name).stats.snapshot()
+                for name in camera_manager.names
+            },
+            primary=camera.source,
+        )
+    )
+
+
+@app.get("/dev/cameras/{name}")
+def dev_cameras_frame(name: str) -> Response[Any]:
+    return _camera_frame(_named_camera(name))
+
+
+@app.get("/dev/cameras/{name}/stream")
+async def dev_cameras_stream(
+    name: str, variant: Optional[str] = None
+) -> StreamingResponse:
+    return await _camera_stream(_named_camera(name), variant)
 
-        data = DeviceStatus(isOnline=r.status_code >= 200 and r.status_code < 300)
-        return ServerResponse(data, deprecated=True)
-    except:
-        return ServerResponse(DeviceStatus(isOnline=False), deprecated=True)
+
+@app.get("/dev/cameras/{name}/status")
+def dev_cameras_status(name: str) -> Response[DeviceStatus]:
+    return ServerResponse(DeviceStatus(isOnline=_named_camera(name).is_online()))
+
+
+@app.get("/dev/cameras/{name}/stats")
+def dev_cameras_stats(name: str) -> Response[IngestStatus]:
+    return ServerResponse(_named_camera(name).stats.snapshot())
 
 
 @app.get("/service/goal")
@@ -207,6 +368,8 @@ def service_get_goal() -> Response[GoalResponse]:
                 current_goal=all_goals[0],
                 next_goal=all_goals[1] if len(all_goals) > 1 else None,
                 goals_size=len(all_goals),
+                pending_goals=goals.list_pending_goals(),
+                decided_goals=goals.list_decided_goals(),
             )
         )
 
@@ -216,6 +379,8 @@ def service_get_goal() -> Response[GoalResponse]:
             current_goal=None,
             next_goal=None,
             goals_size=0,
+            pending_goals=goals.list_pending_goals(),
+            decided_goals=goals.list_decided_goals(),
         )
     )
 
@@ -238,8 +403,7 @@ def service_create_goal(goal: GoalSubmission) -> Response[str]:
 @app.delete("/service/goal")
 def service_clear_goals() -> Response[str]:
     global service_current_goal
-    with goals.goal_queue.mutex:
-        goals.goal_queue.queue.clear()
+    goals.clear()
 
     goals.reporter.log_custom("GOAL", message="All goals cleared")
 
@@ -264,6 +428,37 @@ def service_get_executed_command() -> Response[List[str]]:
     return ServerResponse(service_manager.commands_ran)
 
 
+@app.get("/service/cache")
+def service_get_cache_stats() -> Response[CacheStats]:
+    return ServerResponse(vision_cache.stats)
+
+
+@app.get("/service/cache/llm")
+def service_get_llm_cache_stats() -> Response[ResponseCacheStats]:
+    return ServerResponse(llm_cache.report())
+
+
+@app.get("/service/models")
+def service_get_model_stats() -> Response[Dict[str, ModelRouteStats]]:
+    return ServerResponse(brain.router.snapshot())
+
+
+@app.get("/service/usage")
+def service_get_usage() -> Response[UsageReport]:
+    return ServerResponse(limiter.report())
+
+
+@app.get("/service/hedging")
+def service_get_hedge_stats() -> Response[Dict[str, HedgeStats]]:
+    service_brain = service_manager.brain
+    return ServerResponse(service_brain.hedger.snapshot() if service_brain else {})
+
+
+@app.get("/service/pipeline")
+def service_get_pipeline() -> Response[Dict[str, StageOccupancy]]:
+    return ServerResponse(service_manager.pipeline_report())
+
+
 @app.get("/service/status")
 def service_get_status() -> Response[ServiceStatus]:
     global service_commands_ran, service_running, service_current_goal
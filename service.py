@@ -1,34 +1,97 @@
-import time
-from typing import List, Optional
-from threading import Event, Thread
+from typing import Dict, List, Optional
+from threading import Event, Lock, Thread
 
 from pydantic import BaseModel
 
 from src.dev.actor import Actor
 from src.dev.brain import BaseBrain
 from src.dev.camera import Camera
+from src.dev.cameras import CameraManager
+from src.dev.command import STOP
 from src.dev.device import DeviceManager
 from src.dev.gen import CommandGenerator
 from src.dev.goal import Goals
+from src.dev.hedge import DEFAULT_HEDGING, HedgePolicy
+from src.dev.llmcache import ResponseCache
+from src.dev.pipeline import IDLE, Idle, Pipeline, Stage
 from src.dev.reporting import Reporter
+from src.dev.visioncache import VisionCache
 
 from src.service.types.misc import LogEntry
-from src.service.types.status import ServiceStatus as State
+from src.service.types.status import ServiceStatus as State, StageOccupancy
+from src.service.util import Frame
 
 from groq.types.chat import ChatCompletion
 
+# Seconds `stop_service` waits for the service thread, stages included.
+STOP_TIMEOUT = 5.0
+
 
 class ServiceConfig(BaseModel):
     actor_name: str
     max_commands: Optional[int] = 100
 
 
+class Percept(BaseModel):
+    goal: Optional[Dict[str, str]] = None
+    objective: str
+    # Commands sent before the scene was captured; None if no scene was used.
+    moves: Optional[int] = None
+    scene_seq: Optional[int] = None
+
+
+class Plan(BaseModel):
+    goal: Optional[Dict[str, str]] = None
+    command: str
+    moves: Optional[int] = None
+    scene_seq: Optional[int] = None
+
+
 class ServiceManager:
-    def __init__(self, reporter: Reporter, goals: Goals, camera: Camera):
+    def __init__(
+        self,
+        reporter: Reporter,
+        goals: Goals,
+        camera: Camera,
+        frame_timeout: float = 5.0,
+        max_frame_age: float = 2.0,
+        compare_frames: bool = False,
+        vision_latency_budget: float | None = 0.25,
+        reuse_unchanged_scene: bool = True,
+        vision_cache: VisionCache | None = None,
+        cameras: CameraManager | None = None,
+        llm_cache: ResponseCache | None = None,
+        hedging: dict[str, HedgePolicy] | None = None,
+        stage_capacity: int = 1,
+        fused_commands: bool = False,
+    ):
         self.log = reporter
         self.camera = camera
+        self.cameras = cameras
         self.goals = goals
 
+        self.frame_timeout = frame_timeout
+        self.max_frame_age = max_frame_age
+        self.compare_frames = compare_frames
+        self.vision_latency_budget = vision_latency_budget
+        self.reuse_unchanged_scene = reuse_unchanged_scene
+        self.vision_cache = vision_cache
+        self.llm_cache = llm_cache
+        self.hedging = DEFAULT_HEDGING if hedging is None else hedging
+        self.brain: Optional[BaseBrain] = None
+        self.scene_description: Optional[
+            tuple[tuple[tuple[str, int], ...], ChatCompletion]
+        ] = None
+        self.last_command_seq = 0
+        # Commands sent so far, to tell when a decided step has gone stale.
+        self.moves = 0
+        self.settled_moves = 0
+        self._moves_lock = Lock()
+        self.stage_capacity = stage_capacity
+        # Think and pick the command in one completion instead of two or three.
+        self.fused_commands = fused_commands
+        self.pipeline: Optional[Pipeline] = None
+
         self.state = State(
             running=False,
             goal=None,
@@ -78,7 +141,7 @@ class ServiceManager:
         self.stop_event.set()
 
         if self.service_thread:
-            self.service_thread.join(timeout=5)  # Graceful stop
+            self.service_thread.join(timeout=STOP_TIMEOUT)  # Graceful stop
 
         self.state.running = False
         self.state.goal = None
@@ -86,115 +149,287 @@ class ServiceManager:
         return True
 
     def run_service(self) -> None:
+        """
+        Runs the agent loop as a pipeline of perception, reasoning and
+        actuation stages on their own threads, so the next step is seen
+        and decided while the current command is still executing.
+        """
+        # The stages get their own event, never cleared, so a stage still
+        # in a call when the join below gives up exits once it returns
+        # instead of running on beside the next start's pipeline.
+        stop = Event()
         try:
             self.log.log_custom("INTERNAL", "Internal service started")
 
-            brain = BaseBrain()
+            brain = self.brain = BaseBrain(cache=self.llm_cache, hedging=self.hedging)
             device = DeviceManager()
-            actor = Actor(reporter=self.log)
-            camera = self.camera
+            actor = Actor(reporter=self.log, cache=self.vision_cache)
             gen = CommandGenerator(brain, reporter=self.log)
 
-            while self.state.running:
-                if self.stop_event.is_set():
-                    self.log.log_custom("INTERNAL", "Internal service stopped")
-                    break
-
-                if not self.goals.goal_queue.empty():
-                    goal = self.goals.get_next_goal()
-                    if goal:
-                        self.state.goal = goal["goal_request"]
-                        self.log.log_custom(
-                            "SERVICE", f"Processing goal: {goal['goal_request']}"
-                        )
-
-                        scene = camera.snap_photo()
-                        process_env = actor.process_environment(scene)
-
-                        if not process_env:
-                            self.log.log_custom(
-                                "SERVICE",
-                                f"Could not process environment for goal: '{goal['goal_request']}'",
-                            )
-                            continue
-
-                        objectives = [process_env.choices[0].message.content]
-
-                        if not objectives:
-                            self.log.log_custom(
-                                "SERVICE",
-                                f"No objectives found for goal: '{goal['goal_request']}'",
-                            )
-                            continue
-
-                    else:
-                        self.log.log_custom(
-                            "SERVICE", "No goals found, exploring by default."
-                        )
-                        objectives = ["move around and explore your enviornment"]
-
-                    if isinstance(objectives, str):
-                        objectives = [objectives]
-
-                    for objective in objectives:
-                        if self.stop_event.is_set():
-                            self.log.log_custom(
-                                "INTERNAL", "Stop event detected during goal execution"
-                            )
-                            break
-
-                        thought_process = brain.think(
-                            "internal_thoughts",
-                            [
-                                {
-                                    "role": "system",
-                                    "content": "You are an AI robot that must think about their objective. Respond concisely, you will be given a description of your environment, and your goal is to think through what actions you should take based off of the environment at all costs.",
-                                },
-                                {
-                                    "role": "user",
-                                    "content": f"Environment: {objective}",
-                                },
-                            ],
-                        )
-
-                        if isinstance(thought_process, ChatCompletion):
-                            thought_process = thought_process.choices[0].message.content
-
-                        command = "vex motor all stop"  # default to stopping
-
-                        if thought_process:
-                            command = gen.generate_command(
-                                thought_process=thought_process
-                            )
-                            if "error" in command.lower():
-                                self.log.log_error(
-                                    f"Failed to generate command for objective: {self.state.goal}"
-                                )
-                                continue
-
-                        device.add_command(command)
-                        self.commands_ran.append(command)
-
-                        self.log.log_custom("COMMAND", f"{command}")
-
-                        response = device.current_response
-                        if response:
-                            self.log.log_custom("COMMAND", f"Completed: {response}")
-                        else:
-                            self.log.log_custom(
-                                "COMMAND", f"Command executed but no response recieved"
-                            )
-
-                    time.sleep(1)
-                self.state.goal = None
+            self.pipeline = Pipeline(
+                [
+                    Stage(
+                        "perception",
+                        lambda _: self.perceive(actor),
+                        capacity=None,
+                        on_error=self.stage_error,
+                    ),
+                    Stage(
+                        "reasoning",
+                        lambda percept: self.reason(brain, gen, percept),
+                        capacity=self.stage_capacity,
+                        stale=self.is_stale,
+                        on_drop=self.drop_step,
+                        on_error=self.stage_error,
+                    ),
+                    Stage(
+                        "actuation",
+                        lambda plan: self.act(device, plan),
+                        capacity=self.stage_capacity,
+                        ready=lambda stop: self.settle(device, stop),
+                        stale=self.is_stale,
+                        on_drop=self.drop_step,
+                        on_error=self.stage_error,
+                    ),
+                ]
+            )
+            self.pipeline.start(stop)
+
+            while self.state.running and not self.stop_event.is_set():
+                self.stop_event.wait(0.5)
+            stop.set()
+            # Within stop_service's wait, less the loop's last poll.
+            self.pipeline.join(timeout=STOP_TIMEOUT - 1.0)
         except Exception as e:
             print(e)
             self.log.log_error("There was an error in the service")
         finally:
+            stop.set()
             self.state.running = False
+            self.state.goal = None
             self.stop_event.clear()
             self.log.log_custom("INTERNAL", "Internal service stopped")
 
+    def stage_error(self, error: Exception) -> None:
+        print(error)
+        self.log.log_error(f"There was an error in the service: {error}")
+
+    def is_stale(self, step: Percept | Plan) -> bool:
+        """
+        A step decided from a scene is stale once a command has been sent
+        since the scene was captured, unless scene-change detection says
+        the camera still sees the same scene, in which case it is kept.
+        """
+        with self._moves_lock:
+            moves, after_seq = self.moves, self.last_command_seq
+        if step.moves is None or step.moves == moves:
+            return False
+        if step.scene_seq is None:
+            return True
+
+        frame = self.camera.wait_for_frame(
+            after_seq=after_seq,
+            timeout=self.frame_timeout,
+            max_age=self.max_frame_age,
+        )
+        if frame is None or frame.scene_seq != step.scene_seq:
+            return True
+
+        self.log.log_custom(
+            "SERVICE",
+            f"Scene unchanged since frame {step.scene_seq}, keeping this step.",
+        )
+        return False
+
+    def drop_step(self, step: Percept | Plan) -> None:
+        self.log.log_custom(
+            "SERVICE", "Robot moved since this step's scene was captured, dropping it."
+        )
+        if step.goal:
+            self.goals.retry_goal(step.goal)
+
+    def perceive(self, actor: Actor) -> Percept | Idle | None:
+        if not self.goals.has_goals():
+            self.state.goal = None
+            self.stop_event.wait(0.1)
+            return IDLE
+
+        goal = self.goals.get_next_goal()
+        if not goal:
+            self.log.log_custom("SERVICE", "No goals found, exploring by default.")
+            return Percept(objective="move around and explore your enviornment")
+
+        self.state.goal = goal["request"]
+        self.log.log_custom("SERVICE", f"Processing goal: {goal['request']}")
+
+        with self._moves_lock:
+            moves, after_seq = self.moves, self.last_command_seq
+
+        # Only reason about a scene captured after the last command.
+        frame = self.camera.wait_for_frame(
+            after_seq=after_seq,
+            timeout=self.frame_timeout,
+            max_age=self.max_frame_age,
+        )
+
+        if frame is None:
+            self.log.log_custom(
+                "SERVICE",
+                f"No fresh camera frame for goal: '{goal['request']}'",
+            )
+            return None
+
+        process_env = self.describe_scene(actor, frame)
+
+        if not process_env:
+            self.log.log_custom(
+                "SERVICE",
+                f"Could not process environment for goal: '{goal['request']}'",
+            )
+            return None
+
+        objective = process_env.choices[0].message.content
+
+        if not objective:
+            self.log.log_custom(
+                "SERVICE",
+                f"No objectives found for goal: '{goal['request']}'",
+            )
+            return None
+
+        return Percept(
+            goal=goal, objective=objective, moves=moves, scene_seq=frame.scene_seq
+        )
+
+    def reason(
+        self, brain: BaseBrain, gen: CommandGenerator, percept: Percept
+    ) -> Plan | None:
+        if self.fused_commands:
+            fused = gen.think_and_command(percept.objective)
+            if fused is None:
+                self.log.log_error(
+                    f"Failed to generate command for objective: {self.state.goal}"
+                )
+                return None
+            return Plan(
+                goal=percept.goal,
+                command=fused.command,
+                moves=percept.moves,
+                scene_seq=percept.scene_seq,
+            )
+
+        thought_process = brain.think(
+            "internal_thoughts",
+            [
+                {
+                    "role": "system",
+                    "content": "You are an AI robot that must think about their objective. Respond concisely, you will be given a description of your environment, and your goal is to think through what actions you should take based off of the environment at all costs.",
+                },
+                {
+                    "role": "user",
+                    "content": f"Environment: {percept.objective}",
+                },
+            ],
+        )
+
+        if isinstance(thought_process, ChatCompletion):
+            thought_process = thought_process.choices[0].message.content
+
+        command = STOP.serialize()  # default to stopping
+
+        if thought_process:
+            command = gen.generate_command(thought_process=thought_process)
+            if "error" in command.lower():
+                self.log.log_error(
+                    f"Failed to generate command for objective: {self.state.goal}"
+                )
+                return None
+
+        return Plan(
+            goal=percept.goal,
+            command=command,
+            moves=percept.moves,
+            scene_seq=percept.scene_seq,
+        )
+
+    def settle(self, device: DeviceManager, stop: Event) -> bool:
+        """
+        Waits for the last command to finish, so the next plan is judged
+        against a scene captured after the robot stopped moving.
+        """
+        # The next step was perceived and decided while this one ran.
+        while not device.wait_idle(timeout=0.5):
+            if stop.is_set():
+                return False
+
+        if device.current_response:
+            self.log.log_custom("COMMAND", f"Completed: {device.current_response}")
+        with self._moves_lock:
+            if self.settled_moves != self.moves:
+                self.settled_moves = self.moves
+                self.last_command_seq = self.camera.current_seq()
+        return True
+
+    def act(self, device: DeviceManager, plan: Plan) -> None:
+        device.add_command(plan.command)
+        self.commands_ran.append(plan.command)
+        with self._moves_lock:
+            self.moves += 1
+            self.last_command_seq = self.camera.current_seq()
+        self.state.commands_executed += 1
+
+        self.log.log_custom("COMMAND", f"{plan.command}")
+
+    def pipeline_report(self) -> dict[str, StageOccupancy]:
+        return self.pipeline.occupancy() if self.pipeline else {}
+
+    def scene_frames(self, frame: Frame) -> dict[str, Frame]:
+        """
+        `frame` from the primary camera plus fresh frames from any other
+        cameras, which are described together in one vision call.
+        """
+        frames = {self.camera.source: frame}
+        if self.cameras and not self.compare_frames:
+            for name, other in self.cameras.latest_frames(self.max_frame_age).items():
+                frames.setdefault(name, other)
+        return frames
+
+    def describe_scene(self, actor: Actor, frame: Frame) -> ChatCompletion | None:
+        """
+        Runs the vision call for `frame`, reusing the previous description
+        when scene-change detection says no camera's scene has changed since.
+        """
+        frames = self.scene_frames(frame)
+        scene = tuple(sorted((name, view.scene_seq) for name, view in frames.items()))
+
+        cached = self.scene_description
+        if self.reuse_unchanged_scene and cached and cached[0] == scene:
+            self.log.log_custom(
+                "SERVICE",
+                f"Scene unchanged since frame {frame.scene_seq}, reusing its description.",
+            )
+            return cached[1]
+
+        if len(frames) > 1:
+            description = actor.process_frames(
+                frames, latency_budget=self.vision_latency_budget
+            )
+        else:
+            before = (
+                self.camera.frame_by_seq(self.last_command_seq)
+                if self.compare_frames
+                else None
+            )
+            description = actor.process_frame(
+                frame,
+                previous=before,
+                latency_budget=self.vision_latency_budget,
+            )
+
+        if description:
+            self.scene_description = (scene, description)
+        return description
+
     def get_status(self) -> State:
         """
         Returns the current status of the service.
@@ -12,7 +12,6 @@ import {
 import axios from "axios";
 import type {
   Command,
-  APICameraResponse,
   APIDeviceStatus,
   APIExecutionResponse,
   APILogsResponse,
@@ -107,11 +106,19 @@ export const WorkflowManagerProvider: React.FC<
   const checkCameraStatus = useCallback(async () => {
     try {
       const response =
-        await axiosInstance.get<APIResponse<APICameraResponse>>("/dev/camera");
+        await axiosInstance.get<APIResponse<APIDeviceStatus>>(
+          "/dev/camera/status"
+        );
 
       const data = response.data.response.data;
-      setCameraSrc(data?.src ?? "/placeholder.jpg");
-      setIsCameraOnline(data?.status.isOnline ?? false);
+      const isOnline = data?.isOnline ?? false;
+
+      // The stream endpoint pushes frames itself; only the URL needs setting.
+      const streamSrc = `${axiosInstance.defaults.baseURL}/dev/camera/stream`;
+      setCameraSrc((current) =>
+        isOnline ? streamSrc : current === streamSrc ? "/placeholder.jpg" : current
+      );
+      setIsCameraOnline(isOnline);
     } catch {
       setIsCameraOnline(false);
       addLog(`CLIENT: Could not get camera status`);
@@ -177,13 +184,18 @@ export const WorkflowManagerProvider: React.FC<
     }, 1000);
 
     const statusInterval = setInterval(() => {
-      void checkCameraStatus();
       void checkVexStatus();
     }, 10);
 
+    void checkCameraStatus();
+    const cameraInterval = setInterval(() => {
+      void checkCameraStatus();
+    }, 1000);
+
     return () => {
       clearInterval(logInterval);
       clearInterval(statusInterval);
+      clearInterval(cameraInterval);
     };
   }, [fetchWorkflowState, checkCameraStatus, checkVexStatus]);
 
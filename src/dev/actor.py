@@ -1,45 +1,303 @@
-from typing import Any
+import time
+from typing import Any, Callable, Dict, List
 
 from groq.types.chat import ChatCompletion
 
 from groq import Groq
+from .llm import get_runtime
+from .llmcache import request_key
+from .ratelimiter import RateLimitExceeded, completion_usage
 from .reporting import Reporter
+from .scene import decode_gray, dhash
+from .visioncache import VisionCache
+from src.service.util import Frame
+
+# Builds the request for the model that was admitted, whose variants may
+# differ from those of the model asked for.
+PromptBuilder = Callable[[str], Any]
+
+
+# Frame variants each vision model may be sent, highest fidelity first.
+# `None` is the raw camera frame.
+VISION_VARIANTS: Dict[str, List[str | None]] = {
+    "llama-3.2-90b-vision-preview": [None, "reduced", "small", "gray"],
+    "llama-3.2-11b-vision-preview": ["small", "gray"],
+}
 
 
 class Actor:
-    def __init__(self, api_key: str | None = None, reporter: Reporter | None = None):
+    def __init__(
+        self,
+        api_key: str | None = None,
+        reporter: Reporter | None = None,
+        upload_bytes_per_second: float = 1_000_000,
+        cache: VisionCache | None = None,
+        model: str | None = None,
+        tier: str = "high",
+        model_budget: float | None = None,
+    ):
         self.client = Groq(api_key=api_key)
-        self.model = "llama-3.2-90b-vision-preview"
+        # A fixed model skips routing; otherwise the router picks a vision
+        # model of `tier` expected to answer within `model_budget` seconds.
+        self.model = model
+        self.tier = tier
+        self.model_budget = model_budget
         self.reporter = reporter
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.cache = cache
+        # Shared with every brain, so identical requests coalesce and model
+        # latencies are learned process-wide.
+        runtime = get_runtime()
+        self.flights = runtime.flights
+        self.router = runtime.router
+        self.limiter = runtime.limiter
+        self.estimator = runtime.estimator
+
+    def choose_model(self) -> str:
+        return self.model or self.router.choose(
+            self.tier, self.model_budget, vision=True
+        )
+
+    def estimate_upload_seconds(self, size: int) -> float:
+        # Images are sent base64 encoded inside the JSON body.
+        return size * 4 / 3 / self.upload_bytes_per_second
+
+    def select_variant(
+        self,
+        frame: Frame,
+        model: str | None = None,
+        latency_budget: float | None = None,
+    ) -> str | None:
+        """
+        Picks the highest fidelity variant of `frame` the model accepts whose
+        estimated upload time fits `latency_budget`, or the smallest one if
+        none does.
+        """
+        candidates = [
+            variant
+            for variant in VISION_VARIANTS.get(model or self.choose_model(), [None])
+            if variant is None or variant in frame.variants
+        ] or [None]
+
+        if latency_budget is None:
+            return candidates[0]
+
+        for variant in candidates:
+            size = len(frame.variant_bytes(variant))
+            if self.estimate_upload_seconds(size) <= latency_budget:
+                return variant
+
+        return min(candidates, key=lambda variant: len(frame.variant_bytes(variant)))
+
+    def frame_hash(self, frame: Frame) -> int | None:
+        if frame.phash is not None:
+            return frame.phash
+
+        gray = decode_gray(frame.data)
+        if gray is None:
+            return None
+        frame.phash = dhash(gray)
+        return frame.phash
+
+    def process_frame(
+        self,
+        frame: Frame,
+        previous: Frame | None = None,
+        latency_budget: float | None = None,
+    ) -> ChatCompletion | None:
+        # Before/after comparisons depend on both frames, so only single
+        # frame descriptions are cached.
+        phash = self.frame_hash(frame) if self.cache and previous is None else None
+        if self.cache and phash is not None:
+            cached = self.cache.get(phash)
+            if cached is not None:
+                if self.reporter:
+                    self.reporter.log_custom(
+                        level="ACTOR",
+                        message=f"Reusing cached environment for frame {frame.seq} (hash {phash:016x})",
+                    )
+                return cached
+
+        result = self._describe_frame(frame, previous, latency_budget)
+
+        if self.cache and phash is not None and result is not None:
+            self.cache.put(phash, result)
+        return result
+
+    def _describe_frame(
+        self,
+        frame: Frame,
+        previous: Frame | None,
+        latency_budget: float | None,
+    ) -> ChatCompletion | None:
+        def build(model: str) -> Any:
+            variant = self.select_variant(frame, model, latency_budget=latency_budget)
+            if self.reporter:
+                self.reporter.log_custom(
+                    level="ACTOR",
+                    message=f"Using '{variant or 'raw'}' variant of frame {frame.seq} ({len(frame.variant_bytes(variant))} bytes) with {model}",
+                )
+            return self.environment_prompt(
+                [frame.data_url_for(variant)],
+                previous_image_url=(
+                    previous.data_url_for(variant) if previous else None
+                ),
+            )
+
+        return self._run_environment(self.choose_model(), build)
+
+    def fit_frames(self, frames: Dict[str, Frame], model: str) -> Dict[str, Frame]:
+        """
+        Leaves out the last cameras' frames until one request for the rest
+        fits the model's per-minute token limit, which a larger request
+        could never be admitted under.
+        """
+        limits = self.limiter.MODEL_LIMITS.get(model)
+        if not limits:
+            return frames
+
+        names = list(frames)
+        while len(names) > 1 and (
+            self.estimator.estimate_request(
+                self.environment_prompt([""] * len(names), labels=names), 512
+            )
+            > limits["tokens_per_minute"]
+        ):
+            names.pop()
 
-    def process_environment(self, image_url: str) -> ChatCompletion | None:
-        prompt: Any = [
+        if len(names) < len(frames) and self.reporter:
+            self.reporter.log_custom(
+                level="ACTOR",
+                message=f"Leaving out {', '.join(list(frames)[len(names):])} to fit the {model} token limit",
+            )
+        return {name: frames[name] for name in names}
+
+    def process_frames(
+        self,
+        frames: Dict[str, Frame],
+        latency_budget: float | None = None,
+    ) -> ChatCompletion | None:
+        """
+        Describes the views of several cameras in a single request. The
+        latency budget is split across the frames.
+        """
+        model = self.choose_model()
+        frames = self.fit_frames(frames, model)
+        if len(frames) == 1:
+            return self.process_frame(
+                next(iter(frames.values())), latency_budget=latency_budget
+            )
+
+        per_frame_budget = latency_budget / len(frames) if latency_budget else None
+
+        def build(model: str) -> Any:
+            image_urls = []
+            for name, frame in frames.items():
+                variant = self.select_variant(
+                    frame, model, latency_budget=per_frame_budget
+                )
+                image_urls.append(frame.data_url_for(variant))
+
+                if self.reporter:
+                    self.reporter.log_custom(
+                        level="ACTOR",
+                        message=f"Using '{variant or 'raw'}' variant of {name} frame {frame.seq} ({len(frame.variant_bytes(variant))} bytes) with {model}",
+                    )
+            return self.environment_prompt(image_urls, labels=list(frames))
+
+        return self._run_environment(model, build)
+
+    def process_environment(
+        self,
+        image_url: str | List[str],
+        previous_image_url: str | None = None,
+        labels: List[str] | None = None,
+        model: str | None = None,
+    ) -> ChatCompletion | None:
+        image_urls = [image_url] if isinstance(image_url, str) else image_url
+        prompt = self.environment_prompt(image_urls, previous_image_url, labels)
+        return self._run_environment(model or self.choose_model(), lambda _: prompt)
+
+    def environment_prompt(
+        self,
+        image_urls: List[str],
+        previous_image_url: str | None = None,
+        labels: List[str] | None = None,
+    ) -> Any:
+        content: list[Any] = [
             {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Describe the environment in one or two sentences. Then create a structured list of objects, their approximate distances (far, medium, close), and their positions (left, right, front).",
-                    },
-                    {"type": "image_url", "image_url": {"url": image_url}},
-                ],
+                "type": "text",
+                "text": "Describe the environment in one or two sentences. Then create a structured list of objects, their approximate distances (far, medium, close), and their positions (left, right, front).",
             },
         ]
 
+        if len(image_urls) > 1:
+            views = ", ".join(labels or [str(i + 1) for i in range(len(image_urls))])
+            content[0]["text"] = (
+                f"The images are simultaneous views from the robot's cameras, in this order: {views}. "
+                + content[0]["text"]
+                + " Note which camera each object is seen by."
+            )
+        elif previous_image_url:
+            content[0]["text"] = (
+                "The first image was captured before your last command and the second one after it. Briefly describe what changed between them. "
+                + content[0]["text"]
+                + " Base the list on the second image."
+            )
+            content.append(
+                {"type": "image_url", "image_url": {"url": previous_image_url}}
+            )
+
+        for url in image_urls:
+            content.append({"type": "image_url", "image_url": {"url": url}})
+        return [{"role": "user", "content": content}]
+
+    def _run_environment(
+        self, model: str, build: PromptBuilder
+    ) -> ChatCompletion | None:
+        prompt = build(model)
         if self.reporter:
             self.reporter.log_custom(
                 level="ACTOR",
-                message=f"Processing environment for image: {image_url[:50]}",
+                message=f"Processing environment for {len(prompt[0]['content']) - 1} image(s)",
             )
 
+        # Robots looking at the same scene at once share one request.
+        return self.flights.do(
+            request_key(model, prompt, 0.7, 512, 1),
+            lambda: self._request_environment(model, prompt, build),
+        )
+
+    def _request_environment(
+        self, model: str, prompt: Any, build: PromptBuilder
+    ) -> ChatCompletion | None:
+        est_tokens = self.estimator.estimate_request(prompt, 512)
+        try:
+            admitted = self.limiter.admit(model, est_tokens)
+        except (RateLimitExceeded, ValueError) as e:
+            if self.reporter:
+                self.reporter.log_custom(
+                    level="ACTOR", message=f"Skipping environment processing: {e}"
+                )
+            return None
+
+        # Images are billed per image, so the estimate holds for the fallback.
+        if admitted != model:
+            model, prompt = admitted, build(admitted)
+
+        started = time.perf_counter()
         try:
             response = self.client.chat.completions.create(
-                model=self.model,
+                model=model,
                 # response_model=EnvironmentResponse,
                 messages=prompt,
                 temperature=0.7,
                 max_tokens=512,
             )
+            self.router.record(model, time.perf_counter() - started)
+            usage = completion_usage(response)
+            if usage and model in self.limiter.MODEL_LIMITS:
+                self.limiter.record_usage(model, *usage, reserved_tokens=est_tokens)
 
             if self.reporter:
                 self.reporter.log_custom(
@@ -49,6 +307,7 @@ class Actor:
 
             return response
         except Exception as e:
+            self.router.record(model, None, ok=False)
             error_message = f"Error processing environment: {e}"
             if self.reporter:
                 self.reporter.log_custom(level="ACTOR", message=error_message)
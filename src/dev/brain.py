@@ -1,15 +1,72 @@
-import groq as base
+import asyncio
+import time
+from groq import NOT_GIVEN, AsyncGroq
 from groq.types.chat import ChatCompletion
+from pydantic import BaseModel
 
-from typing import List, Dict, Union, Any
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Generator,
+    Iterable,
+    List,
+    Dict,
+    Tuple,
+    Union,
+    Any,
+)
+
+from .hedge import HedgePolicy, Hedger
+from .llm import LLMRuntime, get_runtime
+from .llmcache import ResponseCache, request_key
+from .models import MODELS
+from .ratelimiter import RateLimitExceeded, completion_usage
+from .router import ModelRouter
+from .tokens import TokenEstimator, fit_messages
+
+
+class Thought(BaseModel):
+    """
+    Arguments of one `think` call, for running several at once.
+    """
+
+    intent: str
+    messages: List[Dict[str, Any]]
+    model: str | None = None
+    temperature: float = 1
+    max_tokens: int = 1024
+    top_p: float = 1
+    verbose_result: bool = False
+    tier: str | None = None
+    latency_budget: float | None = None
+    json_mode: bool = False
 
 
 class BaseBrain:
 
-    def __init__(self, model: str = "llama3-8b-8192", api_key: str | None = None):
+    def __init__(
+        self,
+        model: str = "llama3-8b-8192",
+        api_key: str | None = None,
+        runtime: LLMRuntime | None = None,
+        cache: ResponseCache | None = None,
+        router: ModelRouter | None = None,
+        hedging: Dict[str, HedgePolicy] | None = None,
+        estimator: TokenEstimator | None = None,
+        history_budgets: Dict[str, int] | None = None,
+    ):
         self.model = model
+        self.cache = cache
 
-        self.client = base.Groq(timeout=3)
+        # Brains share the runtime's client, connection pool and router.
+        self.runtime = runtime or get_runtime()
+        self.client: AsyncGroq = self.runtime.client(api_key)
+        self.router = router or self.runtime.router
+        # Intents listed here send a duplicate request when the first is slow.
+        self.hedger = Hedger(hedging or {}, self.router)
+        self.estimator = estimator or self.runtime.estimator
+        self.history_budgets = history_budgets or {"extended": 6000, "optimized": 2500}
 
         self.extended_chat_history: list[Any] = []
         self.optimized_chat_history: list[Any] = []
@@ -30,15 +87,34 @@ class BaseBrain:
         message: dict[str, Any] = {"role": role, "content": content}
         if history_type == "extended":
             self.extended_chat_history.append(message)
-            self.extended_chat_history = self.truncate_history(
-                self.extended_chat_history, 12
+            self.extended_chat_history = fit_messages(
+                self.truncate_history(self.extended_chat_history, 12),
+                self.history_budgets["extended"],
+                self.estimator,
             )
         elif history_type == "optimized":
             self.optimized_chat_history.append(message)
-            self.optimized_chat_history = self.truncate_history(
-                self.optimized_chat_history, 3
+            self.optimized_chat_history = fit_messages(
+                self.truncate_history(self.optimized_chat_history, 3),
+                self.history_budgets["optimized"],
+                self.estimator,
             )
 
+    def fit_prompt(
+        self, messages: List[Dict[str, Any]], model: str, max_tokens: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Trims `messages` so the prompt and the completion fit the model's
+        context window and token limit, instead of the API rejecting the
+        request.
+        """
+        info = MODELS[model]
+        budget = info.context_window
+        # A call over the per-minute token limit could never be admitted.
+        if info.limits is not None:
+            budget = min(budget, info.limits.tokens_per_minute)
+        return fit_messages(messages, budget - max_tokens, self.estimator)
+
     def add_image(self, environment: str, prompt: str) -> None:
         message_content: list[Any] = [
             {"type": "text", "text": prompt},
@@ -57,37 +133,462 @@ class BaseBrain:
         top_p: float = 1,
         stream: bool = False,
         verbose_result: bool = False,
+        tier: str | None = None,
+        latency_budget: float | None = None,
+        json_mode: bool = False,
     ) -> str | ChatCompletion | None:
+        model = self._resolve_model(
+            model,
+            tier,
+            latency_budget,
+            self.estimator.estimate_request(messages, max_tokens),
+        )
+        messages = self.fit_prompt(messages, model, max_tokens)
+        return self.runtime.flights.do(
+            self._flight_key(
+                messages,
+                model,
+                temperature,
+                max_tokens,
+                top_p,
+                stream,
+                verbose_result,
+                json_mode,
+            ),
+            lambda: self.runtime.run(
+                self._athink(
+                    intent,
+                    messages,
+                    model,
+                    temperature,
+                    max_tokens,
+                    top_p,
+                    stream,
+                    verbose_result,
+                    json_mode,
+                )
+            ),
+        )
+
+    def _resolve_model(
+        self,
+        model: str | None,
+        tier: str | None = None,
+        latency_budget: float | None = None,
+        est_tokens: int = 0,
+    ) -> str:
+        """
+        An explicit model wins; otherwise a declared tier or latency budget
+        is routed, and plain calls use the brain's default model.
+        """
+        if not model and (tier or latency_budget is not None):
+            model = self.router.choose(
+                tier or "standard", latency_budget, est_tokens=est_tokens
+            )
         if not model:
             model = self.model
 
-        if model not in [
-            "llama3-groq-70b-8192-tool-use-preview",
-            "llama3-groq-8b-8192-tool-use-preview",
-            "llama-3.2-1b-preview",
-            "llama-3.2-3b-preview",
-            "llama3-8b-8192",
-            "mixtral-8x7b-32768",
-            "llama-3.2-90b-vision-preview",
-            "llama-3.2-11b-vision-preview",
-            "llama-3.3-70b-versatile",
-        ]:
+        if model not in MODELS:
             raise ValueError(f"Invalid model: {model}")
+        return model
+
+    def _cache_key(
+        self,
+        intent: str,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        json_mode: bool = False,
+    ) -> str | None:
+        if not self.cache or not self.cache.enabled_for(intent):
+            return None
+        return self.cache.key(
+            model, messages, temperature, max_tokens, top_p, json_mode
+        )
+
+    def _flight_key(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        stream: bool,
+        verbose_result: bool,
+        json_mode: bool = False,
+    ) -> str:
+        key = request_key(model, messages, temperature, max_tokens, top_p, json_mode)
+        return f"{key}:{int(stream)}{int(verbose_result)}"
+
+    async def athink(
+        self,
+        intent: str,
+        messages: List[Dict[str, Any]],
+        model: str | None = None,
+        temperature: float = 1,
+        max_tokens: int = 1024,
+        top_p: float = 1,
+        stream: bool = False,
+        verbose_result: bool = False,
+        tier: str | None = None,
+        latency_budget: float | None = None,
+        json_mode: bool = False,
+    ) -> str | ChatCompletion | None:
+        """
+        With `stream` the completion is streamed and returned as the joined
+        text; use `athink_stream` to consume it as it arrives. With
+        `json_mode` the answer is constrained to a JSON object, which the
+        API does not support when streaming. Concurrent identical calls
+        share one request.
+        """
+        model = self._resolve_model(
+            model,
+            tier,
+            latency_budget,
+            self.estimator.estimate_request(messages, max_tokens),
+        )
+        messages = self.fit_prompt(messages, model, max_tokens)
+        return await self.runtime.flights.ado(
+            self._flight_key(
+                messages,
+                model,
+                temperature,
+                max_tokens,
+                top_p,
+                stream,
+                verbose_result,
+                json_mode,
+            ),
+            lambda: self._athink(
+                intent,
+                messages,
+                model,
+                temperature,
+                max_tokens,
+                top_p,
+                stream,
+                verbose_result,
+                json_mode,
+            ),
+        )
+
+    async def _athink(
+        self,
+        intent: str,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        stream: bool,
+        verbose_result: bool,
+        json_mode: bool = False,
+    ) -> str | ChatCompletion | None:
+        if stream:
+            deltas = [
+                delta
+                async for delta in self.athink_stream(
+                    intent, messages, model, temperature, max_tokens, top_p
+                )
+            ]
+            return "".join(deltas) if deltas else None
+
+        # Only the text is cached, so full completions always hit the API.
+        key = (
+            None
+            if verbose_result
+            else self._cache_key(
+                intent, messages, model, temperature, max_tokens, top_p, json_mode
+            )
+        )
+        if self.cache and key:
+            cached = await self.cache.aget(intent, key)
+            if cached is not None:
+                return cached
 
         try:
-            response: Any = self.client.chat.completions.create(
+            response: Any = await self.runtime.call(
+                self.hedger.run(
+                    intent,
+                    model,
+                    lambda candidate: self._create(
+                        candidate,
+                        messages,
+                        temperature,
+                        max_tokens,
+                        top_p,
+                        json_mode,
+                    ),
+                )
+            )
+
+            if not verbose_result:
+                content = response.choices[0].message.content
+                if self.cache and key and content is not None:
+                    await self.cache.aput(intent, key, content)
+                return content  # type: ignore
+            else:
+                return response  # type: ignore
+        except Exception as e:
+            print(f"Error during {intent}: {e}")
+            return None
+
+    async def _create(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        json_mode: bool = False,
+    ) -> Any:
+        est_tokens = self.estimator.estimate_request(messages, max_tokens)
+        model = await self.runtime.limiter.aadmit(model, est_tokens)
+
+        started = time.perf_counter()
+        try:
+            response = await self.client.chat.completions.create(
                 messages=messages,  # type: ignore
                 model=model,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 top_p=top_p,
-                stream=stream,
+                response_format={"type": "json_object"} if json_mode else NOT_GIVEN,
             )
+        except Exception:
+            self.router.record(model, None, ok=False)
+            raise
 
-            if not verbose_result:
-                return response.choices[0].message.content  # type: ignore
-            else:
-                return response  # type: ignore
+        self.router.record(model, time.perf_counter() - started)
+        self._record_usage(model, completion_usage(response), est_tokens)
+        return response
+
+    def _record_usage(
+        self, model: str, usage: Tuple[int, int] | None, est_tokens: int
+    ) -> None:
+        limiter = self.runtime.limiter
+        if model not in limiter.MODEL_LIMITS:
+            return
+        if usage is None:
+            # Without a reported count the reservation stands as the usage.
+            usage = (est_tokens, 0)
+        limiter.record_usage(model, *usage, reserved_tokens=est_tokens)
+
+    async def _stream_deltas(
+        self,
+        intent: str,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        use_cache: bool = True,
+    ) -> AsyncGenerator[str, None]:
+        # Runs on the runtime loop, which owns the client's connections.
+        key = (
+            self._cache_key(intent, messages, model, temperature, max_tokens, top_p)
+            if use_cache
+            else None
+        )
+        if self.cache and key:
+            cached = await self.cache.aget(intent, key)
+            if cached is not None:
+                yield cached
+                return
+
+        est_tokens = self.estimator.estimate_request(messages, max_tokens)
+        try:
+            model = await self.runtime.limiter.aadmit(model, est_tokens)
+        except RateLimitExceeded as e:
+            print(f"Error during {intent}: {e}")
+            return
+
+        started = time.perf_counter()
+        try:
+            stream: Any = await self.client.chat.completions.create(
+                messages=messages,  # type: ignore
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                stream=True,
+            )
         except Exception as e:
+            self.router.record(model, None, ok=False)
             print(f"Error during {intent}: {e}")
-            return None
+            return
+
+        deltas: List[str] = []
+        usage = None
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    deltas.append(chunk.choices[0].delta.content)
+                    yield deltas[-1]
+                # Groq reports usage on the last chunk.
+                usage = completion_usage(chunk) or usage
+
+            # Only complete streams are timed, and only they are cached.
+            self.router.record(model, time.perf_counter() - started)
+            if self.cache and key and deltas:
+                await self.cache.aput(intent, key, "".join(deltas))
+        except Exception as e:
+            self.router.record(model, None, ok=False)
+            print(f"Error during {intent}: {e}")
+        finally:
+            # Closing early stops generation instead of draining the body.
+            await stream.close()
+            if usage is None:
+                usage = (
+                    self.estimator.count_messages(messages),
+                    self.estimator.count_text("".join(deltas)),
+                )
+            self._record_usage(model, usage, est_tokens)
+
+    async def athink_stream(
+        self,
+        intent: str,
+        messages: List[Dict[str, Any]],
+        model: str | None = None,
+        temperature: float = 1,
+        max_tokens: int = 1024,
+        top_p: float = 1,
+        tier: str | None = None,
+        latency_budget: float | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Yields the completion's text deltas as they arrive. Leaving the loop
+        early closes the underlying request.
+        """
+        model = self._resolve_model(
+            model,
+            tier,
+            latency_budget,
+            self.estimator.estimate_request(messages, max_tokens),
+        )
+        deltas = self._stream_deltas(
+            intent,
+            self.fit_prompt(messages, model, max_tokens),
+            model,
+            temperature,
+            max_tokens,
+            top_p,
+        )
+        try:
+            while True:
+                try:
+                    yield await self.runtime.call(_next_delta(deltas))
+                except StopAsyncIteration:
+                    return
+        finally:
+            await self.runtime.call(deltas.aclose())
+
+    def think_stream(
+        self,
+        intent: str,
+        messages: List[Dict[str, Any]],
+        model: str | None = None,
+        temperature: float = 1,
+        max_tokens: int = 1024,
+        top_p: float = 1,
+        tier: str | None = None,
+        latency_budget: float | None = None,
+    ) -> Generator[str, None, None]:
+        model = self._resolve_model(
+            model,
+            tier,
+            latency_budget,
+            self.estimator.estimate_request(messages, max_tokens),
+        )
+        deltas = self._stream_deltas(
+            intent,
+            self.fit_prompt(messages, model, max_tokens),
+            model,
+            temperature,
+            max_tokens,
+            top_p,
+        )
+        return self._sync_deltas(deltas)
+
+    def _sync_deltas(
+        self, deltas: AsyncGenerator[str, None]
+    ) -> Generator[str, None, None]:
+        try:
+            while True:
+                try:
+                    yield self.runtime.run(_next_delta(deltas))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.runtime.run(deltas.aclose())
+
+    def think_first(
+        self,
+        intent: str,
+        messages: List[Dict[str, Any]],
+        read: Callable[[Iterable[str]], Tuple[str | None, str]],
+        model: str | None = None,
+        temperature: float = 1,
+        max_tokens: int = 1024,
+        top_p: float = 1,
+        tier: str | None = None,
+        latency_budget: float | None = None,
+    ) -> Tuple[str | None, str]:
+        """
+        Streams the completion into `read`, which may stop as soon as it
+        has found what it wants and returns that with the text read so far.
+        A stream cut short is never cached, so the found value is cached
+        under the request's key instead and read again on a hit.
+        """
+        model = self._resolve_model(
+            model,
+            tier,
+            latency_budget,
+            self.estimator.estimate_request(messages, max_tokens),
+        )
+        messages = self.fit_prompt(messages, model, max_tokens)
+        key = self._cache_key(intent, messages, model, temperature, max_tokens, top_p)
+        if self.cache and key:
+            cached = self.cache.get(intent, key)
+            if cached is not None:
+                return read([cached])
+
+        deltas = self._sync_deltas(
+            self._stream_deltas(
+                intent,
+                messages,
+                model,
+                temperature,
+                max_tokens,
+                top_p,
+                use_cache=False,
+            )
+        )
+        try:
+            found, text = read(deltas)
+        finally:
+            deltas.close()
+
+        if self.cache and key and found is not None:
+            self.cache.put(intent, key, found)
+        return found, text
+
+    async def athink_many(
+        self, thoughts: List[Thought]
+    ) -> List[str | ChatCompletion | None]:
+        """
+        Runs independent prompts concurrently. Results are in the order of
+        `thoughts`; a failed call yields None like `think` does.
+        """
+        return await asyncio.gather(
+            *(self.athink(**thought.model_dump()) for thought in thoughts)
+        )
+
+    def think_many(self, thoughts: List[Thought]) -> List[str | ChatCompletion | None]:
+        return self.runtime.run(self.athink_many(thoughts))
+
+
+async def _next_delta(deltas: AsyncIterator[str]) -> str:
+    return await anext(deltas)
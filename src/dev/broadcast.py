@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from typing import List
+
+from src.service.util import Frame
+
+
+class FrameSubscription:
+    """
+    One viewer of a camera stream. Holds at most `depth` pending frames; when
+    the viewer falls behind the oldest pending frame is dropped, so a slow
+    client sees a lower frame rate instead of growing latency.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, depth: int = 1):
+        self.loop = loop
+        self.queue: asyncio.Queue[Frame] = asyncio.Queue(maxsize=depth)
+        self.sent = 0
+        self.dropped = 0
+        self.last_seq = 0
+
+    def _offer(self, frame: Frame) -> None:
+        if frame.seq <= self.last_seq:
+            return
+
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+    async def next(self) -> Frame:
+        frame = await self.queue.get()
+        self.sent += 1
+        self.last_seq = frame.seq
+        return frame
+
+
+class FrameBroadcaster:
+    """
+    Fans frames out from the ingest thread to any number of asyncio viewers,
+    so N viewers cost one ingest instead of N polls.
+    """
+
+    def __init__(self) -> None:
+        self._subscriptions: List[FrameSubscription] = []
+        self._lock = threading.Lock()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, depth: int = 1) -> FrameSubscription:
+        subscription = FrameSubscription(asyncio.get_running_loop(), depth)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: FrameSubscription) -> None:
+        with self._lock:
+            self._subscriptions = [
+                other for other in self._subscriptions if other is not subscription
+            ]
+
+    def publish(self, frame: Frame) -> None:
+        for subscription in self._subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._offer, frame)
+            except RuntimeError:
+                # The viewer's event loop is gone.
+                self.unsubscribe(subscription)
@@ -1,73 +1,194 @@
+import asyncio
 import time
 import requests
-import base64
-from PIL import Image
-from io import BytesIO
+from concurrent.futures import Executor, Future
 from typing import Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 import threading
 
+import aiohttp
+
+from .broadcast import FrameBroadcaster
+from .history import FrameHistory
+from .ingest import Backoff, IngestStats
+from .mjpeg import MJPEGFrameExtractor, boundary_from_content_type, is_jpeg
+from .preprocess import FramePreprocessor
 from .reporting import Reporter
-from src.service.util import process_env, CameraStore
+from .scene import SceneChangeDetector, decode_gray
+from src.service.store import CameraStore
+from src.service.util import process_env, Frame
 
 
 class Camera(BaseModel):
     stream_url: str = Field(..., description="URL of the camera stream")
+    source: str = Field(..., description="Key the camera's frames are stored under")
     reporter: Reporter
     store: CameraStore
     running: bool = Field(
         default=True, description="Indicates if the stream is running"
     )
     thread: Optional[threading.Thread] = Field(default=None, exclude=True)
+    task: Optional[Future[None]] = Field(default=None, exclude=True)
+    preprocessor: Optional[FramePreprocessor] = Field(default=None, exclude=True)
+    scene_detector: Optional[SceneChangeDetector] = Field(default=None, exclude=True)
+
+    _latest: Optional[Frame] = PrivateAttr(default=None)
+    _scene_seq: int = PrivateAttr(default=0)
+    _history: FrameHistory = PrivateAttr(default_factory=FrameHistory)
+    _broadcaster: FrameBroadcaster = PrivateAttr(default_factory=FrameBroadcaster)
+    _stats: IngestStats = PrivateAttr(default_factory=IngestStats)
+    _stopped: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _frame_ready: threading.Condition = PrivateAttr(default_factory=threading.Condition)
 
     class Config:
         arbitrary_types_allowed = True
 
     def __init__(
-        self, reporter: Reporter, store: CameraStore, stream_url: Optional[str] = None
+        self,
+        reporter: Reporter,
+        store: CameraStore,
+        stream_url: Optional[str] = None,
+        history_size: int = 64,
+        preprocessor: Optional[FramePreprocessor] = None,
+        scene_detector: Optional[SceneChangeDetector] = None,
+        source: Optional[str] = None,
+        start: bool = True,
     ):
+        stream_url = (
+            stream_url
+            or f"http://{process_env('CAMERA_SOURCE', '10.0.0.74')}:4747/video"
+        )
         super().__init__(
-            stream_url=stream_url
-            or f"http://{process_env('CAMERA_SOURCE', '10.0.0.74')}:4747/video",
+            stream_url=stream_url,
+            source=source or stream_url,
             reporter=reporter,
             store=store,
+            preprocessor=preprocessor,
+            scene_detector=scene_detector,
         )
-        self.running = True
-        self.thread = threading.Thread(target=self._fetch_stream, daemon=True)
+        self._history = FrameHistory(history_size)
+        self.running = start
+        if not start:
+            # Ingest is driven externally, e.g. by a CameraManager.
+            return
+
+        self.thread = threading.Thread(target=self._supervise_stream, daemon=True)
         self.thread.start()
         self.reporter.log_info("Camera streaming initialized and started.")
 
-    def _fetch_stream(self) -> None:
-        try:
-            with requests.get(self.stream_url, stream=True, timeout=1) as response:
-                response.raise_for_status()
-                buffer = b""
-
-                for chunk in response.iter_content(chunk_size=8192):
-                    if not self.running:
-                        break
-
-                    buffer += chunk
-                    start = buffer.find(b"\xff\xd8")
-                    end = buffer.find(b"\xff\xd9")
-                    if start != -1 and end != -1:
-                        frame = buffer[start : end + 2]
-                        buffer = buffer[end + 2 :]
-
-                        try:
-                            image = Image.open(BytesIO(frame))
-                            temp_buffer = BytesIO()
-                            image.save(temp_buffer, format="JPEG")
-                            raw_frame = temp_buffer.getvalue()
-                            encoded_frame = f"data:image/jpeg;base64,{base64.b64encode(raw_frame).decode("utf-8")}"
-                            self.store.set_frame(self.stream_url, encoded_frame)
-                        except Exception as e:
-                            self.reporter.log_error(f"Error processing frame: {e}")
-
-        except requests.exceptions.RequestException as e:
-            self.reporter.log_error(f"Error during streaming: {e}")
-            time.sleep(3)
-            self._fetch_stream()
+    def _supervise_stream(self) -> None:
+        """
+        Keeps the stream connected for as long as the camera is running,
+        reconnecting with jittered exponential backoff after failures.
+        """
+        backoff = Backoff()
+
+        while self.running:
+            try:
+                self._fetch_stream(backoff)
+                error = "Stream ended."
+            except requests.exceptions.RequestException as e:
+                error = f"Error during streaming: {e}"
+            except Exception as e:
+                error = f"Unexpected streaming error: {e}"
+
+            if not self.running:
+                break
+
+            self._stats.record_error(error)
+            delay = backoff.next_delay()
+            self.reporter.log_error(f"{error} Reconnecting in {delay:.1f}s.")
+            self._stopped.wait(delay)
+
+    def _fetch_stream(self, backoff: Backoff) -> None:
+        with requests.get(self.stream_url, stream=True, timeout=1) as response:
+            response.raise_for_status()
+            self._stats.record_connected()
+            extractor = MJPEGFrameExtractor(
+                boundary=boundary_from_content_type(
+                    response.headers.get("Content-Type")
+                )
+            )
+
+            for chunk in response.iter_content(chunk_size=8192):
+                if not self.running:
+                    break
+
+                for frame in extractor.feed(chunk):
+                    if self._ingest_frame(frame):
+                        backoff.reset()
+
+    def start_async(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        session: aiohttp.ClientSession,
+        executor: Executor,
+    ) -> None:
+        """
+        Runs ingest as a task on a shared event loop with frame processing
+        handed to `executor`, so many cameras do not need a thread each.
+        """
+        if self.ingesting:
+            return
+
+        self.running = True
+        self._stopped.clear()
+        self.task = asyncio.run_coroutine_threadsafe(
+            self._supervise_stream_async(session, executor), loop
+        )
+        self.reporter.log_info(f"Camera '{self.source}' streaming started.")
+
+    async def _supervise_stream_async(
+        self, session: aiohttp.ClientSession, executor: Executor
+    ) -> None:
+        backoff = Backoff()
+
+        while self.running:
+            try:
+                await self._fetch_stream_async(session, executor, backoff)
+                error = "Stream ended."
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"Error during streaming: {e!r}"
+            except Exception as e:
+                error = f"Unexpected streaming error: {e}"
+
+            if not self.running:
+                break
+
+            self._stats.record_error(error)
+            delay = backoff.next_delay()
+            self.reporter.log_error(f"{error} Reconnecting in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+    async def _fetch_stream_async(
+        self, session: aiohttp.ClientSession, executor: Executor, backoff: Backoff
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=1, sock_read=1)
+
+        async with session.get(self.stream_url, timeout=timeout) as response:
+            response.raise_for_status()
+            self._stats.record_connected()
+            extractor = MJPEGFrameExtractor(
+                boundary=boundary_from_content_type(
+                    response.headers.get("Content-Type")
+                )
+            )
+
+            async for chunk in response.content.iter_any():
+                if not self.running:
+                    break
+
+                frames = extractor.feed(chunk)
+                if not frames:
+                    continue
+
+                # Frames that piled up while the last one was processed are
+                # already stale; only the newest is worth ingesting.
+                for _ in frames[:-1]:
+                    self._stats.record_skip()
+                if await loop.run_in_executor(executor, self._ingest_frame, frames[-1]):
+                    backoff.reset()
 
     def stop_stream(self) -> None:
         if not self.running:
@@ -75,20 +196,158 @@ class Camera(BaseModel):
             return
 
         self.running = False
+        self._stopped.set()
+        if self.task:
+            self.task.cancel()
         self.reporter.log_info("Stream stopped.")
 
-    def snap_photo(self) -> str:
-        latest_frame = self.store.get_frame(self.stream_url)
-        if latest_frame is None:
+    @property
+    def stats(self) -> IngestStats:
+        return self._stats
+
+    def is_online(self) -> bool:
+        return self._stats.is_online()
+
+    def _ingest_frame(self, frame: memoryview) -> bool:
+        captured_at = time.time()
+        started = time.perf_counter()
+
+        if not is_jpeg(frame):
+            self._stats.record_drop()
+            self.reporter.log_error("Dropped malformed camera frame.")
+            return False
+
+        try:
+            data = bytes(frame)
+            image = self.preprocessor.decode(data) if self.preprocessor else None
+            # The decode is timed by the preprocessor; a frame it cannot
+            # decode has no variants and is not decoded twice.
+            variants = (
+                self.preprocessor.process(data, image=image)
+                if self.preprocessor and image is not None
+                else None
+            )
+
+            change = None
+            if self.scene_detector:
+                gray = image if image is not None else decode_gray(data)
+                if gray is not None:
+                    change = self.scene_detector.observe(gray)
+
+            stored = self.store.set_frame_bytes(
+                self.source,
+                data,
+                timestamp=captured_at,
+                variants=variants,
+                phash=change.phash if change else None,
+                scene_seq=None if change is None or change.changed else self._scene_seq,
+            )
+            self._scene_seq = stored.scene_seq
+            self._publish_frame(stored)
+        except Exception as e:
+            self._stats.record_drop()
+            self.reporter.log_error(f"Error processing frame: {e}")
+            return False
+
+        self._stats.record_frame(time.perf_counter() - started, now=captured_at)
+        return True
+
+    def _publish_frame(self, frame: Frame) -> None:
+        self._history.append(frame)
+        with self._frame_ready:
+            self._latest = frame
+            self._frame_ready.notify_all()
+        self._broadcaster.publish(frame)
+
+    @property
+    def ingesting(self) -> bool:
+        if not self.running:
+            return False
+        if self.task is not None:
+            return not self.task.done()
+        return self.thread is not None and self.thread.is_alive()
+
+    def latest_frame(self, max_age: float | None = None) -> Optional[Frame]:
+        frame = self._latest if self.ingesting else None
+        if frame is None:
+            frame = self.store.get_latest(self.source)
+
+        if frame is None or (max_age is not None and frame.age > max_age):
+            return None
+        return frame
+
+    @property
+    def history(self) -> FrameHistory:
+        return self._history
+
+    @property
+    def broadcaster(self) -> FrameBroadcaster:
+        return self._broadcaster
+
+    def frame_by_seq(self, seq: int) -> Optional[Frame]:
+        return self._history.by_seq(seq)
+
+    def frame_at(self, timestamp: float) -> Optional[Frame]:
+        return self._history.at(timestamp) or self.store.get_frame_at(
+            self.source, timestamp
+        )
+
+    def current_seq(self) -> int:
+        frame = self.latest_frame()
+        return frame.seq if frame else 0
+
+    def wait_for_frame(
+        self,
+        after_seq: int,
+        timeout: float | None = None,
+        max_age: float | None = None,
+    ) -> Optional[Frame]:
+        """
+        Blocks until a frame with a sequence number greater than `after_seq`
+        exists, then returns it. Returns None on timeout or when the newest
+        frame is older than `max_age` seconds.
+        """
+        if self.ingesting:
+            with self._frame_ready:
+                self._frame_ready.wait_for(
+                    lambda: self._latest is not None and self._latest.seq > after_seq,
+                    timeout=timeout,
+                )
+                frame = self._latest
+        else:
+            frame = self.store.wait_for_frame(self.source, after_seq, timeout)
+
+        if frame is None or frame.seq <= after_seq:
+            return None
+        if max_age is not None and frame.age > max_age:
+            return None
+        return frame
+
+    def snap_photo(
+        self,
+        max_age: float | None = None,
+        after_seq: int | None = None,
+        timeout: float | None = None,
+    ) -> str:
+        if after_seq is not None:
+            frame = self.wait_for_frame(after_seq, timeout=timeout, max_age=max_age)
+        else:
+            frame = self.latest_frame(max_age=max_age)
+
+        if frame is None:
             raise RuntimeError("No frame available to capture.")
 
-        self.reporter.log_info("Captured image from the latest frame.")
-        return latest_frame
+        self.reporter.log_info(
+            f"Captured image from frame {frame.seq} ({frame.age:.2f}s old)."
+        )
+        return frame.data_url
 
     def get_video_stream(self) -> Optional[str]:
-        return self.store.get_frame(self.stream_url)
+        frame = self.latest_frame()
+        return frame.data_url if frame else None
 
     def release(self) -> None:
         self.stop_stream()
-        self.store.set_frame(self.stream_url, "")
+        self._history.clear()
+        self.store.clear_frames(self.source)
         self.reporter.log_info("Released camera resources.")
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from .camera import Camera
+from .preprocess import FramePreprocessor
+from .reporting import Reporter
+from .scene import SceneChangeDetector
+from src.service.store import CameraStore
+from src.service.util import Frame
+
+
+class CameraManager:
+    """
+    Owns the robot's cameras, keyed by name. Every stream is read by one
+    event loop thread and frames are processed on a shared thread pool, so
+    adding a camera adds a task rather than a thread. Frames are stored
+    under the camera's name and `max_cameras` bounds how many exist.
+    """
+
+    def __init__(
+        self,
+        reporter: Reporter,
+        store: CameraStore,
+        max_cameras: int = 4,
+        workers: int | None = None,
+    ):
+        self.reporter = reporter
+        self.store = store
+        self.max_cameras = max_cameras
+
+        self._cameras: Dict[str, Camera] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or min(max_cameras, 4),
+            thread_name_prefix="camera-ingest",
+        )
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="camera-loop", daemon=True
+        )
+        self._thread.start()
+        self._session = asyncio.run_coroutine_threadsafe(
+            self._create_session(), self._loop
+        ).result()
+
+    async def _create_session(self) -> aiohttp.ClientSession:
+        # Each stream holds its connection open for as long as it runs.
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_cameras)
+        )
+
+    def add(
+        self,
+        name: str,
+        stream_url: str,
+        preprocessor: Optional[FramePreprocessor] = None,
+        scene_detector: Optional[SceneChangeDetector] = None,
+        history_size: int = 64,
+    ) -> Camera:
+        with self._lock:
+            if name in self._cameras:
+                raise ValueError(f"Camera '{name}' already exists.")
+            if len(self._cameras) >= self.max_cameras:
+                raise ValueError(
+                    f"Cannot add camera '{name}': limit of {self.max_cameras} reached."
+                )
+
+            camera = Camera(
+                reporter=self.reporter,
+                store=self.store,
+                stream_url=stream_url,
+                source=name,
+                history_size=history_size,
+                preprocessor=preprocessor,
+                scene_detector=scene_detector,
+                start=False,
+            )
+            self._cameras[name] = camera
+
+        camera.start_async(self._loop, self._session, self._executor)
+        return camera
+
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            camera = self._cameras.pop(name, None)
+
+        if camera is None:
+            return False
+        camera.release()
+        return True
+
+    def get(self, name: str) -> Optional[Camera]:
+        return self._cameras.get(name)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._cameras)
+
+    @property
+    def primary(self) -> Optional[Camera]:
+        """
+        The first camera added, which single-camera consumers use.
+        """
+        return next(iter(self._cameras.values()), None)
+
+    def latest_frames(self, max_age: float | None = None) -> Dict[str, Frame]:
+        frames = {}
+        for name, camera in list(self._cameras.items()):
+            frame = camera.latest_frame(max_age=max_age)
+            if frame is not None:
+                frames[name] = frame
+        return frames
+
+    def __len__(self) -> int:
+        return len(self._cameras)
+
+    def shutdown(self) -> None:
+        for name in self.names:
+            self.remove(name)
+
+        asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
+
+
+def parse_camera_sources(spec: str) -> Dict[str, str]:
+    """
+    Parses a `name=url,name=url` list, such as the CAMERAS setting.
+    """
+    sources = {}
+    for entry in spec.split(","):
+        name, sep, url = entry.strip().partition("=")
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"Invalid camera source '{entry}', expected name=url.")
+        sources[name.strip()] = url.strip()
+    return sources
@@ -0,0 +1,166 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional, Tuple
+
+MOVES = (
+    "forward",
+    "backward",
+    "left",
+    "right",
+    "armUp",
+    "armDown",
+    "clawOpen",
+    "clawClose",
+)
+PARTS = ("arm", "claw")
+
+MIN_VELOCITY, MAX_VELOCITY = 10, 188
+MIN_DURATION, MAX_DURATION = 0.5, 3.0
+DEFAULT_DURATION = 1.0
+
+NUMBER = r"(\d+(?:\.\d+)?)"
+MOVE = re.compile(rf"vex robot move ({'|'.join(MOVES)}) {NUMBER}(?: {NUMBER})?")
+SET = re.compile(rf"vex robot set ({'|'.join(PARTS)}) {NUMBER}")
+GET = re.compile(rf"vex robot get ({'|'.join(PARTS)})")
+
+
+def clamp(value: float, low: float, high: float) -> float:
+    return low if value < low else high if value > high else value
+
+
+class Command(ABC):
+    """
+    A parsed robot command. `str()` gives its canonical form, which is
+    what is sent to the device.
+    """
+
+    __slots__ = ()
+
+    @abstractmethod
+    def serialize(self) -> str: ...
+
+    def __str__(self) -> str:
+        return self.serialize()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.serialize()!r})"
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Command) and self.serialize() == other.serialize()
+
+    def __hash__(self) -> int:
+        return hash(self.serialize())
+
+
+class Move(Command):
+    """
+    Velocity and duration are clamped to what the robot accepts.
+    """
+
+    __slots__ = ("action", "velocity", "duration")
+
+    def __init__(
+        self, action: str, velocity: float, duration: float = DEFAULT_DURATION
+    ):
+        self.action = action
+        self.velocity = int(clamp(round(velocity), MIN_VELOCITY, MAX_VELOCITY))
+        self.duration = float(clamp(duration, MIN_DURATION, MAX_DURATION))
+
+    def serialize(self) -> str:
+        return f"vex robot move {self.action} {self.velocity} {self.duration}"
+
+
+class Set(Command):
+    __slots__ = ("part", "value")
+
+    def __init__(self, part: str, value: float):
+        self.part = part
+        self.value = clamp(value, 0, 1)
+
+    def serialize(self) -> str:
+        return f"vex robot set {self.part} {self.value:g}"
+
+
+class Get(Command):
+    __slots__ = ("part",)
+
+    def __init__(self, part: str):
+        self.part = part
+
+    def serialize(self) -> str:
+        return f"vex robot get {self.part}"
+
+
+class Fixed(Command):
+    """
+    A command without arguments.
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def serialize(self) -> str:
+        return self.text
+
+
+STOP = Fixed("vex motor all stop")
+BATTERY = Fixed("vex battery getCapacity")
+PING = Fixed("vex ping")
+FIXED: Dict[str, Fixed] = {command.text: command for command in (STOP, BATTERY, PING)}
+
+# Described to the model as the commands it may choose from.
+COMMAND_TEMPLATES = [
+    f"vex robot move ({'|'.join(MOVES)}) ({MIN_VELOCITY}-{MAX_VELOCITY}) ({MIN_DURATION:g}-{MAX_DURATION:g})",
+    STOP.text,
+    f"vex robot set ({'|'.join(PARTS)}) (0-1)",
+    f"vex robot get ({'|'.join(PARTS)})",
+    BATTERY.text,
+    PING.text,
+]
+
+
+def _move(match: "re.Match[str]") -> Command:
+    action, velocity, duration = match.groups()
+    return Move(
+        action, float(velocity), float(duration) if duration else DEFAULT_DURATION
+    )
+
+
+def _set(match: "re.Match[str]") -> Command:
+    return Set(match.group(1), float(match.group(2)))
+
+
+def _get(match: "re.Match[str]") -> Command:
+    return Get(match.group(1))
+
+
+Parser = Tuple["re.Pattern[str]", Callable[["re.Match[str]"], Command]]
+
+# Keyed by the word after `vex robot`, so each command runs one pattern.
+_PARSERS: Dict[str, Parser] = {
+    "move": (MOVE, _move),
+    "set": (SET, _set),
+    "get": (GET, _get),
+}
+
+
+def parse_command(text: str) -> Optional[Command]:
+    """
+    Parses one command, or returns None when it is not one the robot
+    understands. Surrounding whitespace is ignored.
+    """
+    text = text.strip()
+    fixed = FIXED.get(text)
+    if fixed is not None:
+        return fixed
+
+    if not text.startswith("vex robot "):
+        return None
+    parser = _PARSERS.get(text[10:14].rstrip())
+    if parser is None:
+        return None
+    pattern, build = parser
+    match = pattern.fullmatch(text)
+    return build(match) if match else None
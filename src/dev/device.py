@@ -4,6 +4,7 @@ import threading
 import queue
 from typing import Optional, Any
 
+from .command import Command, Move, parse_command
 from .reporting import Reporter
 
 
@@ -16,7 +17,7 @@ class DeviceManager:
         self.reporter = reporter if reporter else Reporter()
         self.connection = serial.Serial(self.port, self.rate, timeout=5)
 
-        self.command_queue: queue.Queue[str] = queue.Queue()
+        self.command_queue: queue.Queue[Command] = queue.Queue()
         self.stop_event = threading.Event()
         self.response_lock = threading.Lock()
         self.current_response = None
@@ -50,13 +51,11 @@ class DeviceManager:
                 self.reporter.log_info(message=f"Processing command: {command}")
                 self.send_command(command)
 
-                if command.startswith("vex robot move"):
-                    duration = self._extract_duration(command)
-                    if duration:
-                        self.reporter.log_info(
-                            f"Waiting for duration: {duration} seconds"
-                        )
-                        threading.Event().wait(duration)
+                if isinstance(command, Move):
+                    self.reporter.log_info(
+                        f"Waiting for duration: {command.duration} seconds"
+                    )
+                    threading.Event().wait(command.duration)
 
                 response = self._wait_for_response()
                 if response:
@@ -72,7 +71,7 @@ class DeviceManager:
             except queue.Empty:
                 continue
 
-    def send_command(self, command: str) -> None:
+    def send_command(self, command: Command | str) -> None:
         try:
             self.connection.write(f"{command}\n".encode("utf-8"))
             self.connection.flush()
@@ -82,18 +81,6 @@ class DeviceManager:
                 message=f"Error while sending command: {command}, Error: {e}"
             )
 
-    def _extract_duration(self, command: str) -> Optional[float]:
-        match = re.search(r"vex robot move.*?(\d+(?:\.\d+)?)$", command)
-        if match:
-            try:
-                return float(match.group(1))
-            except ValueError:
-                self.reporter.log_warning(
-                    message=f"Invalid duration format in command: {command}"
-                )
-                return None
-        return None
-
     def _wait_for_response(self, timeout: int = 5) -> Optional[str]:
         for _ in range(timeout):
             with self.response_lock:
@@ -110,7 +97,23 @@ class DeviceManager:
             "is_running": not self.stop_event.is_set(),
         }
 
-    def add_command(self, command: str, priority: bool = False) -> None:
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        """
+        Waits until every queued command has finished executing.
+        """
+        with self.command_queue.all_tasks_done:
+            return self.command_queue.all_tasks_done.wait_for(
+                lambda: not self.command_queue.unfinished_tasks, timeout
+            )
+
+    def add_command(self, command: Command | str, priority: bool = False) -> None:
+        if isinstance(command, str):
+            parsed = parse_command(command)
+            if parsed is None:
+                self.reporter.log_error(message=f"Invalid command: {command}")
+                return
+            command = parsed
+
         if priority:
             self.command_queue.put(command, block=False)
         else:
@@ -1,87 +1,154 @@
+import json
 import re
-from typing import Any, List
-from groq.types.chat import ChatCompletion
+from typing import Any, Iterable, List, Optional
+
+from pydantic import BaseModel
 
 from .brain import BaseBrain
+from .command import COMMAND_TEMPLATES, parse_command
 from .reporting import Reporter
 
+AVAILABLE_COMMANDS = COMMAND_TEMPLATES
 
-class CommandGenerator:
-    def __init__(self, brain: BaseBrain, reporter: Reporter):
-        self.brain = brain
-        self.reporter = reporter
-
-    def validate(self, command: str, available_commands: List[str]) -> List[str]:
-        def validate_command(command: str) -> bool:
-            if not command.startswith("vex robot move"):
-                return True
-
-            if re.match(r"vex robot move \w+ \d+$", command):
-                command += " 1"
-
-            for command_template in available_commands:
-                if command_template.startswith("vex robot move"):
-                    pattern = (
-                        r"vex robot move (forward|backward|left|right|armUp|armDown|clawOpen|clawClose) "
-                        r"(\d{2,3}) (\d+(.\d+)?)"
-                    )
-                    if re.fullmatch(pattern, command):
-                        return True
-            return False
-
-        def adjust_command(command: str) -> str:
-            if not command.startswith("vex robot move"):
-                return command
-
-            if re.match(r"vex robot move \w+ \d+$", command):
-                command += " 1"
-
-            match = re.search(r"move .* (\d+) (\d+(.\d+)?)", command)
-            if match:
-                velocity = int(match.group(1))
-                duration = float(match.group(2))
+JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+COMMAND_TEXT = re.compile(r"vex [^\"\n`]+")
 
-                if velocity < 10:
-                    velocity = 10
-                elif velocity > 188:
-                    velocity = 188
 
-                if duration < 0.5:
-                    duration = 0.5
-                elif duration > 3:
-                    duration = 3
+class FusedCommand(BaseModel):
+    reasoning: str = ""
+    command: str
 
-                command_parts = command.split()
-                command_parts[-2] = str(velocity)
-                command_parts[-1] = str(duration)
-                command = " ".join(command_parts)
 
-            return command
+class CommandGenerator:
+    def __init__(
+        self, brain: BaseBrain, reporter: Reporter, latency_budget: float = 1.0
+    ):
+        self.brain = brain
+        self.reporter = reporter
+        self.latency_budget = latency_budget
+
+    def valid_line(self, line: str) -> Optional[str]:
+        command = parse_command(line.strip().strip("`"))
+        return command.serialize() if command else None
+
+    def first_valid_command(self, deltas: Iterable[str]) -> tuple[Optional[str], str]:
+        """
+        Reads streamed text until a complete line is a valid command and
+        stops there, leaving the rest of the stream unread. Returns that
+        command, or None, along with the text read so far.
+        """
+        text = ""
+        checked = 0
+
+        for delta in deltas:
+            text += delta
+            while (end := text.find("\n", checked)) != -1:
+                command = self.valid_line(text[checked:end])
+                checked = end + 1
+                if command:
+                    return command, text
+
+        return self.valid_line(text[checked:]), text
+
+    def repair_command(self, command: str) -> Optional[str]:
+        """
+        Fixes the slips a model makes when filling in a command field, such
+        as quoting, stray spacing or a missing `vex` prefix, then parses it.
+        Out of range values are clamped by the grammar.
+        """
+        parts = command.replace('"', " ").replace("`", " ").split()
+        if not parts:
+            return None
+        if parts[0].lower() == "vex":
+            parts = parts[1:]
+        return self.valid_line(" ".join(["vex"] + parts))
+
+    def parse_fused(self, answer: str) -> Optional[FusedCommand]:
+        """
+        Reads a fused answer, repairing it locally rather than asking the
+        model again: the JSON object is dug out of surrounding text, and
+        when its command field is unusable any valid command in the answer
+        is taken instead.
+        """
+        data: Any = None
+        match = JSON_OBJECT.search(answer)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+            except ValueError:
+                data = None
+
+        reasoning = ""
+        command = None
+        if isinstance(data, dict):
+            reasoning = str(data.get("reasoning") or "")
+            if isinstance(data.get("command"), str):
+                command = self.repair_command(data["command"])
+
+        if command is None:
+            for candidate in COMMAND_TEXT.findall(answer):
+                command = self.repair_command(candidate)
+                if command:
+                    break
+
+        if command is None:
+            return None
+        return FusedCommand(reasoning=reasoning, command=command)
+
+    def think_and_command(
+        self,
+        environment: str,
+        available_commands: List[str] = AVAILABLE_COMMANDS,
+    ) -> Optional[FusedCommand]:
+        """
+        Reasons about the environment and picks the command in a single
+        JSON mode completion, in place of a `think` call followed by
+        `generate_command`.
+        """
+        prompt = (
+            "You are an AI robot controller. You will be given a description of your environment. "
+            "Think concisely about what action you should take to reach your goal, then choose exactly one command "
+            "from the provided list, filling in placeholder values (e.g., velocity, duration). "
+            "For velocity, values between 10-30 are considered slow, 90-188 fast, and everything in between a medium speed.\n"
+            'Respond with a JSON object of the form {"reasoning": "<your thinking>", "command": "<command>"}.\n'
+            "---\n"
+            "Available Commands:\n" + "\n".join(available_commands)
+        )
 
-        processed_commands: list[Any] = []
-        adjusted_command = adjust_command(command)
+        answer = self.brain.think(
+            intent="command-fused",
+            messages=[
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": f"Environment: {environment}"},
+            ],
+            max_tokens=512,
+            tier="basic",
+            latency_budget=self.latency_budget,
+            json_mode=True,
+        )
 
-        if validate_command(adjusted_command):
-            processed_commands.append(adjusted_command)
+        fused = self.parse_fused(answer) if isinstance(answer, str) else None
+        if fused is None:
+            self.reporter.log_error(
+                message="No valid command generated from environment."
+            )
+            return None
 
-        return processed_commands
+        self.reporter.log_custom(
+            level="COMMAND",
+            message=f"Generated command for thought: {fused.reasoning}",
+        )
+        return fused
 
     def generate_command(
         self,
         thought_process: str,
-        available_commands: List[str] = [
-            "vex robot move (forward|backward|left|right|armUp|armDown|clawOpen|clawClose) (1-188) (0.5-3)",
-            "vex motor all stop",
-            "vex robot set (arm|claw) (0-1)",
-            "vex robot get (arm|claw)",
-            "vex battery getCapacity",
-            "vex ping",
-        ],
+        available_commands: List[str] = AVAILABLE_COMMANDS,
     ) -> str:
         decision_prompt = (
             "COMMAND MODE: You are a robot controller AI. Based on the user's intent, generate a valid command \n"
             "from the provided list of commands. You can modify placeholder values (e.g., velocity, duration) \n"
-            "based on the user's thought process. For velocity, values between 10-30 are considered slow, 90-199 fast, and everything in between a medium speed. Only return the exact command string, without explanations.\n"
+            "based on the user's thought process. For velocity, values between 10-30 are considered slow, 90-188 fast, and everything in between a medium speed. Only return the exact command string, without explanations.\n"
             "---\n"
             f"User's Thought Process: {thought_process}\n\n"
             "Available Commands:\n" + "\n".join(available_commands)
@@ -92,48 +159,35 @@ class CommandGenerator:
             message=f"Generating command for thought: {thought_process}",
         )
 
-        decision = self.brain.think(
+        command, decision_message = self.brain.think_first(
             intent="command-generation",
             messages=[{"role": "user", "content": decision_prompt}],
-            model="llama-3.2-3b-preview",
+            read=self.first_valid_command,
+            tier="basic",
+            latency_budget=self.latency_budget,
         )
 
-        if isinstance(decision, ChatCompletion):
-            decision_message = decision.choices[0].message.content
-        elif isinstance(decision, str):
-            decision_message = decision.strip()
-        else:
-            decision_message = None
-
-        if decision_message:
-            valid_commands = self.validate(decision_message, available_commands)
-            if valid_commands:
-                return valid_commands[0]
+        if command:
+            return command
 
+        if decision_message.strip():
             reprompt_prompt = (
                 "COMMAND MODE: The command generated does not match the required structure or contains invalid values. Rewrite the command to STRICTLY conform to the provided format. Ensure velocity and duration are within valid ranges. Respond ONLY with the rewritten command, and nothing else.\n"
                 "---\n"
-                f"Invalid Command: {decision_message}\n\n"
+                f"Invalid Command: {decision_message.strip()}\n\n"
                 "Available Commands:\n" + "\n".join(available_commands)
             )
 
-            decision = self.brain.think(
+            command, _ = self.brain.think_first(
                 intent="command-revision",
                 messages=[{"role": "user", "content": reprompt_prompt}],
-                model="llama-3.2-3b-preview",
+                read=self.first_valid_command,
+                tier="basic",
+                latency_budget=self.latency_budget,
             )
 
-            if isinstance(decision, ChatCompletion):
-                revised_command = decision.choices[0].message.content
-            elif isinstance(decision, str):
-                revised_command = decision.strip()
-            else:
-                revised_command = None
-
-            if revised_command:
-                valid_commands = self.validate(revised_command, available_commands)
-                if valid_commands:
-                    return valid_commands[0]
+            if command:
+                return command
 
         error_message = "No valid command generated from thought process."
         self.reporter.log_error(message=error_message)
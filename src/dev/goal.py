@@ -1,16 +1,79 @@
-from typing import Any, List, Dict, Union
+from collections import deque
+from typing import Any, Deque, List, Dict, Tuple, Union
 from groq.types.chat import ChatCompletion
+import bisect
 import queue
+import re
+import threading
+import time
 
 from .brain import BaseBrain
 from .reporting import Reporter
 
 
+# "3. denied: I have no way to fly" in a batch decision.
+DECISION_LINE = re.compile(
+    r"^\W*(\d+)\W+(accepted|accept|denied|deny)\b\W*(.*)$", re.IGNORECASE
+)
+
+# Taken goals remembered for `retry_goal`, oldest forgotten first.
+RETRY_HORIZON = 64
+
+
 class Goals:
-    def __init__(self, brain: BaseBrain, reporter: Reporter):
+    """
+    Submitted goals are vetted by a background worker before they reach
+    `goal_queue`. The worker waits up to `batch_window` seconds after the
+    first pending goal for more to arrive and decides up to `batch_size`
+    of them with a single model call. The last `history_size` decisions,
+    accepted or denied, are kept with their reasons.
+
+    Goals handed back with `retry_goal` are taken again before any
+    others, in the order they were first taken.
+    """
+
+    def __init__(
+        self,
+        brain: BaseBrain,
+        reporter: Reporter,
+        latency_budget: float = 2.0,
+        batch_size: int = 8,
+        batch_window: float = 0.25,
+        history_size: int = 50,
+        start: bool = True,
+    ):
         self.brain = brain
         self.reporter = reporter
-        self.goal_queue: queue.Queue[dict[str, Any]] = queue.Queue()
+        self.latency_budget = latency_budget
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.goal_queue: Deque[Dict[str, str]] = deque()
+        self.pending_queue: queue.Queue[dict[str, Any]] = queue.Queue()
+        self.decided_goals: Deque[Dict[str, str]] = deque(maxlen=history_size)
+        # Retried goals by the order they were taken in, ahead of `goal_queue`.
+        self._retries: List[Tuple[int, Dict[str, str]]] = []
+        self._taken: Dict[str, int] = {}
+        self._takes = 0
+        self._goal_lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._worker: threading.Thread | None = None
+        if start:
+            self.start()
+
+    def start(self) -> None:
+        if self._worker and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(
+            target=self._vet_goals, name="goal-vetting", daemon=True
+        )
+        self._worker.start()
+
+    def shutdown(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._worker:
+            self._worker.join(timeout)
 
     def create_goal(self, goal_id: str, goal_text: str) -> Dict[str, str]:
         return {
@@ -49,7 +112,8 @@ class Goals:
         decision = self.brain.think(
             intent="goal-decision",
             messages=[{"role": "user", "content": decision_prompt}],
-            model="llama3-8b-8192",
+            tier="standard",
+            latency_budget=self.latency_budget,
         )
 
         if isinstance(decision, ChatCompletion):
@@ -78,6 +142,107 @@ class Goals:
 
         return goal["accepted"], goal["reason"]
 
+    def decide_goals(self, goals: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Decides several goals with one model call. Goals the answer does
+        not cover are decided one at a time with `decide_goal`.
+        """
+        if len(goals) == 1:
+            self.decide_goal(goals[0])  # type: ignore[arg-type]
+            return goals
+
+        listing = "\n".join(
+            f"{number}. {goal['request']}" for number, goal in enumerate(goals, 1)
+        )
+        decision_prompt = (
+            "GOAL MODE: Several new goals have been submitted for you.\n"
+            "---\n"
+            "You are an AI baked into a robot with the abilities to move forward, backward, left, right, or adjust your arm / claw, and you're responsible for deciding whether to accept or deny each of the following goals:\n\n"
+            f"{listing}\n\n"
+            "Respond with exactly one line per goal, in order, formatted as '<number>. accepted: <reason>' or '<number>. denied: <reason>'. Keep each reason to a max of 8 words."
+        )
+
+        self.reporter.log_custom(
+            level="GOAL", message=f"Deciding on {len(goals)} goals in one batch"
+        )
+
+        decision = self.brain.think(
+            intent="goal-decision",
+            messages=[{"role": "user", "content": decision_prompt}],
+            max_tokens=32 * len(goals) + 64,
+            tier="standard",
+            latency_budget=self.latency_budget,
+        )
+
+        if isinstance(decision, ChatCompletion):
+            decision = decision.choices[0].message.content
+
+        decided = set()
+        for line in (decision or "").splitlines():
+            match = DECISION_LINE.match(line.strip())
+            if not match:
+                continue
+
+            index = int(match.group(1)) - 1
+            if index < 0 or index >= len(goals) or index in decided:
+                continue
+
+            goal = goals[index]
+            verdict = match.group(2).lower()
+            goal["accepted"] = "accepted" if verdict.startswith("accept") else "denied"
+            goal["reason"] = match.group(3).strip() or line.strip()
+            decided.add(index)
+
+            self.reporter.log_custom(
+                level="GOAL",
+                message=f"Goal decision: {goal['accepted']}, Reason: {goal['reason']}",
+            )
+
+        for index, goal in enumerate(goals):
+            if index not in decided:
+                self.decide_goal(goal)  # type: ignore[arg-type]
+
+        return goals
+
+    def _next_batch(self) -> List[Dict[str, str]]:
+        try:
+            batch = [self.pending_queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _vet_goals(self) -> None:
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+
+            try:
+                self.decide_goals(batch)
+            except Exception as e:
+                self.reporter.log_custom(
+                    level="GOAL", message=f"Error vetting goals: {e}"
+                )
+                for goal in batch:
+                    goal["accepted"] = "denied"
+                    goal["reason"] = "Could not be vetted."
+
+            with self._goal_lock:
+                self.decided_goals.extend(dict(goal) for goal in batch)
+                self.goal_queue.extend(
+                    goal for goal in batch if goal["accepted"] == "accepted"
+                )
+
     def submit_goal(self, goal: Dict[str, str]) -> str:
         if not self.validate_goal(goal):
             self.reporter.log_custom(
@@ -85,27 +250,73 @@ class Goals:
             )
             return "Invalid goal submission: Ensure all required fields are properly formatted."
 
-        self.goal_queue.put(goal)
+        # Vetting happens on the worker so the caller is not held up by it.
+        self.pending_queue.put(goal)
         self.reporter.log_custom(
             level="GOAL", message=f"Goal submitted: {goal['id']} - {goal['request']}"
         )
         return f"Goal with ID '{goal['id']}' successfully submitted."
 
+    def has_goals(self) -> bool:
+        with self._goal_lock:
+            return bool(self._retries or self.goal_queue)
+
     def get_next_goal(self) -> Union[Dict[str, str], None]:
-        if self.goal_queue.empty():
+        with self._goal_lock:
+            if self._retries:
+                order, goal = self._retries.pop(0)
+            elif self.goal_queue:
+                self._takes += 1
+                order, goal = self._takes, self.goal_queue.popleft()
+            else:
+                goal = None
+            if goal is not None:
+                self._taken[goal["id"]] = order
+                # Only goals still in the pipeline can come back.
+                if len(self._taken) > RETRY_HORIZON:
+                    del self._taken[next(iter(self._taken))]
+
+        if goal is None:
             self.reporter.log_custom(level="GOAL", message="No goals in the queue.")
             return None
 
-        goal = self.goal_queue.get()
         self.reporter.log_custom(
             level="GOAL",
             message=f"Retrieved next goal: {goal['id']} - {goal['request']}",
         )
         return goal
 
+    def retry_goal(self, goal: Dict[str, str]) -> None:
+        """
+        Puts a goal taken with `get_next_goal` back at the front of the
+        queue, behind retried goals that were taken before it.
+        """
+        with self._goal_lock:
+            order = self._taken.pop(goal["id"], 0)
+            bisect.insort(self._retries, (order, goal), key=lambda retry: retry[0])
+
     def list_goals(self) -> List[Dict[str, str]]:
-        goals = list(self.goal_queue.queue)
+        with self._goal_lock:
+            goals = [goal for _, goal in self._retries] + list(self.goal_queue)
         self.reporter.log_custom(
             level="GOAL", message=f"Listing all goals: {len(goals)} goals in queue."
         )
         return goals
+
+    def list_pending_goals(self) -> List[Dict[str, str]]:
+        return list(self.pending_queue.queue)
+
+    def list_decided_goals(self) -> List[Dict[str, str]]:
+        """
+        Recent decisions, newest first.
+        """
+        with self._goal_lock:
+            return list(reversed(self.decided_goals))
+
+    def clear(self) -> None:
+        with self.pending_queue.mutex:
+            self.pending_queue.queue.clear()
+        with self._goal_lock:
+            self.goal_queue.clear()
+            self._retries.clear()
+            self._taken.clear()
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Optional, Set, TypeVar
+
+from pydantic import BaseModel
+
+from .router import ModelRouter
+
+
+T = TypeVar("T")
+
+
+class HedgePolicy(BaseModel):
+    # Hedge once the primary is slower than this percentile of its history.
+    percentile: float = 0.95
+    # At most this fraction of the intent's calls may send a hedge.
+    budget: float = 0.1
+    # Hedge with a faster model of the same kind instead of the same model.
+    fallback: bool = True
+    min_delay: float = 0.05
+
+
+# The agent loop waits on every internal thought, so its tail matters most.
+DEFAULT_HEDGING: Dict[str, HedgePolicy] = {
+    "internal_thoughts": HedgePolicy(),
+}
+
+
+class HedgeStats(BaseModel):
+    calls: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+
+
+class Hedger:
+    """
+    Sends a duplicate of a slow request and keeps whichever answer arrives
+    first, cancelling the other. Only intents with a policy are hedged, and
+    only once the router has enough latency samples to say what slow is.
+    """
+
+    def __init__(self, policies: Dict[str, HedgePolicy], router: ModelRouter):
+        self.policies = policies
+        self.router = router
+        self.stats: Dict[str, HedgeStats] = {}
+        self._lock = threading.Lock()
+
+    def delay(self, intent: str, model: str) -> Optional[float]:
+        policy = self.policies.get(intent)
+        if policy is None:
+            return None
+
+        observed = self.router.latency_percentile(model, policy.percentile)
+        return max(observed, policy.min_delay) if observed is not None else None
+
+    def _count_call(self, intent: str) -> HedgeStats:
+        with self._lock:
+            stats = self.stats.setdefault(intent, HedgeStats())
+            stats.calls += 1
+            return stats
+
+    def _take_hedge(self, intent: str, stats: HedgeStats) -> bool:
+        with self._lock:
+            if stats.hedged >= self.policies[intent].budget * stats.calls:
+                return False
+            stats.hedged += 1
+            return True
+
+    def hedge_model(self, intent: str, model: str) -> str:
+        if not self.policies[intent].fallback:
+            return model
+        return self.router.faster_alternative(model) or model
+
+    async def run(
+        self, intent: str, model: str, call: Callable[[str], Awaitable[T]]
+    ) -> T:
+        """
+        Runs `call(model)`, hedging it per the intent's policy.
+        """
+        delay = self.delay(intent, model)
+        if delay is None:
+            return await call(model)
+
+        stats = self._count_call(intent)
+        primary: asyncio.Future[T] = asyncio.ensure_future(call(model))
+        settled, _ = await asyncio.wait({primary}, timeout=delay)
+        if settled or not self._take_hedge(intent, stats):
+            return await primary
+
+        hedge: asyncio.Future[T] = asyncio.ensure_future(
+            call(self.hedge_model(intent, model))
+        )
+        pending: Set[asyncio.Future[T]] = {primary, hedge}
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            with self._lock:
+                                stats.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        assert error is not None
+        raise error
+
+    def snapshot(self) -> Dict[str, HedgeStats]:
+        with self._lock:
+            return {intent: stats.model_copy() for intent, stats in self.stats.items()}
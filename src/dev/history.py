@@ -0,0 +1,89 @@
+import threading
+from typing import List, Optional
+
+from src.service.util import Frame
+
+
+class FrameHistory:
+    """
+    Fixed-capacity ring buffer of recent frames for one camera source.
+
+    Appends and sequence-number lookups are O(1); time lookups bisect the
+    ring, which is ordered by capture time because frames are appended in
+    the order they are ingested.
+    """
+
+    def __init__(self, capacity: int = 64):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1.")
+
+        self.capacity = capacity
+        self._slots: List[Optional[Frame]] = [None] * capacity
+        self._by_seq: dict[int, Frame] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    def _at(self, index: int) -> Frame:
+        # Logical index 0 is the oldest retained frame.
+        start = self._count - len(self)
+        frame = self._slots[(start + index) % self.capacity]
+        assert frame is not None
+        return frame
+
+    def append(self, frame: Frame) -> None:
+        with self._lock:
+            slot = self._count % self.capacity
+            evicted = self._slots[slot]
+            if evicted is not None and self._by_seq.get(evicted.seq) is evicted:
+                del self._by_seq[evicted.seq]
+
+            self._slots[slot] = frame
+            self._by_seq[frame.seq] = frame
+            self._count += 1
+
+    def latest(self) -> Optional[Frame]:
+        with self._lock:
+            return self._at(len(self) - 1) if self._count else None
+
+    def by_seq(self, seq: int) -> Optional[Frame]:
+        return self._by_seq.get(seq)
+
+    def _bisect_right(self, timestamp: float) -> int:
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self._at(mid).timestamp <= timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def at(self, timestamp: float) -> Optional[Frame]:
+        """
+        Returns the newest frame captured at or before `timestamp`.
+        """
+        with self._lock:
+            index = self._bisect_right(timestamp)
+            return self._at(index - 1) if index > 0 else None
+
+    def after(self, timestamp: float) -> Optional[Frame]:
+        """
+        Returns the oldest frame captured after `timestamp`.
+        """
+        with self._lock:
+            index = self._bisect_right(timestamp)
+            return self._at(index) if index < len(self) else None
+
+    def since(self, timestamp: float) -> List[Frame]:
+        with self._lock:
+            index = self._bisect_right(timestamp)
+            return [self._at(i) for i in range(index, len(self))]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._by_seq.clear()
+            self._count = 0
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from typing import Optional
+
+from src.service.types.status import IngestStatus
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: each delay is drawn uniformly from
+    [0, min(cap, base * 2 ** attempt)], which keeps a fleet of robots from
+    reconnecting to a recovering camera in lockstep.
+    """
+
+    def __init__(self, base: float = 0.5, cap: float = 30.0):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.cap, self.base * (2**self.attempt))
+        self.attempt += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+
+class IngestStats:
+    """
+    Running statistics of a camera ingest loop. Updated by the ingest thread
+    on every frame and read by status endpoints without any network I/O.
+    """
+
+    def __init__(self, smoothing: float = 0.1, stale_after: float = 2.0):
+        self.smoothing = smoothing
+        self.stale_after = stale_after
+
+        self.connected = False
+        self.frames = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.reconnects = 0
+        self.fps = 0.0
+        self.latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.last_frame_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+
+        self._lock = threading.Lock()
+
+    def record_frame(self, latency: float, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        latency_ms = latency * 1000
+
+        with self._lock:
+            if self.last_frame_at is not None and now > self.last_frame_at:
+                instant_fps = 1.0 / (now - self.last_frame_at)
+                self.fps += self.smoothing * (instant_fps - self.fps)
+            self.latency_ms += self.smoothing * (latency_ms - self.latency_ms)
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+            self.last_frame_at = now
+            self.frames += 1
+
+    def record_drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def record_skip(self) -> None:
+        with self._lock:
+            self.skipped += 1
+
+    def record_connected(self) -> None:
+        with self._lock:
+            self.connected = True
+
+    def record_error(self, error: str) -> None:
+        with self._lock:
+            self.connected = False
+            self.reconnects += 1
+            self.last_error = error
+            self.last_error_at = time.time()
+
+    def is_online(self, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        return (
+            self.connected
+            and self.last_frame_at is not None
+            and now - self.last_frame_at <= self.stale_after
+        )
+
+    def snapshot(self) -> IngestStatus:
+        now = time.time()
+        with self._lock:
+            return IngestStatus(
+                isOnline=self.is_online(now),
+                connected=self.connected,
+                frames=self.frames,
+                dropped=self.dropped,
+                skipped=self.skipped,
+                reconnects=self.reconnects,
+                fps=round(self.fps, 2),
+                latency_ms=round(self.latency_ms, 2),
+                max_latency_ms=round(self.max_latency_ms, 2),
+                heartbeat_age=(
+                    round(now - self.last_frame_at, 3)
+                    if self.last_frame_at is not None
+                    else None
+                ),
+                last_error=self.last_error,
+            )
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Dict, Optional, TypeVar
+
+import httpx
+from groq import AsyncGroq
+
+from .ratelimiter import RateLimiter
+from .router import ModelRouter
+from .singleflight import SingleFlight
+from .tokens import TokenEstimator
+from src.service.util import process_env
+
+
+T = TypeVar("T")
+
+
+class LLMRuntime:
+    """
+    Process-wide home of the LLM clients. One event loop thread runs every
+    request and one AsyncGroq client per API key shares a connection pool
+    sized for the number of requests we expect in flight, instead of each
+    brain opening its own. `flights` coalesces identical requests,
+    `router` learns model latencies, `estimator` caches token counts and
+    `limiter` admits calls within the account's limits across every brain
+    and actor.
+    """
+
+    def __init__(self, max_connections: int = 16, timeout: float = 3.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        self.flights = SingleFlight()
+        self.estimator = TokenEstimator(process_env("LLM_TOKENIZER"))
+        self.limiter = RateLimiter(estimator=self.estimator)
+        self.router = ModelRouter(limiter=self.limiter)
+        self._clients: Dict[Optional[str], AsyncGroq] = {}
+        self._lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="llm-loop", daemon=True
+        )
+        self._thread.start()
+
+    def client(self, api_key: str | None = None) -> AsyncGroq:
+        with self._lock:
+            if api_key not in self._clients:
+                self._clients[api_key] = AsyncGroq(
+                    api_key=api_key,
+                    timeout=self.timeout,
+                    http_client=httpx.AsyncClient(
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        ),
+                        timeout=self.timeout,
+                    ),
+                )
+            return self._clients[api_key]
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """
+        Runs `coro` on the runtime loop and blocks until it finishes.
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("Cannot block on the LLM loop from inside it.")
+        return self.submit(coro).result()
+
+    async def call(self, coro: Coroutine[Any, Any, T]) -> T:
+        """
+        Awaits `coro` on the runtime loop from any event loop. The clients'
+        connections belong to the runtime loop, so requests must run there.
+        """
+        if asyncio.get_running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+
+_runtime: Optional[LLMRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> LLMRuntime:
+    global _runtime
+
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = LLMRuntime(
+                max_connections=int(process_env("LLM_MAX_CONNECTIONS", "16") or 16)
+            )
+        return _runtime
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from pydantic import BaseModel
+
+from .reporting import Reporter
+from src.service.types.misc import CacheStats, ResponseCacheStats
+
+
+class IntentPolicy(BaseModel):
+    enabled: bool = True
+    # Falls back to the cache's default TTL.
+    ttl: Optional[float] = None
+
+
+# Exploratory thoughts should vary between steps, so they are not cached
+# unless a policy says otherwise. The fused call thinks too, and as an
+# unchanged scene reuses its description the prompt repeats exactly, so
+# caching it would replay one command step after step.
+DEFAULT_POLICIES: Dict[str, IntentPolicy] = {
+    "internal_thoughts": IntentPolicy(enabled=False),
+    "command-fused": IntentPolicy(enabled=False),
+}
+
+
+def request_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: int,
+    top_p: float,
+    json_mode: bool = False,
+) -> str:
+    """
+    Hash identifying a completion request by everything that shapes it.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "json_mode": json_mode,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCacheBacking(ABC):
+    """
+    Second tier that keeps responses across restarts. Entries are
+    (expires_at, response text).
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[float, str]]: ...
+
+    @abstractmethod
+    def set(self, key: str, expires_at: float, payload: str) -> None: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+
+class RedisResponseBacking(ResponseCacheBacking):
+    def __init__(self, client: redis.StrictRedis, prefix: str = "llm:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        value = self.client.get(f"{self.prefix}{key}")
+        if not value:
+            return None
+        expires_at, _, payload = str(value).partition("|")
+        return float(expires_at), payload
+
+    def set(self, key: str, expires_at: float, payload: str) -> None:
+        self.client.set(
+            f"{self.prefix}{key}",
+            f"{expires_at!r}|{payload}",
+            ex=max(1, int(expires_at - time.time())),
+        )
+
+    def delete(self, key: str) -> None:
+        self.client.delete(f"{self.prefix}{key}")
+
+
+class SqliteResponseBacking(ResponseCacheBacking):
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache "
+            "(key TEXT PRIMARY KEY, expires_at REAL, payload TEXT)"
+        )
+        self._db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT expires_at, payload FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, expires_at: float, payload: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)",
+                (key, expires_at, payload),
+            )
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._db.commit()
+
+
+class ResponseCache:
+    """
+    LRU cache of completion texts keyed by a hash of the model, messages and
+    sampling parameters, so byte-identical prompts skip the round-trip.
+    Whether and for how long an intent is cached is set by its policy.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 512,
+        ttl: float = 3600.0,
+        backing: ResponseCacheBacking | None = None,
+        policies: Dict[str, IntentPolicy] | None = None,
+        reporter: Reporter | None = None,
+    ):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.backing = backing
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.reporter = reporter
+
+        self._entries: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+        self.intent_stats: Dict[str, CacheStats] = {}
+
+    key = staticmethod(request_key)
+
+    def policy(self, intent: str) -> IntentPolicy:
+        return self.policies.get(intent) or IntentPolicy()
+
+    def enabled_for(self, intent: str) -> bool:
+        return self.policy(intent).enabled
+
+    def _intent_stats(self, intent: str) -> CacheStats:
+        if intent not in self.intent_stats:
+            self.intent_stats[intent] = CacheStats()
+        return self.intent_stats[intent]
+
+    def _record(self, intent: str, hit: bool) -> None:
+        for stats in (self.stats, self._intent_stats(intent)):
+            if hit:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if now >= expires_at:
+            del self._entries[key]
+            self.stats.expirations += 1
+            self.stats.size = len(self._entries)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_memory(self, key: str, expires_at: float, value: str) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        self.stats.size = len(self._entries)
+
+    def _get_backing(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        if not self.backing:
+            return None
+
+        try:
+            entry = self.backing.get(key)
+            if entry is not None and now >= entry[0]:
+                self.backing.delete(key)
+                return None
+            return entry
+        except Exception as e:
+            if self.reporter:
+                self.reporter.log_error(f"Could not read LLM cache entry: {e}")
+            return None
+
+    def _set_backing(self, key: str, expires_at: float, value: str) -> None:
+        if not self.backing:
+            return
+
+        try:
+            self.backing.set(key, expires_at, value)
+        except Exception as e:
+            if self.reporter:
+                self.reporter.log_error(f"Could not persist LLM cache entry: {e}")
+
+    def get(self, intent: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+            if value is not None:
+                self._record(intent, hit=True)
+                return value
+
+        entry = self._get_backing(key, now)
+        with self._lock:
+            if entry is not None:
+                self._put_memory(key, *entry)
+            self._record(intent, hit=entry is not None)
+        return entry[1] if entry else None
+
+    def put(self, intent: str, key: str, value: str) -> None:
+        policy = self.policy(intent)
+        if not policy.enabled:
+            return
+
+        expires_at = time.time() + (policy.ttl if policy.ttl is not None else self.ttl)
+        with self._lock:
+            self._put_memory(key, expires_at, value)
+        self._set_backing(key, expires_at, value)
+
+    async def aget(self, intent: str, key: str) -> Optional[str]:
+        # The backing does blocking I/O; keep it off the event loop.
+        if self.backing:
+            return await asyncio.to_thread(self.get, intent, key)
+        return self.get(intent, key)
+
+    async def aput(self, intent: str, key: str, value: str) -> None:
+        if self.backing:
+            await asyncio.to_thread(self.put, intent, key, value)
+        else:
+            self.put(intent, key, value)
+
+    def report(self) -> ResponseCacheStats:
+        with self._lock:
+            return ResponseCacheStats(
+                total=self.stats.model_copy(),
+                intents={
+                    intent: stats.model_copy()
+                    for intent, stats in self.intent_stats.items()
+                },
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats.size = 0
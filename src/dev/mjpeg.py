@@ -0,0 +1,185 @@
+import re
+from typing import List, Optional
+
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+
+# Part headers are a few short lines; anything older than this is never
+# needed to find the Content-Length of the next frame.
+MAX_HEADER_SIZE = 4096
+
+_CONTENT_LENGTH = re.compile(rb"content-length:\s*(\d+)", re.IGNORECASE)
+_BOUNDARY = re.compile(r"boundary=\"?([^\";]+)\"?", re.IGNORECASE)
+
+
+def boundary_from_content_type(content_type: str | None) -> Optional[bytes]:
+    """
+    Extracts the multipart boundary from a `multipart/x-mixed-replace` header.
+    """
+    if not content_type:
+        return None
+
+    match = _BOUNDARY.search(content_type)
+    if not match:
+        return None
+
+    boundary = match.group(1).strip().encode("latin-1")
+    if boundary.startswith(b"--"):
+        boundary = boundary[2:]
+    return b"--" + boundary
+
+
+class MJPEGFrameExtractor:
+    """
+    Incremental MJPEG frame parser backed by a single reusable bytearray.
+
+    Marker scans resume where the previous scan stopped, so each byte of the
+    stream is inspected a bounded number of times. When the stream sends
+    `Content-Length` part headers or a multipart boundary those delimit the
+    frame, which also keeps an embedded EXIF thumbnail from cutting a frame
+    short at its own end-of-image marker.
+
+    Frames are handed out as memoryviews into the internal buffer. They are
+    only valid until the next call to `feed`, which releases them before the
+    buffer is compacted; copy them (`bytes(frame)`) to keep them longer.
+    """
+
+    def __init__(self, boundary: bytes | None = None, max_buffer: int = 8 << 20):
+        self.boundary = boundary
+        self.max_buffer = max_buffer
+
+        self._buffer = bytearray()
+        self._head = 0
+        self._scan = 0
+        self._frame_start = -1
+        self._expected_length: Optional[int] = None
+        self._views: List[memoryview] = []
+
+        self.frames_extracted = 0
+        self.bytes_discarded = 0
+
+    def reset(self) -> None:
+        self._release_views()
+        self._buffer = bytearray()
+        self._head = 0
+        self._scan = 0
+        self._frame_start = -1
+        self._expected_length = None
+
+    def feed(self, chunk: bytes | bytearray | memoryview) -> List[memoryview]:
+        self._release_views()
+        self._compact()
+
+        try:
+            self._buffer += chunk
+        except BufferError:
+            # A caller still holds a view of an old frame; detach from it.
+            self._buffer = bytearray(self._buffer)
+            self._buffer += chunk
+
+        frames: List[memoryview] = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+
+        if not frames and len(self._buffer) > self.max_buffer:
+            # No frame boundary in sight; drop everything rather than grow forever.
+            self.bytes_discarded += len(self._buffer)
+            self.reset()
+
+        self._views = frames
+        self.frames_extracted += len(frames)
+        return frames
+
+    def _release_views(self) -> None:
+        for view in self._views:
+            view.release()
+        self._views = []
+
+    def _compact(self) -> None:
+        cut = self._frame_start if self._frame_start != -1 else self._head
+        if cut <= 0:
+            return
+
+        try:
+            del self._buffer[:cut]
+        except BufferError:
+            self._buffer = bytearray(memoryview(self._buffer)[cut:])
+
+        self._head -= cut
+        self._scan -= cut
+        if self._frame_start != -1:
+            self._frame_start -= cut
+
+    def _next_frame(self) -> Optional[memoryview]:
+        buffer = self._buffer
+
+        if self._frame_start == -1:
+            start = buffer.find(SOI, self._scan)
+            if start == -1:
+                self._scan = max(self._scan, len(buffer) - len(SOI) + 1)
+                if self._scan - self._head > MAX_HEADER_SIZE:
+                    self.bytes_discarded += self._scan - MAX_HEADER_SIZE - self._head
+                    self._head = self._scan - MAX_HEADER_SIZE
+                return None
+
+            self._expected_length = self._content_length(self._head, start)
+            self._frame_start = start
+            self._scan = start + len(SOI)
+
+        start = self._frame_start
+
+        if self._expected_length is not None:
+            end = start + self._expected_length
+            if len(buffer) < end:
+                return None
+            next_head = end
+        elif self.boundary is not None:
+            found = buffer.find(self.boundary, self._scan)
+            if found == -1:
+                self._scan = max(self._scan, len(buffer) - len(self.boundary) + 1)
+                return None
+            eoi = buffer.rfind(EOI, start, found)
+            if eoi == -1:
+                # A part without a complete image in it; skip to the next one.
+                self._frame_start = -1
+                self._head = self._scan = found
+                return self._next_frame()
+            end = eoi + len(EOI)
+            next_head = found
+        else:
+            found = buffer.find(EOI, self._scan)
+            if found == -1:
+                self._scan = max(self._scan, len(buffer) - len(EOI) + 1)
+                return None
+            end = found + len(EOI)
+            next_head = end
+
+        self._frame_start = -1
+        self._expected_length = None
+        self._head = self._scan = next_head
+
+        return memoryview(buffer)[start:end]
+
+    def _content_length(self, header_start: int, frame_start: int) -> Optional[int]:
+        if frame_start <= header_start:
+            return None
+
+        match = _CONTENT_LENGTH.search(self._buffer, header_start, frame_start)
+        if not match:
+            return None
+
+        length = int(match.group(1))
+        return length if length > len(SOI) + len(EOI) else None
+
+
+def is_jpeg(frame: bytes | bytearray | memoryview) -> bool:
+    """
+    Cheap structural check used instead of a full decode on the ingest path.
+    """
+    return (
+        len(frame) > 4 and frame[:2] == SOI and frame[2] == 0xFF and frame[-2:] == EOI
+    )
@@ -0,0 +1,174 @@
+from typing import Dict, List
+
+from pydantic import BaseModel
+
+
+# Quality tiers, lowest first.
+TIERS: List[str] = ["basic", "standard", "high"]
+
+
+class ModelLimits(BaseModel):
+    requests_per_minute: int
+    requests_per_day: int
+    tokens_per_minute: int
+    tokens_per_day: int
+
+
+class ModelInfo(BaseModel):
+    name: str
+    tier: str
+    # Preference among models of the same tier, higher first.
+    quality: int = 0
+    vision: bool = False
+    # Expected latency in seconds until real calls have been measured.
+    latency_prior: float = 1.0
+    context_window: int = 8192
+    # USD per million tokens.
+    input_price: float = 0.0
+    output_price: float = 0.0
+    limits: ModelLimits | None = None
+    # Tried in order when the model is over its limits.
+    fallbacks: List[str] = []
+
+    @property
+    def tier_rank(self) -> int:
+        return TIERS.index(self.tier)
+
+
+MODELS: Dict[str, ModelInfo] = {
+    info.name: info
+    for info in [
+        ModelInfo(
+            name="llama-3.2-1b-preview",
+            tier="basic",
+            quality=1,
+            latency_prior=0.3,
+            input_price=0.04,
+            output_price=0.04,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=7000,
+                tokens_per_minute=7000,
+                tokens_per_day=500000,
+            ),
+        ),
+        ModelInfo(
+            name="llama-3.2-3b-preview",
+            tier="basic",
+            quality=2,
+            latency_prior=0.4,
+            input_price=0.06,
+            output_price=0.06,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=7000,
+                tokens_per_minute=7000,
+                tokens_per_day=500000,
+            ),
+        ),
+        ModelInfo(
+            name="mixtral-8x7b-32768",
+            tier="standard",
+            quality=1,
+            latency_prior=0.8,
+            context_window=32768,
+            input_price=0.24,
+            output_price=0.24,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=14400,
+                tokens_per_minute=5000,
+                tokens_per_day=500000,
+            ),
+        ),
+        ModelInfo(
+            name="llama3-groq-8b-8192-tool-use-preview",
+            tier="standard",
+            quality=2,
+            latency_prior=0.6,
+            input_price=0.19,
+            output_price=0.19,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=14400,
+                tokens_per_minute=20000,
+                tokens_per_day=500000,
+            ),
+            fallbacks=["llama-3.2-3b-preview"],
+        ),
+        ModelInfo(
+            name="llama3-8b-8192",
+            tier="standard",
+            quality=3,
+            latency_prior=0.5,
+            input_price=0.05,
+            output_price=0.08,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=14400,
+                tokens_per_minute=30000,
+                tokens_per_day=500000,
+            ),
+        ),
+        ModelInfo(
+            name="llama3-groq-70b-8192-tool-use-preview",
+            tier="high",
+            quality=1,
+            latency_prior=1.2,
+            input_price=0.89,
+            output_price=0.89,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=14400,
+                tokens_per_minute=6000,
+                tokens_per_day=200000,
+            ),
+            fallbacks=["llama3-groq-8b-8192-tool-use-preview"],
+        ),
+        ModelInfo(
+            name="llama-3.3-70b-versatile",
+            tier="high",
+            quality=2,
+            latency_prior=1.0,
+            context_window=32768,
+            input_price=0.59,
+            output_price=0.79,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=1000,
+                tokens_per_minute=6000,
+                tokens_per_day=100000,
+            ),
+            fallbacks=["llama3-groq-70b-8192-tool-use-preview"],
+        ),
+        ModelInfo(
+            name="llama-3.2-11b-vision-preview",
+            tier="standard",
+            vision=True,
+            latency_prior=1.5,
+            input_price=0.18,
+            output_price=0.18,
+            limits=ModelLimits(
+                requests_per_minute=30,
+                requests_per_day=7000,
+                tokens_per_minute=7000,
+                tokens_per_day=500000,
+            ),
+        ),
+        ModelInfo(
+            name="llama-3.2-90b-vision-preview",
+            tier="high",
+            vision=True,
+            latency_prior=3.0,
+            input_price=0.9,
+            output_price=0.9,
+            limits=ModelLimits(
+                requests_per_minute=15,
+                requests_per_day=3500,
+                tokens_per_minute=7000,
+                tokens_per_day=250000,
+            ),
+            fallbacks=["llama-3.2-11b-vision-preview"],
+        ),
+    ]
+}
@@ -0,0 +1,171 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from src.service.types.status import StageOccupancy
+
+
+class Idle:
+    """
+    Returned by a handler that found nothing to do, such as a source
+    polling an empty queue; the call counts as idle rather than as work.
+    """
+
+
+IDLE = Idle()
+
+
+class Stage:
+    """
+    One step of a pipeline, run by its own worker thread. Items are taken
+    from a bounded inbox and, once `ready` returns (it may wait for the
+    previous item's effects to settle), skipped when `stale` says they
+    are out of date, and whatever `handle` returns, unless None, is
+    passed to the next stage, waiting for room in its inbox. A stage
+    without an inbox is a source and calls `handle(None)` in a loop.
+
+    Busy time counts time spent in `handle` on real work, not calls that
+    return IDLE, and blocked time counts waiting in `ready` or for the
+    next stage; a stage that is mostly blocked sits in front of the
+    bottleneck, and the busiest stage is the bottleneck itself.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handle: Callable[[Any], Any],
+        capacity: int | None = 1,
+        ready: Callable[[threading.Event], bool] | None = None,
+        stale: Callable[[Any], bool] | None = None,
+        on_drop: Callable[[Any], None] | None = None,
+        on_error: Callable[[Exception], None] | None = None,
+    ):
+        self.name = name
+        self.handle = handle
+        self.ready = ready
+        self.stale = stale
+        self.on_drop = on_drop
+        self.on_error = on_error
+        self.inbox: Optional[queue.Queue[Any]] = (
+            queue.Queue(maxsize=capacity) if capacity else None
+        )
+        self.next: Optional[Stage] = None
+
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.started_at: float | None = None
+        self._lock = threading.Lock()
+
+    def put(self, item: Any, stop: threading.Event) -> bool:
+        assert self.inbox is not None
+        while not stop.is_set():
+            try:
+                self.inbox.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _next_item(self) -> tuple[bool, Any]:
+        if self.inbox is None:
+            return True, None
+        try:
+            return True, self.inbox.get(timeout=0.1)
+        except queue.Empty:
+            return False, None
+
+    def run(self, stop: threading.Event) -> None:
+        self.started_at = time.perf_counter()
+        while not stop.is_set():
+            ready, item = self._next_item()
+            if not ready:
+                continue
+
+            if self.ready:
+                waited = time.perf_counter()
+                settled = self.ready(stop)
+                with self._lock:
+                    self.blocked += time.perf_counter() - waited
+                if not settled:
+                    break
+
+            if self.stale and item is not None and self.stale(item):
+                with self._lock:
+                    self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(item)
+                continue
+
+            started = time.perf_counter()
+            try:
+                result = self.handle(item)
+            except Exception as e:
+                result = None
+                with self._lock:
+                    self.errors += 1
+                if self.on_error:
+                    self.on_error(e)
+            handled = time.perf_counter()
+            if result is IDLE:
+                continue
+            with self._lock:
+                self.busy += handled - started
+                self.processed += 1
+
+            if result is not None and self.next:
+                self.next.put(result, stop)
+                with self._lock:
+                    self.blocked += time.perf_counter() - handled
+
+    def occupancy(self) -> StageOccupancy:
+        with self._lock:
+            elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+            return StageOccupancy(
+                processed=self.processed,
+                dropped=self.dropped,
+                errors=self.errors,
+                queued=self.inbox.qsize() if self.inbox else 0,
+                capacity=self.inbox.maxsize if self.inbox else 0,
+                busy=round(self.busy / elapsed, 3) if elapsed else 0.0,
+                blocked=round(self.blocked / elapsed, 3) if elapsed else 0.0,
+                mean_ms=(
+                    round(self.busy / self.processed * 1000, 1)
+                    if self.processed
+                    else None
+                ),
+            )
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+        self._threads: List[threading.Thread] = []
+
+    def start(self, stop: threading.Event) -> None:
+        self._threads = [
+            threading.Thread(
+                target=stage.run, args=(stop,), name=f"stage-{stage.name}", daemon=True
+            )
+            for stage in self.stages
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def join(self, timeout: float | None = None) -> None:
+        """
+        Waits for every stage thread, at most `timeout` seconds in total.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(
+                None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+
+    def occupancy(self) -> dict[str, StageOccupancy]:
+        return {stage.name: stage.occupancy() for stage in self.stages}
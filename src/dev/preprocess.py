@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+
+from .reporting import Reporter
+
+
+class VariantSpec(BaseModel):
+    max_width: Optional[int] = None
+    grayscale: bool = False
+    quality: int = 90
+
+
+DEFAULT_VARIANTS: Dict[str, VariantSpec] = {
+    "reduced": VariantSpec(quality=60),
+    "small": VariantSpec(max_width=512, quality=75),
+    "gray": VariantSpec(max_width=512, grayscale=True, quality=75),
+}
+
+
+class PreprocessStats:
+    def __init__(self) -> None:
+        self.frames = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out: Dict[str, int] = {}
+        self.decode_seconds = 0.0
+        self.encode_seconds: Dict[str, float] = {}
+
+    def bytes_saved(self, variant: str) -> int:
+        return self.bytes_in - self.bytes_out.get(variant, self.bytes_in)
+
+    def as_dict(self) -> Dict[str, Any]:
+        frames = max(self.frames, 1)
+        return {
+            "frames": self.frames,
+            "failures": self.failures,
+            "avg_decode_ms": self.decode_seconds / frames * 1000,
+            "variants": {
+                name: {
+                    "avg_bytes": self.bytes_out[name] // frames,
+                    "bytes_saved": self.bytes_saved(name),
+                    "ratio": self.bytes_out[name] / max(self.bytes_in, 1),
+                    "avg_encode_ms": self.encode_seconds[name] / frames * 1000,
+                }
+                for name in self.bytes_out
+            },
+        }
+
+
+class FramePreprocessor:
+    """
+    Produces smaller JPEG variants of each ingested frame, once per frame,
+    so consumers such as the Actor can upload a cheaper image than the raw
+    camera frame without paying the encode cost on the request path.
+    """
+
+    def __init__(
+        self,
+        variants: Dict[str, VariantSpec] | None = None,
+        reporter: Reporter | None = None,
+        report_every: int = 500,
+    ):
+        self.variants = dict(DEFAULT_VARIANTS if variants is None else variants)
+        self.reporter = reporter
+        self.report_every = report_every
+
+        self.stats = PreprocessStats()
+        self._lock = threading.Lock()
+
+    def decode(self, frame: bytes) -> Optional[np.ndarray[Any, Any]]:
+        """
+        Decodes `frame`, counting the time and any failure in `stats`, also
+        when the caller decodes for its own use and passes the image on.
+        """
+        started = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+        decoded = image if image is not None and image.size else None
+
+        with self._lock:
+            self.stats.decode_seconds += time.perf_counter() - started
+            if decoded is None:
+                self.stats.failures += 1
+        return decoded
+
+    def resize(
+        self, image: np.ndarray[Any, Any], max_width: int | None
+    ) -> np.ndarray[Any, Any]:
+        height, width = image.shape[:2]
+        if not max_width or width <= max_width:
+            return image
+
+        return cv2.resize(
+            image,
+            (max_width, max(1, round(height * max_width / width))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    def encode_variant(self, image: np.ndarray[Any, Any], spec: VariantSpec) -> bytes:
+        """
+        Encodes an image that has already been resized to `spec.max_width`.
+        """
+        if spec.grayscale:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        ok, encoded = cv2.imencode(
+            ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, spec.quality]
+        )
+        if not ok:
+            raise ValueError("JPEG encoding failed.")
+        return encoded.tobytes()
+
+    def process(
+        self, frame: bytes, image: np.ndarray[Any, Any] | None = None
+    ) -> Dict[str, bytes]:
+        """
+        Returns the configured variants of `frame`. An image already decoded
+        with `decode` can be passed in to skip the decode. A variant that
+        would not be smaller than the raw frame is left out.
+        """
+        if not self.variants:
+            return {}
+
+        if image is None:
+            image = self.decode(frame)
+        if image is None:
+            return {}
+
+        results: Dict[str, bytes] = {}
+        timings: Dict[str, float] = {}
+        resized: Dict[int | None, np.ndarray[Any, Any]] = {}
+        for name, spec in self.variants.items():
+            started = time.perf_counter()
+            if spec.max_width not in resized:
+                resized[spec.max_width] = self.resize(image, spec.max_width)
+            encoded = self.encode_variant(resized[spec.max_width], spec)
+            timings[name] = time.perf_counter() - started
+            results[name] = encoded if len(encoded) < len(frame) else frame
+
+        with self._lock:
+            stats = self.stats
+            stats.frames += 1
+            stats.bytes_in += len(frame)
+            for name, encoded in results.items():
+                stats.bytes_out[name] = stats.bytes_out.get(name, 0) + len(encoded)
+                stats.encode_seconds[name] = (
+                    stats.encode_seconds.get(name, 0.0) + timings[name]
+                )
+            report = self.report_every and stats.frames % self.report_every == 0
+
+        if report and self.reporter:
+            self.reporter.log_info(f"Frame preprocessing: {self.stats.as_dict()}")
+
+        return {name: data for name, data in results.items() if data is not frame}
@@ -0,0 +1,762 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+import redis
+
+
+MINUTE = 60.0
+DAY = 86400.0
+# Window arithmetic is in floats; a shortfall below this counts as none.
+EPSILON = 1e-6
+
+
+class SlidingWindow:
+    """
+    Counts the requests and tokens taken in the last `period` seconds from
+    a log of timestamped entries, so no window of that length ever holds
+    more than `max_requests` or `max_tokens`. Refunds come off the oldest
+    entries first, which may keep capacity held a little longer than
+    needed but never releases it early. Entries a refund has emptied are
+    skipped from then on, so refunds cost amortised O(1).
+    """
+
+    def __init__(self, max_requests: int, max_tokens: int, period: float):
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.period = period
+        # [time, requests, tokens], oldest first.
+        self.entries: Deque[List[float]] = deque()
+        # The entries with requests and with tokens left to refund.
+        self.refundable: Tuple[Deque[List[float]], Deque[List[float]]] = (
+            deque(),
+            deque(),
+        )
+        self.requests = 0.0
+        self.tokens = 0.0
+
+    def expire(self, now: float) -> None:
+        horizon = now - self.period + EPSILON
+        while self.entries and self.entries[0][0] <= horizon:
+            _, requests, tokens = self.entries.popleft()
+            self.requests -= requests
+            self.tokens -= tokens
+        for refundable in self.refundable:
+            while refundable and refundable[0][0] <= horizon:
+                refundable.popleft()
+
+    def wait_time(self, requests: float, tokens: float, now: float) -> float:
+        self.expire(now)
+        if requests > self.max_requests or tokens > self.max_tokens:
+            return math.inf
+
+        over_requests = self.requests + requests - self.max_requests
+        over_tokens = self.tokens + tokens - self.max_tokens
+        if over_requests <= EPSILON and over_tokens <= EPSILON:
+            return 0.0
+
+        for at, used_requests, used_tokens in self.entries:
+            over_requests -= used_requests
+            over_tokens -= used_tokens
+            if over_requests <= EPSILON and over_tokens <= EPSILON:
+                return max(0.0, at + self.period - now)
+        return math.inf
+
+    def take(self, requests: float, tokens: float, now: float) -> None:
+        """
+        Logs what was taken at `now`; negative amounts are refunded.
+        """
+        self.expire(now)
+        if requests > 0 or tokens > 0:
+            entry = [now, max(0.0, requests), max(0.0, tokens)]
+            self.entries.append(entry)
+            for refundable, amount in zip(self.refundable, entry[1:]):
+                if amount > 0:
+                    refundable.append(entry)
+            self.requests += entry[1]
+            self.tokens += entry[2]
+        self.refund(max(0.0, -requests), max(0.0, -tokens))
+
+    def refund(self, requests: float, tokens: float) -> None:
+        for index, amount in ((1, requests), (2, tokens)):
+            refundable = self.refundable[index - 1]
+            while amount > 0 and refundable:
+                entry = refundable[0]
+                returned = min(entry[index], amount)
+                entry[index] -= returned
+                amount -= returned
+                if index == 1:
+                    self.requests -= returned
+                else:
+                    self.tokens -= returned
+                if entry[index] <= 0:
+                    refundable.popleft()
+
+
+class ModelWindows:
+    def __init__(self, limits: Dict[str, int]):
+        self.windows = [
+            SlidingWindow(
+                limits["requests_per_minute"], limits["tokens_per_minute"], MINUTE
+            ),
+            SlidingWindow(limits["requests_per_day"], limits["tokens_per_day"], DAY),
+        ]
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(window.wait_time(1, tokens, now) for window in self.windows)
+
+    def take(self, requests: int, tokens: int, now: float) -> None:
+        for window in self.windows:
+            window.take(requests, tokens, now)
+
+
+class QuotaBackend(ABC):
+    """
+    Where RateLimiter keeps its rate windows, usage counters and spend.
+    `limits` is the model's row of RateLimiter.MODEL_LIMITS.
+    """
+
+    @abstractmethod
+    def wait_time(self, model: str, tokens: int, limits: Dict[str, int]) -> float:
+        """
+        Seconds until one request of `tokens` fits every window.
+        """
+
+    @abstractmethod
+    def reserve(self, model: str, tokens: int, limits: Dict[str, int]) -> float:
+        """
+        Takes one request and `tokens` and returns 0 if they fit now;
+        otherwise takes nothing and returns `wait_time`.
+        """
+
+    @abstractmethod
+    def adjust(
+        self, model: str, requests: int, tokens: int, limits: Dict[str, int]
+    ) -> None:
+        """
+        Charges the windows whether or not it fits; negative amounts refund.
+        """
+
+    @abstractmethod
+    def record(self, model: str, requests: int, tokens: int, cost: float) -> float:
+        """
+        Adds to the model's usage and spend and returns the total spend.
+        """
+
+    @abstractmethod
+    def usage(self, model: str) -> Dict[str, int]:
+        pass
+
+    @abstractmethod
+    def expenses(self) -> Dict[str, float]:
+        pass
+
+    def total_spend(self) -> float:
+        return sum(self.expenses().values())
+
+    def close(self) -> None:
+        pass
+
+
+class LocalQuota(QuotaBackend):
+    """
+    Keeps everything in process memory. Only right for a single process;
+    the counts are lost on restart.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._windows: Dict[str, ModelWindows] = {}
+        self._usage: Dict[str, Dict[str, int]] = {}
+        self._expenses: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _model_windows(self, model: str, limits: Dict[str, int]) -> ModelWindows:
+        if model not in self._windows:
+            self._windows[model] = ModelWindows(limits)
+        return self._windows[model]
+
+    def wait_time(self, model: str, tokens: int, limits: Dict[str, int]) -> float:
+        with self._lock:
+            return self._model_windows(model, limits).wait_time(tokens, self.clock())
+
+    def reserve(self, model: str, tokens: int, limits: Dict[str, int]) -> float:
+        with self._lock:
+            windows = self._model_windows(model, limits)
+            now = self.clock()
+            wait = windows.wait_time(tokens, now)
+            if wait == 0:
+                windows.take(1, tokens, now)
+            return wait
+
+    def adjust(
+        self, model: str, requests: int, tokens: int, limits: Dict[str, int]
+    ) -> None:
+        with self._lock:
+            self._model_windows(model, limits).take(requests, tokens, self.clock())
+
+    def record(self, model: str, requests: int, tokens: int, cost: float) -> float:
+        with self._lock:
+            usage = self._usage.setdefault(
+                model, {"requests_used": 0, "tokens_used": 0}
+            )
+            usage["requests_used"] += requests
+            usage["tokens_used"] += tokens
+            self._expenses[model] = self._expenses.get(model, 0.0) + cost
+            return sum(self._expenses.values())
+
+    def usage(self, model: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._usage.get(model, {"requests_used": 0, "tokens_used": 0}))
+
+    def expenses(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._expenses)
+
+    def total_spend(self) -> float:
+        with self._lock:
+            return sum(self._expenses.values())
+
+
+# Keeps a model's minute and day windows as sliding-window logs, like
+# SlidingWindow. KEYS are the minute and day logs, sorted sets of
+# "seq:requests:tokens" scored by time, then a hash of their running
+# totals. ARGV: now, mode, requests, tokens, wanted requests, wanted
+# tokens, hold, then max requests, max tokens and period per window.
+# Mode 0 only reports the wait, mode 1 reserves and mode 2 charges
+# unconditionally, refunding negative amounts from the oldest entries.
+# The totals also hold, per window and amount, the score before which
+# refunds have emptied every entry, so later refunds start there.
+# Reserving grants up to the wanted amounts when the windows have room,
+# so a caller can lease a batch of quota in one round trip; a grant is
+# logged `hold` seconds late, as it may be spent until then. Returns the
+# wait, what was granted, the room left in the tighter window and when
+# the oldest entry leaves its window.
+WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local mode = tonumber(ARGV[2])
+local need = {tonumber(ARGV[3]), tonumber(ARGV[4])}
+local want = {tonumber(ARGV[5]), tonumber(ARGV[6])}
+local hold = tonumber(ARGV[7])
+local totals = KEYS[3]
+
+local function score_text(score)
+  if score == -math.huge then
+    return '-inf'
+  end
+  return string.format('%.6f', score)
+end
+
+local function parse(member)
+  local requests, tokens = string.match(member, '^[^:]+:([^:]+):([^:]+)$')
+  return {tonumber(requests), tonumber(tokens)}
+end
+
+local windows = {}
+local wait = 0
+for i = 1, 2 do
+  local window = {
+    key = KEYS[i],
+    max = {tonumber(ARGV[5 + 3 * i]), tonumber(ARGV[6 + 3 * i])},
+    period = tonumber(ARGV[7 + 3 * i]),
+    fields = {'requests' .. i, 'tokens' .. i},
+    cursor_fields = {'refunded_requests' .. i, 'refunded_tokens' .. i},
+  }
+  local used = redis.call(
+    'HMGET', totals, window.fields[1], window.fields[2],
+    window.cursor_fields[1], window.cursor_fields[2])
+  window.used = {tonumber(used[1]) or 0, tonumber(used[2]) or 0}
+  window.cursor = {tonumber(used[3]) or -math.huge, tonumber(used[4]) or -math.huge}
+
+  local horizon = now - window.period + 1e-6
+  for _, member in ipairs(redis.call('ZRANGEBYSCORE', window.key, '-inf', horizon)) do
+    local amounts = parse(member)
+    window.used[1] = window.used[1] - amounts[1]
+    window.used[2] = window.used[2] - amounts[2]
+  end
+  redis.call('ZREMRANGEBYSCORE', window.key, '-inf', horizon)
+
+  if mode ~= 2 then
+    local over = {window.used[1] + need[1] - window.max[1], window.used[2] + need[2] - window.max[2]}
+    if need[1] > window.max[1] or need[2] > window.max[2] then
+      wait = math.huge
+    elseif over[1] > 1e-6 or over[2] > 1e-6 then
+      local until_fits = math.huge
+      local entries = redis.call('ZRANGE', window.key, 0, -1, 'WITHSCORES')
+      for j = 1, #entries, 2 do
+        local amounts = parse(entries[j])
+        over[1] = over[1] - amounts[1]
+        over[2] = over[2] - amounts[2]
+        if over[1] <= 1e-6 and over[2] <= 1e-6 then
+          until_fits = math.max(0, tonumber(entries[j + 1]) + window.period - now)
+          break
+        end
+      end
+      wait = math.max(wait, until_fits)
+    end
+  end
+  windows[i] = window
+end
+
+local function finish(granted)
+  local room = {math.huge, math.huge}
+  local until_frees = math.huge
+  for _, window in ipairs(windows) do
+    for dim = 1, 2 do
+      room[dim] = math.min(room[dim], window.max[dim] - window.used[dim])
+    end
+    local oldest = redis.call('ZRANGE', window.key, 0, 0, 'WITHSCORES')
+    if #oldest > 0 then
+      until_frees = math.min(until_frees, tonumber(oldest[2]) + window.period)
+    end
+    redis.call(
+      'HSET', totals,
+      window.fields[1], tostring(window.used[1]),
+      window.fields[2], tostring(window.used[2]),
+      window.cursor_fields[1], score_text(window.cursor[1]),
+      window.cursor_fields[2], score_text(window.cursor[2]))
+  end
+  -- Every key lives as long as the longest window, so the totals never
+  -- outlive the logs they sum.
+  for _, key in ipairs(KEYS) do
+    redis.call('PEXPIRE', key, math.ceil((windows[2].period + hold) * 2000))
+  end
+  return {
+    tostring(wait), tostring(granted[1]), tostring(granted[2]),
+    tostring(room[1]), tostring(room[2]), tostring(until_frees),
+  }
+end
+
+if mode == 0 or (mode == 1 and wait > 0) then
+  return finish({0, 0})
+end
+
+local take = {need[1], need[2]}
+local at = now
+if mode == 1 then
+  for dim = 1, 2 do
+    local room = math.floor(math.min(windows[1].max[dim] - windows[1].used[dim], windows[2].max[dim] - windows[2].used[dim]))
+    take[dim] = math.max(need[dim], math.min(want[dim], room))
+  end
+  if take[1] > need[1] or take[2] > need[2] then
+    at = now + hold
+  end
+end
+
+local added = {math.max(0, take[1]), math.max(0, take[2])}
+if added[1] > 0 or added[2] > 0 then
+  local seq = redis.call('HINCRBY', totals, 'seq', 1)
+  local score = string.format('%.6f', at)
+  for _, window in ipairs(windows) do
+    redis.call('ZADD', window.key, score, seq .. ':' .. added[1] .. ':' .. added[2])
+    for dim = 1, 2 do
+      window.used[dim] = window.used[dim] + added[dim]
+      -- A lease is logged ahead of later entries, which refunds must reach.
+      if added[dim] > 0 then
+        window.cursor[dim] = math.min(window.cursor[dim], tonumber(score))
+      end
+    end
+  end
+end
+
+local refund = {math.max(0, -take[1]), math.max(0, -take[2])}
+if refund[1] > 0 or refund[2] > 0 then
+  for _, window in ipairs(windows) do
+    for dim = 1, 2 do
+      local left = refund[dim]
+      local from = score_text(window.cursor[dim])
+      local offset = 0
+      while left > 0 do
+        local entries = redis.call(
+          'ZRANGEBYSCORE', window.key, from, '+inf',
+          'WITHSCORES', 'LIMIT', offset, 64)
+        if #entries == 0 then
+          break
+        end
+        for j = 1, #entries, 2 do
+          local member = entries[j]
+          local amounts = parse(member)
+          local returned = math.min(amounts[dim], left)
+          if returned > 0 then
+            amounts[dim] = amounts[dim] - returned
+            left = left - returned
+            window.used[dim] = window.used[dim] - returned
+            local seq = string.match(member, '^([^:]+):')
+            redis.call('ZREM', window.key, member)
+            redis.call('ZADD', window.key, entries[j + 1], seq .. ':' .. amounts[1] .. ':' .. amounts[2])
+          end
+          if amounts[dim] > 0 then
+            break
+          end
+          -- Entries sharing this score may not be empty yet.
+          window.cursor[dim] = tonumber(entries[j + 1])
+        end
+        offset = offset + 64
+      end
+    end
+  end
+end
+
+return finish(take)
+"""
+
+# Adds usage and spend for any number of models and returns the total
+# spend. ARGV is model, requests, tokens and cost, repeated.
+RECORD_SCRIPT = """
+for i = 1, #ARGV, 4 do
+  redis.call('HINCRBY', KEYS[1], ARGV[i] .. ':requests', ARGV[i + 1])
+  redis.call('HINCRBY', KEYS[1], ARGV[i] .. ':tokens', ARGV[i + 2])
+  redis.call('HINCRBYFLOAT', KEYS[2], ARGV[i], ARGV[i + 3])
+end
+local total = 0
+for _, value in ipairs(redis.call('HVALS', KEYS[2])) do
+  total = total + tonumber(value)
+end
+return tostring(total)
+"""
+
+
+class Lease:
+    def __init__(self, requests: int, tokens: int, expires_at: float):
+        self.requests = requests
+        self.tokens = tokens
+        self.expires_at = expires_at
+
+
+class WindowState:
+    """
+    A model's windows as last seen in Redis: the room left in the tighter
+    window and when its oldest entry frees up.
+    """
+
+    def __init__(self, requests: float, tokens: float, until: float, at: float):
+        self.requests = requests
+        self.tokens = tokens
+        self.until = until
+        self.at = at
+
+
+class RedisQuota(QuotaBackend):
+    """
+    Shares the windows, usage and spend across every process using the
+    same Redis, updating them atomically with Lua scripts. `client` must
+    decode responses, like RedisCameraStore's. Window state
+    is timestamped with `clock`, which must be wall time that agrees
+    across machines.
+
+    With `lease_fraction` set, a process reserves that fraction of a
+    model's per-minute limits at once and admits calls from the lease
+    locally until it runs out or `lease_ttl` passes, when the unused part
+    is handed back. With `flush_interval` set, usage, spend and window
+    corrections are written behind in one batch per interval. Either way
+    the hot path mostly skips the round trip, at the cost of the fleet
+    seeing this process's usage a little late.
+
+    `wait_time` is answered from a lease, or from the window state the
+    last script call returned while it is under `state_ttl` old, and
+    only asks Redis otherwise. It may be optimistic by what other
+    processes took since; `reserve` always checks Redis. The total spend is kept
+    locally and refreshed by every record and flush, so checking the
+    spending limit never waits on Redis.
+    """
+
+    def __init__(
+        self,
+        client: redis.StrictRedis,
+        prefix: str = "quota:",
+        lease_fraction: float = 0.0,
+        lease_ttl: float = 1.0,
+        flush_interval: float = 0.0,
+        clock: Callable[[], float] = time.time,
+        state_ttl: float = 0.5,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.lease_fraction = lease_fraction
+        self.lease_ttl = lease_ttl
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.state_ttl = state_ttl
+
+        self._window = client.register_script(WINDOW_SCRIPT)
+        self._record = client.register_script(RECORD_SCRIPT)
+        self._usage_key = f"{prefix}usage"
+        self._spend_key = f"{prefix}spend"
+
+        self._leases: Dict[str, Lease] = {}
+        self._states: Dict[str, WindowState] = {}
+        self._limits: Dict[str, Dict[str, int]] = {}
+        self._pending_windows: Dict[str, List[int]] = {}
+        self._pending_records: Dict[str, List[float]] = {}
+        # Fleet usage as of the last flush, when writing behind.
+        self._usage_cache: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._total_spend = sum(self.expenses().values())
+
+        self._stop = threading.Event()
+        self._flusher: threading.Thread | None = None
+        if flush_interval > 0 or lease_fraction > 0:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="quota-flush", daemon=True
+            )
+            self._flusher.start()
+
+    def _keys(self, model: str) -> List[str]:
+        # The hash tag keeps a model's windows in one cluster slot.
+        base = f"{self.prefix}{{{model}}}"
+        return [f"{base}:minute", f"{base}:day", f"{base}:totals"]
+
+    def _run_window(
+        self,
+        model: str,
+        mode: int,
+        requests: int,
+        tokens: int,
+        limits: Dict[str, int],
+        want: Tuple[int, int] = (0, 0),
+        client: Any = None,
+        now: float | None = None,
+    ) -> Any:
+        return self._window(
+            keys=self._keys(model),
+            args=[
+                self.clock() if now is None else now,
+                mode,
+                requests,
+                tokens,
+                *want,
+                self.lease_ttl if self.lease_fraction > 0 else 0,
+                limits["requests_per_minute"],
+                limits["tokens_per_minute"],
+                MINUTE,
+                limits["requests_per_day"],
+                limits["tokens_per_day"],
+                DAY,
+            ],
+            client=client,
+        )
+
+    def _lease_covers(self, model: str, tokens: int) -> Lease | None:
+        lease = self._leases.get(model)
+        if lease is None:
+            return None
+        if lease.expires_at <= self.clock():
+            self._release(model)
+            return None
+        if lease.requests >= 1 and lease.tokens >= tokens:
+            return lease
+        return None
+
+    def _release(self, model: str) -> None:
+        lease = self._leases.pop(model)
+        self._queue_window(model, -lease.requests, -lease.tokens)
+
+    def _queue_window(self, model: str, requests: int, tokens: int) -> None:
+        pending = self._pending_windows.setdefault(model, [0, 0])
+        pending[0] += requests
+        pending[1] += tokens
+
+    def _remember(self, model: str, result: Any, now: float) -> None:
+        with self._lock:
+            self._states[model] = WindowState(
+                float(result[3]), float(result[4]), float(result[5]), now
+            )
+
+    def wait_time(self, model: str, tokens: int, limits: Dict[str, int]) -> float:
+        if tokens > limits["tokens_per_minute"]:
+            return math.inf
+        with self._lock:
+            if self._lease_covers(model, tokens):
+                return 0.0
+            now = self.clock()
+            state = self._states.get(model)
+            if state and now - state.at < self.state_ttl and now < state.until:
+                if state.requests >= 1 and state.tokens >= tokens:
+                    return 0.0
+                # Nothing frees up before then, though it may take longer.
+                return state.until - now
+
+        result = self._run_window(model, 0, 1, tokens, limits, now=now)
+        self._remember(model, result, now)
+        return float(result[0])
+
+    def reserve(self, model: str, tokens: int, limits: Dict[str, int]) -> float:
+        with self._lock:
+            self._limits[model] = limits
+            lease = self._lease_covers(model, tokens)
+            if lease:
+                lease.requests -= 1
+                lease.tokens -= tokens
+                return 0.0
+
+        want = (1, tokens)
+        if self.lease_fraction > 0:
+            want = (
+                max(1, int(limits["requests_per_minute"] * self.lease_fraction)),
+                max(tokens, int(limits["tokens_per_minute"] * self.lease_fraction)),
+            )
+
+        # A lease is logged as taken at its expiry, the last moment it is used.
+        now = self.clock()
+        result = self._run_window(model, 1, 1, tokens, limits, want, now=now)
+        self._remember(model, result, now)
+        wait = float(result[0])
+        if wait > 0:
+            return wait
+
+        granted_requests, granted_tokens = int(float(result[1])), int(float(result[2]))
+        if granted_requests > 1 or granted_tokens > tokens:
+            with self._lock:
+                if model in self._leases:
+                    self._release(model)
+                self._leases[model] = Lease(
+                    granted_requests - 1,
+                    granted_tokens - tokens,
+                    now + self.lease_ttl,
+                )
+        return 0.0
+
+    def adjust(
+        self, model: str, requests: int, tokens: int, limits: Dict[str, int]
+    ) -> None:
+        if self.flush_interval > 0:
+            with self._lock:
+                self._limits[model] = limits
+                self._queue_window(model, requests, tokens)
+            return
+        now = self.clock()
+        self._remember(
+            model, self._run_window(model, 2, requests, tokens, limits, now=now), now
+        )
+
+    def record(self, model: str, requests: int, tokens: int, cost: float) -> float:
+        if self.flush_interval > 0:
+            with self._lock:
+                pending = self._pending_records.setdefault(model, [0, 0, 0.0])
+                pending[0] += requests
+                pending[1] += tokens
+                pending[2] += cost
+                self._total_spend += cost
+                return self._total_spend
+
+        total = float(
+            self._record(
+                keys=[self._usage_key, self._spend_key],
+                args=[model, requests, tokens, cost],
+            )
+        )
+        with self._lock:
+            self._total_spend = total
+        return total
+
+    def flush(self) -> None:
+        """
+        Writes pending usage, spend and window corrections in one batch,
+        and refreshes the cached fleet usage and spend.
+        """
+        with self._lock:
+            now = self.clock()
+            for model in [
+                model
+                for model, lease in self._leases.items()
+                if lease.expires_at <= now
+            ]:
+                self._release(model)
+            windows, self._pending_windows = self._pending_windows, {}
+            records, self._pending_records = self._pending_records, {}
+            limits = dict(self._limits)
+            flushed_spend = self._total_spend
+
+        pipeline = self.client.pipeline(transaction=False)
+        for model, (requests, tokens) in windows.items():
+            self._run_window(model, 2, requests, tokens, limits[model], client=pipeline)
+        if records:
+            args: List[Any] = []
+            for model, record in records.items():
+                args += [model, int(record[0]), int(record[1]), record[2]]
+            self._record(
+                keys=[self._usage_key, self._spend_key], args=args, client=pipeline
+            )
+
+        else:
+            pipeline.hvals(self._spend_key)
+        pipeline.hgetall(self._usage_key)
+
+        try:
+            results = pipeline.execute()
+        except redis.RedisError:
+            with self._lock:
+                for model, (requests, tokens) in windows.items():
+                    self._queue_window(model, requests, tokens)
+                for model, record in records.items():
+                    pending = self._pending_records.setdefault(model, [0, 0, 0.0])
+                    for index, value in enumerate(record):
+                        pending[index] += value
+            raise
+
+        spend = (
+            float(results[-2])
+            if records
+            else sum(float(value) for value in results[-2])
+        )
+        with self._lock:
+            # Keep what was recorded while the batch was in flight.
+            self._total_spend = spend + self._total_spend - flushed_spend
+            self._usage_cache = {
+                str(field): int(value) for field, value in results[-1].items()
+            }
+
+    def _flush_loop(self) -> None:
+        interval = self.flush_interval or self.lease_ttl
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except redis.RedisError:
+                pass
+
+    def usage(self, model: str) -> Dict[str, int]:
+        fields = [f"{model}:requests", f"{model}:tokens"]
+        if self.flush_interval > 0:
+            with self._lock:
+                used = [self._usage_cache.get(field, 0) for field in fields]
+        else:
+            used = [
+                int(value or 0) for value in self.client.hmget(self._usage_key, fields)
+            ]
+        with self._lock:
+            pending = self._pending_records.get(model, [0, 0, 0.0])
+        return {
+            "requests_used": used[0] + int(pending[0]),
+            "tokens_used": used[1] + int(pending[1]),
+        }
+
+    def total_spend(self) -> float:
+        """
+        The fleet's spend as of the last flush or record, plus this
+        process's since, without a round trip.
+        """
+        with self._lock:
+            return self._total_spend
+
+    def expenses(self) -> Dict[str, float]:
+        expenses = {
+            str(model): float(value)
+            for model, value in self.client.hgetall(self._spend_key).items()
+        }
+        with self._lock:
+            for model, record in self._pending_records.items():
+                expenses[model] = expenses.get(model, 0.0) + record[2]
+        return expenses
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher:
+            self._flusher.join()
+        with self._lock:
+            for model in list(self._leases):
+                self._release(model)
+        # Flush synchronously even when not batching, to return the leases.
+        self.flush()
@@ -1,110 +1,151 @@
-from typing import Any, Dict, List
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
 
+from .models import MODELS, ModelInfo
+from .quota import LocalQuota, QuotaBackend
 from .reporting import Reporter
+from .tokens import TokenEstimator
+from src.service.types.misc import ModelUsage, UsageReport
+
+
+class RateLimitExceeded(RuntimeError):
+    pass
+
+
+def completion_usage(completion: Any) -> Tuple[int, int] | None:
+    """
+    Prompt and completion tokens reported on a ChatCompletion, or on the
+    last chunk of a stream.
+    """
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        x_groq = getattr(completion, "x_groq", None)
+        usage = getattr(x_groq, "usage", None)
+    if usage is None:
+        return None
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
 
 
 class RateLimiter:
+    """
+    Tracks spending and enforces each model's request and token limits
+    with per-minute and per-day sliding windows. `acquire` and `aacquire`
+    wait just long enough for a request to fit; `check_rate_limit` only
+    says whether it fits now. `clock`, `sleep` and `async_sleep` can be
+    replaced to drive the limiter with a simulated clock.
+
+    The windows, usage and spend live in `quota`, in process memory by
+    default; a RedisQuota shares them across processes.
+    """
+
     def __init__(
         self,
         currency_conversion_rate: float = 1.5,
         tax_rate: float = 0.15,
         reporter: Reporter | None = None,
         max_spend_cad: float = 20.0,
+        estimator: TokenEstimator | None = None,
+        max_wait: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        quota: QuotaBackend | None = None,
+        models: Dict[str, ModelInfo] | None = None,
     ):
+        self.models = dict(MODELS if models is None else models)
+        tracked = {
+            name: info for name, info in self.models.items() if info.limits is not None
+        }
+
+        # Per million tokens.
         self.MODEL_PRICING_USD: Dict[str, Dict[str, float]] = {
-            "llama3_groq_70b_tool_use_preview": {"input": 0.89, "output": 0.89},
-            "llama3_groq_8b_tool_use_preview": {"input": 0.19, "output": 0.19},
-            "llama32_1b_preview": {"input": 0.04, "output": 0.04},
-            "llama32_3b_preview": {"input": 0.06, "output": 0.06},
-            "llama32_90b_vision_preview": {"input": 0.9, "output": 0.9},
-            "llama32_11b_vision_preview": {"input": 0.18, "output": 0.18},
-            "llama33_70b_versatile": {"input": 0.59, "output": 0.79},
+            name: {"input": info.input_price, "output": info.output_price}
+            for name, info in tracked.items()
         }
 
         self.MODEL_LIMITS: Dict[str, Dict[str, int]] = {
-            "llama3_groq_70b_tool_use_preview": {
-                "requests_per_minute": 30,
-                "requests_per_day": 14400,
-                "tokens_per_minute": 6000,
-                "tokens_per_day": 200000,
-            },
-            "llama3_groq_8b_tool_use_preview": {
-                "requests_per_minute": 30,
-                "requests_per_day": 14400,
-                "tokens_per_minute": 20000,
-                "tokens_per_day": 500000,
-            },
-            "llama32_1b_preview": {
-                "requests_per_minute": 30,
-                "requests_per_day": 7000,
-                "tokens_per_minute": 7000,
-                "tokens_per_day": 500000,
-            },
-            "llama32_3b_preview": {
-                "requests_per_minute": 30,
-                "requests_per_day": 7000,
-                "tokens_per_minute": 7000,
-                "tokens_per_day": 500000,
-            },
-            "llama32_90b_vision_preview": {
-                "requests_per_minute": 15,
-                "requests_per_day": 3500,
-                "tokens_per_minute": 7000,
-                "tokens_per_day": 250000,
-            },
-            "llama32_11b_vision_preview": {
-                "requests_per_minute": 30,
-                "requests_per_day": 7000,
-                "tokens_per_minute": 7000,
-                "tokens_per_day": 500000,
-            },
-            "llama33_70b_versatile": {
-                "requests_per_minute": 30,
-                "requests_per_day": 1000,
-                "tokens_per_minute": 6000,
-                "tokens_per_day": 100000,
-            },
+            name: info.limits.model_dump()
+            for name, info in tracked.items()
+            if info.limits is not None
         }
 
         self.currency_conversion_rate = currency_conversion_rate
         self.tax_rate = tax_rate
         self.reporter = reporter if reporter else Reporter()
         self.max_spend_cad = max_spend_cad
-
-        self.model_usage: Dict[str, Dict[str, int]] = {
-            model: {
-                "tokens_used": 0,
-                "tokens_max": self.MODEL_LIMITS[model]["tokens_per_day"],
-                "requests_used": 0,
-                "requests_max": self.MODEL_LIMITS[model]["requests_per_day"],
-            }
-            for model in self.MODEL_PRICING_USD.keys()
-        }
+        self.estimator = estimator or TokenEstimator()
+        # How long wrap_model_call waits for a model with no fallback.
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.quota = quota or LocalQuota(clock)
 
         self.fallbacks: Dict[str, List[str]] = {
-            "llama3_groq_70b_tool_use_preview": ["llama3_groq_8b_tool_use_preview"],
-            "llama3_groq_8b_tool_use_preview": ["llama32_3b_preview"],
-            "llama32_1b_preview": [],
-            "llama32_3b_preview": [],
-            "llama32_90b_vision_preview": ["llama32_11b_vision_preview"],
-            "llama32_11b_vision_preview": [],
-            "llama33_70b_versatile": ["llama3_groq_70b_tool_use_preview"],
+            name: [fallback for fallback in info.fallbacks if fallback in tracked]
+            for name, info in tracked.items()
         }
 
-        self.expenses: Dict[str, float] = {
-            model: 0.0 for model in self.MODEL_PRICING_USD.keys()
-        }
+    @property
+    def model_usage(self) -> Dict[str, Dict[str, int]]:
+        return {model: self.get_usage(model) for model in self.MODEL_PRICING_USD}
+
+    @property
+    def expenses(self) -> Dict[str, float]:
+        expenses = self.quota.expenses()
+        return {model: expenses.get(model, 0.0) for model in self.MODEL_PRICING_USD}
+
+    def track_usage(
+        self,
+        model: str,
+        tokens_input: int,
+        tokens_output: int,
+        reserved_tokens: int | None = None,
+    ) -> None:
+        """
+        Records a finished call. When it was admitted with `acquire`, pass
+        the tokens reserved there so only the difference from the actual
+        usage is charged to the windows.
+        """
+        total_spent = self.record_usage(
+            model, tokens_input, tokens_output, reserved_tokens
+        )
+        if total_spent > self.max_spend_cad:
+            self.reporter.log_error(message="Maximum spending limit reached.")
+            raise RuntimeError("Spending limit exceeded.")
 
-    def track_usage(self, model: str, tokens_input: int, tokens_output: int) -> None:
-        if model not in self.model_usage:
+    def record_usage(
+        self,
+        model: str,
+        tokens_input: int,
+        tokens_output: int,
+        reserved_tokens: int | None = None,
+    ) -> float:
+        """
+        `track_usage` for a call whose answer has already been paid for:
+        the spending limit is enforced by the next admission instead of by
+        raising. Returns the total spend.
+        """
+        if model not in self.MODEL_PRICING_USD:
             raise ValueError(f"Model {model} not found in tracking system.")
 
-        usage = self.model_usage[model]
         pricing = self.MODEL_PRICING_USD[model]
+        limits = self.MODEL_LIMITS[model]
+        tokens = tokens_input + tokens_output
 
-        usage["tokens_used"] += tokens_input + tokens_output
-        usage["requests_used"] += 1
+        if reserved_tokens is None:
+            self.quota.adjust(model, 1, tokens, limits)
+        elif tokens != reserved_tokens:
+            self.quota.adjust(model, 0, tokens - reserved_tokens, limits)
+
+        cost_usd = (
+            tokens_input * pricing["input"] + tokens_output * pricing["output"]
+        ) / 1_000_000
+        cost_cad = cost_usd * self.currency_conversion_rate * (1 + self.tax_rate)
+        total_spent = self.quota.record(model, 1, tokens, cost_cad)
 
+        usage = self.get_usage(model)
         if usage["tokens_used"] > usage["tokens_max"] * 0.9:
             self.reporter.log_warning(message=f"Model {model} is close to token limit.")
         if usage["requests_used"] > usage["requests_max"] * 0.9:
@@ -112,47 +153,58 @@ class RateLimiter:
                 message=f"Model {model} is close to request limit."
             )
 
-        cost_usd = (
-            tokens_input * pricing["input"] + tokens_output * pricing["output"]
-        ) / 1000
-        cost_cad = cost_usd * self.currency_conversion_rate * (1 + self.tax_rate)
-        self.expenses[model] += cost_cad
-
-        total_spent = sum(self.expenses.values())
         if total_spent > self.max_spend_cad * 0.8:
             self.reporter.log_warning(
                 message="Total spending is close to the maximum limit."
             )
-        if total_spent > self.max_spend_cad:
-            self.reporter.log_error(message="Maximum spending limit reached.")
-            raise RuntimeError("Spending limit exceeded.")
 
         self.reporter.log_info(
             f"Tracked usage for model {model}: {tokens_input} input tokens, {tokens_output} output tokens."
         )
+        return total_spent
 
     def get_usage(self, model: str) -> Dict[str, int]:
-        if model not in self.model_usage:
+        if model not in self.MODEL_PRICING_USD:
             raise ValueError(f"Model {model} not found in tracking system.")
-        return self.model_usage[model]
+        return {
+            **self.quota.usage(model),
+            "tokens_max": self.MODEL_LIMITS[model]["tokens_per_day"],
+            "requests_max": self.MODEL_LIMITS[model]["requests_per_day"],
+        }
 
     def get_expenses(self) -> Dict[str, float]:
         return self.expenses
 
-    def check_rate_limit(self, model: str) -> bool:
-        if model not in self.model_usage:
-            raise ValueError(f"Model {model} not found in tracking system.")
-
-        usage = self.model_usage[model]
-        limits = self.MODEL_LIMITS[model]
+    def total_spent(self) -> float:
+        return self.quota.total_spend()
 
-        within_minute_token_limit = usage["tokens_used"] <= limits["tokens_per_minute"]
-        within_daily_token_limit = usage["tokens_used"] <= usage["tokens_max"]
+    def report(self) -> UsageReport:
+        expenses = self.expenses
+        return UsageReport(
+            models={
+                model: ModelUsage(
+                    **self.get_usage(model), spend_cad=round(expenses[model], 4)
+                )
+                for model in self.MODEL_LIMITS
+            },
+            total_spend_cad=round(sum(expenses.values()), 4),
+            max_spend_cad=self.max_spend_cad,
+        )
 
-        within_minute_request_limit = (
-            usage["requests_used"] <= limits["requests_per_minute"]
+    def estimate_call(self, kwargs: Dict[str, Any]) -> int:
+        """
+        Tokens a chat completion call with `kwargs` may use, so the limits
+        can be checked before it is sent rather than after it is rejected.
+        """
+        return self.estimator.estimate_request(
+            list(kwargs.get("messages") or []), int(kwargs.get("max_tokens") or 0)
         )
-        within_daily_request_limit = usage["requests_used"] <= usage["requests_max"]
+
+    def check_rate_limit(self, model: str, est_tokens: int = 0) -> bool:
+        if model not in self.MODEL_PRICING_USD:
+            raise ValueError(f"Model {model} not found in tracking system.")
+
+        usage = self.get_usage(model)
 
         if usage["tokens_used"] > usage["tokens_max"] * 0.8:
             self.reporter.log_warning(
@@ -163,20 +215,106 @@ class RateLimiter:
                 message=f"Model {model} is close to its daily request limit."
             )
 
-        return (
-            within_minute_token_limit
-            and within_daily_token_limit
-            and within_minute_request_limit
-            and within_daily_request_limit
+        return self.wait_time(model, est_tokens) == 0
+
+    def wait_time(self, model: str, est_tokens: int = 0) -> float:
+        """
+        Seconds until a request of `est_tokens` fits within every limit.
+        """
+        return self.quota.wait_time(model, est_tokens, self.MODEL_LIMITS[model])
+
+    def _try_acquire(self, model: str, est_tokens: int) -> float:
+        if model not in self.MODEL_LIMITS:
+            raise ValueError(f"Model {model} not found in tracking system.")
+
+        limits = self.MODEL_LIMITS[model]
+        if est_tokens > limits["tokens_per_minute"]:
+            raise ValueError(
+                f"Request of {est_tokens} tokens can never fit the {model} limit."
+            )
+        return self.quota.reserve(model, est_tokens, limits)
+
+    def acquire(
+        self, model: str, est_tokens: int = 0, timeout: float | None = None
+    ) -> bool:
+        """
+        Reserves one request and `est_tokens` tokens of `model`, sleeping
+        until they fit. Returns False, without reserving, when that would
+        take longer than `timeout` seconds.
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self._try_acquire(model, est_tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            self.sleep(wait)
+
+    async def aacquire(
+        self, model: str, est_tokens: int = 0, timeout: float | None = None
+    ) -> bool:
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self._try_acquire(model, est_tokens)
+            if wait == 0:
+                return True
+            if deadline is not None and self.clock() + wait > deadline:
+                return False
+            await self.async_sleep(wait)
+
+    def _admission(self, model: str, est_tokens: int) -> str | None:
+        if model not in self.MODEL_LIMITS:
+            return model
+        if self.total_spent() > self.max_spend_cad:
+            raise RateLimitExceeded("Spending limit exceeded.")
+
+        for candidate in [model, *self.fallbacks[model]]:
+            if self.acquire(candidate, est_tokens, timeout=0):
+                if candidate != model:
+                    self.reporter.log_info(
+                        message=f"Using fallback model {candidate} for {model}."
+                    )
+                return candidate
+        return None
+
+    def _reject(self, model: str, est_tokens: int) -> RateLimitExceeded:
+        self.reporter.log_error(
+            message=f"Rate limit exceeded for model {model} ({est_tokens} tokens requested) and no fallback available."
+        )
+        return RateLimitExceeded(
+            f"Rate limit exceeded for model {model} and no fallback available."
         )
 
-    def get_fallback_model(self, model: str) -> str | None:
+    def admit(self, model: str, est_tokens: int = 0) -> str:
+        """
+        Reserves a call of `est_tokens` to `model`, or to a fallback that
+        fits right away, before it is sent. Otherwise waits up to
+        `max_wait` for `model` itself. Returns the model to call; raises
+        RateLimitExceeded rather than send a call that would be rejected.
+        """
+        admitted = self._admission(model, est_tokens)
+        if admitted:
+            return admitted
+        if self.acquire(model, est_tokens, timeout=self.max_wait):
+            return model
+        raise self._reject(model, est_tokens)
+
+    async def aadmit(self, model: str, est_tokens: int = 0) -> str:
+        admitted = self._admission(model, est_tokens)
+        if admitted:
+            return admitted
+        if await self.aacquire(model, est_tokens, timeout=self.max_wait):
+            return model
+        raise self._reject(model, est_tokens)
+
+    def get_fallback_model(self, model: str, est_tokens: int = 0) -> str | None:
         if model not in self.fallbacks:
             raise ValueError(f"Model {model} not found in fallback system.")
 
         fallbacks = self.fallbacks[model]
         for fallback in fallbacks:
-            if self.check_rate_limit(fallback):
+            if self.check_rate_limit(fallback, est_tokens):
                 self.reporter.log_info(
                     message=f"Using fallback model {fallback} for {model}."
                 )
@@ -187,35 +325,21 @@ class RateLimiter:
     def wrap_model_call(
         self, model: str, func: Any, *args: tuple[Any, ...], **kwargs: tuple[Any, ...]
     ) -> Any:
-        if not self.check_rate_limit(model):
-            fallback = self.get_fallback_model(model)
-            if fallback:
-                self.reporter.log_info(
-                    message=f"Switching to fallback model: {fallback}"
-                )
-                model = fallback
-            else:
-                self.reporter.log_error(
-                    message=f"Rate limit exceeded for model {model} and no fallback available."
-                )
-                raise RuntimeError(
-                    f"Rate limit exceeded for model {model} and no fallback available."
-                )
-
-        if "model" in kwargs:
-            kwargs["model"] = model  # type: ignore
-        else:
-            kwargs.update({"model": model})  # type: ignore
+        """
+        Calls `func`, such as a Groq client's `chat.completions.create`,
+        with `model` once admitted and tracks the usage on the completion
+        it returns. BaseBrain and Actor admit their own calls, so they must
+        not be wrapped.
+        """
+        est_tokens = self.estimate_call(kwargs)
+        model = self.admit(model, est_tokens)
 
-        if "verbose_results" in kwargs:
-            kwargs["verbose_results"] = True  # type: ignore
-        else:
-            kwargs.update({"verbose_results": True})  # type: ignore
+        kwargs["model"] = model  # type: ignore
 
         result = func(*args, **kwargs)
 
-        tokens_input = result.get("usage", {}).get("prompt_tokens", 0)
-        tokens_output = result.get("usage", {}).get("completion_tokens", 0)
-        self.track_usage(model, tokens_input, tokens_output)
+        usage = completion_usage(result)
+        if usage:
+            self.track_usage(model, *usage, reserved_tokens=est_tokens)
 
         return result
@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from .models import MODELS, TIERS, ModelInfo
+from .ratelimiter import RateLimiter
+from src.service.types.misc import ModelRouteStats
+
+
+class ModelStats:
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.last_error_at: Optional[float] = None
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ModelRouter:
+    """
+    Picks a model for a call from its quality tier and latency budget,
+    using rolling latency percentiles and error rates measured on real
+    calls rather than a static fallback list.
+
+    Models of the requested tier are preferred, then lower tiers, and the
+    first one expected to meet the budget wins. Until a model has
+    `min_samples` measurements its registry prior stands in. A model whose
+    recent error rate exceeds `max_error_rate` is skipped for
+    `error_cooldown` seconds after its last failure, and models RateLimiter
+    reports over quota are skipped outright.
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, ModelInfo] | None = None,
+        window: int = 100,
+        percentile: float = 0.9,
+        min_samples: int = 5,
+        max_error_rate: float = 0.5,
+        error_cooldown: float = 30.0,
+        limiter: RateLimiter | None = None,
+    ):
+        self.models = dict(MODELS if models is None else models)
+        self.window = window
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.error_cooldown = error_cooldown
+        self.limiter = limiter
+
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _model_stats(self, model: str) -> ModelStats:
+        if model not in self._stats:
+            self._stats[model] = ModelStats(self.window)
+        return self._stats[model]
+
+    def record(self, model: str, latency: float | None, ok: bool = True) -> None:
+        with self._lock:
+            stats = self._model_stats(model)
+            stats.outcomes.append(ok)
+            if ok and latency is not None:
+                stats.latencies.append(latency)
+            if not ok:
+                stats.last_error_at = time.time()
+
+    def latency_percentile(self, model: str, q: float) -> Optional[float]:
+        """
+        Observed latency percentile, or None until `min_samples` exist.
+        """
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None or len(stats.latencies) < self.min_samples:
+                return None
+            return stats.percentile(q)
+
+    def expected_latency(self, model: str) -> float:
+        observed = self.latency_percentile(model, self.percentile)
+        return observed if observed is not None else self.models[model].latency_prior
+
+    def healthy(self, model: str) -> bool:
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None or len(stats.outcomes) < self.min_samples:
+                return True
+            if stats.error_rate <= self.max_error_rate:
+                return True
+            return (
+                stats.last_error_at is None
+                or time.time() - stats.last_error_at > self.error_cooldown
+            )
+
+    def available(self, model: str, est_tokens: int = 0) -> bool:
+        if self.limiter is None or model not in self.limiter.MODEL_LIMITS:
+            return True
+        return self.limiter.check_rate_limit(model, est_tokens)
+
+    def candidates(self, tier: str = "standard", vision: bool = False) -> List[str]:
+        """
+        Models that may serve a call of `tier`, most preferred first.
+        """
+        rank = TIERS.index(tier)
+        eligible = [
+            info
+            for info in self.models.values()
+            if info.vision == vision and info.tier_rank <= rank
+        ]
+        eligible.sort(key=lambda info: (info.tier_rank, info.quality), reverse=True)
+        return [info.name for info in eligible]
+
+    def faster_alternative(self, model: str) -> Optional[str]:
+        """
+        The usable model of the same kind and no higher tier that is
+        expected to answer fastest, if it is faster than `model`.
+        """
+        info = self.models[model]
+        alternatives = [
+            other
+            for other in self.candidates(info.tier, info.vision)
+            if other != model and self.healthy(other) and self.available(other)
+        ]
+        if not alternatives:
+            return None
+
+        fastest = min(alternatives, key=self.expected_latency)
+        if self.expected_latency(fastest) >= self.expected_latency(model):
+            return None
+        return fastest
+
+    def choose(
+        self,
+        tier: str = "standard",
+        latency_budget: float | None = None,
+        vision: bool = False,
+        est_tokens: int = 0,
+    ) -> str:
+        candidates = self.candidates(tier, vision)
+        if not candidates:
+            raise ValueError(f"No {'vision ' if vision else ''}model for tier {tier}.")
+
+        usable = [
+            model
+            for model in candidates
+            if self.healthy(model) and self.available(model, est_tokens)
+        ] or candidates
+
+        if latency_budget is None:
+            return usable[0]
+
+        for model in usable:
+            if self.expected_latency(model) <= latency_budget:
+                return model
+
+        # Nothing is expected to make the budget; get as close as possible.
+        return min(usable, key=self.expected_latency)
+
+    def snapshot(self) -> Dict[str, ModelRouteStats]:
+        result = {}
+        for name, info in self.models.items():
+            with self._lock:
+                stats = self._stats.get(name)
+                p50 = stats.percentile(0.5) if stats else None
+                p90 = stats.percentile(0.9) if stats else None
+                samples = len(stats.latencies) if stats else 0
+                error_rate = stats.error_rate if stats else 0.0
+
+            result[name] = ModelRouteStats(
+                tier=info.tier,
+                vision=info.vision,
+                samples=samples,
+                p50_ms=round(p50 * 1000, 1) if p50 is not None else None,
+                p90_ms=round(p90 * 1000, 1) if p90 is not None else None,
+                expected_ms=round(self.expected_latency(name) * 1000, 1),
+                error_rate=round(error_rate, 3),
+                healthy=self.healthy(name),
+            )
+        return result
@@ -0,0 +1,99 @@
+import threading
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+
+
+HASH_SIZE = 8
+
+
+def dhash(gray: np.ndarray[Any, Any]) -> int:
+    """
+    64-bit difference hash of a grayscale image: each bit records whether a
+    pixel is brighter than its right-hand neighbour on a 9x8 thumbnail.
+    """
+    small = cv2.resize(gray, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def decode_gray(frame: bytes) -> Optional[np.ndarray[Any, Any]]:
+    # The reduced decode skips most of the IDCT work; hashing needs very little detail.
+    image = cv2.imdecode(
+        np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4
+    )
+    return image if image is not None and image.size else None
+
+
+class SceneChange:
+    __slots__ = ("phash", "score", "distance", "changed")
+
+    def __init__(self, phash: int, score: float, distance: int, changed: bool):
+        self.phash = phash
+        self.score = score
+        self.distance = distance
+        self.changed = changed
+
+
+class SceneChangeDetector:
+    """
+    Decides whether a frame shows a different scene from the last frame that
+    was considered a change.
+
+    Two signals are combined: the Hamming distance between perceptual hashes,
+    which ignores noise and small exposure shifts, and the mean absolute
+    difference of a small blurred thumbnail, which catches local changes the
+    hash is too coarse for. Frames are compared against the last changed
+    frame rather than the previous one, so slow drift still accumulates into
+    a change.
+    """
+
+    def __init__(
+        self,
+        hash_threshold: int = 10,
+        diff_threshold: float = 0.06,
+        thumbnail_size: tuple[int, int] = (64, 48),
+    ):
+        self.hash_threshold = hash_threshold
+        self.diff_threshold = diff_threshold
+        self.thumbnail_size = thumbnail_size
+
+        self._reference_hash: Optional[int] = None
+        self._reference_thumb: Optional[np.ndarray[Any, Any]] = None
+        self._lock = threading.Lock()
+
+    def thumbnail(self, gray: np.ndarray[Any, Any]) -> np.ndarray[Any, Any]:
+        thumb = cv2.resize(gray, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        thumb = cv2.GaussianBlur(thumb, (3, 3), 0)
+        return thumb.astype(np.float32) / 255.0
+
+    def observe(self, gray: np.ndarray[Any, Any]) -> SceneChange:
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+
+        phash = dhash(gray)
+        thumb = self.thumbnail(gray)
+
+        with self._lock:
+            if self._reference_hash is None or self._reference_thumb is None:
+                distance, score, changed = HASH_SIZE * HASH_SIZE, 1.0, True
+            else:
+                distance = hamming(phash, self._reference_hash)
+                score = float(np.mean(np.abs(thumb - self._reference_thumb)))
+                changed = distance > self.hash_threshold or score > self.diff_threshold
+
+            if changed:
+                self._reference_hash = phash
+                self._reference_thumb = thumb
+
+        return SceneChange(phash, score, distance, changed)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._reference_hash = None
+            self._reference_thumb = None
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    call and everyone arriving while it is in flight gets the same result.
+    Nothing is remembered once the call finishes; that is the cache's job.
+
+    Blocking callers share a Future. Async callers share a task on their
+    event loop, and are shielded from each other's cancellation.
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.shared = 0
+
+        self._futures: Dict[str, Future[Any]] = {}
+        self._tasks: Dict[Tuple[int, str], asyncio.Future[Any]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            self.calls += 1
+            future = self._futures.get(key)
+            leader = future is None
+            if future is None:
+                future = self._futures[key] = Future()
+            else:
+                self.shared += 1
+
+        if not leader:
+            result: T = future.result()
+            return result
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        loop_key = (id(asyncio.get_running_loop()), key)
+
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(loop_key)
+            if task is None:
+                task = self._tasks[loop_key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda _: self._forget(loop_key))
+            else:
+                self.shared += 1
+
+        result: T = await asyncio.shield(task)
+        return result
+
+    def _forget(self, loop_key: Tuple[int, str]) -> None:
+        with self._lock:
+            self._tasks.pop(loop_key, None)
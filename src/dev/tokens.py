@@ -0,0 +1,132 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Characters per token for English prose and code with Llama-style BPE.
+CHARS_PER_TOKEN = 4.0
+# Role markers and separators around each chat message.
+MESSAGE_OVERHEAD = 4
+# Vision models bill an image as a fixed block of tokens whatever its
+# size, so a base64 data URL must not be counted as text.
+IMAGE_TOKENS = 1600
+
+
+def _load_tokenizer(encoding: str) -> Optional[Callable[[str], int]]:
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        encoder = tiktoken.get_encoding(encoding)
+    except Exception:
+        return None
+    return lambda text: len(encoder.encode(text, disallowed_special=()))
+
+
+class TokenEstimator:
+    """
+    Estimates how many tokens a prompt will cost before it is sent, with a
+    character heuristic or, given an `encoding` such as "cl100k_base" and
+    tiktoken installed, a real tokenizer that is closer for odd text.
+    Neither is exact for Llama models, so budgets built on it should keep
+    some headroom.
+    """
+
+    def __init__(self, encoding: str | None = None, cache_size: int = 4096):
+        tokenizer = _load_tokenizer(encoding) if encoding else None
+        self.exact = tokenizer is not None
+
+        def count(text: str) -> int:
+            if tokenizer is not None:
+                return tokenizer(text)
+            return int(len(text) / CHARS_PER_TOKEN + 0.5)
+
+        # System prompts and templates repeat on every call.
+        self._count = lru_cache(maxsize=cache_size)(count)
+
+    def count_text(self, text: str) -> int:
+        return self._count(text) if text else 0
+
+    def count_content(self, content: Any) -> int:
+        if isinstance(content, str):
+            return self.count_text(content)
+
+        total = 0
+        for part in content or []:
+            if part.get("type") == "image_url":
+                total += IMAGE_TOKENS
+            else:
+                total += self.count_text(str(part.get("text", "")))
+        return total
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        return MESSAGE_OVERHEAD + self.count_content(message.get("content"))
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+    def estimate_request(self, messages: List[Dict[str, Any]], max_tokens: int) -> int:
+        """
+        Worst case tokens a request can use: its prompt plus every token it
+        is allowed to generate, which is what rate limits are checked on.
+        """
+        return self.count_messages(messages) + max_tokens
+
+
+def has_image(message: Dict[str, Any]) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(
+        part.get("type") == "image_url" for part in content
+    )
+
+
+def without_images(message: Dict[str, Any]) -> Dict[str, Any]:
+    content = [
+        (
+            {"type": "text", "text": "[image omitted]"}
+            if part.get("type") == "image_url"
+            else part
+        )
+        for part in message["content"]
+    ]
+    return {**message, "content": content}
+
+
+def fit_messages(
+    messages: List[Dict[str, Any]],
+    max_tokens: int,
+    estimator: TokenEstimator,
+) -> List[Dict[str, Any]]:
+    """
+    Trims a conversation to `max_tokens`. Images in all but the newest
+    image message are replaced by a placeholder first, since they are the
+    most expensive part; then the oldest messages are dropped. Leading
+    system messages and the newest message are always kept.
+    """
+    if estimator.count_messages(messages) <= max_tokens:
+        return messages
+
+    newest_image = max(
+        (index for index, message in enumerate(messages) if has_image(message)),
+        default=-1,
+    )
+    fitted = [
+        (
+            without_images(message)
+            if has_image(message) and index != newest_image
+            else message
+        )
+        for index, message in enumerate(messages)
+    ]
+
+    head = 0
+    while head < len(fitted) - 1 and fitted[head].get("role") == "system":
+        head += 1
+    system, rest = fitted[:head], fitted[head:]
+
+    total = estimator.count_messages(fitted)
+    while len(rest) > 1 and total > max_tokens:
+        total -= estimator.count_message(rest.pop(0))
+
+    return system + rest
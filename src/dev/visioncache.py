@@ -0,0 +1,213 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import redis
+from groq.types.chat import ChatCompletion
+
+from .reporting import Reporter
+from .scene import hamming
+from src.service.types.misc import CacheStats
+
+
+class VisionCacheBacking(ABC):
+    """
+    Second tier that keeps vision results across restarts. Entries are
+    (phash, created_at, serialized ChatCompletion).
+    """
+
+    @abstractmethod
+    def load(self) -> List[Tuple[int, float, str]]: ...
+
+    @abstractmethod
+    def save(self, phash: int, created_at: float, payload: str) -> None: ...
+
+    @abstractmethod
+    def delete(self, phash: int) -> None: ...
+
+
+class RedisVisionBacking(VisionCacheBacking):
+    def __init__(self, client: redis.StrictRedis, ttl: float, prefix: str = "vision:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, phash: int) -> str:
+        return f"{self.prefix}{phash:016x}"
+
+    def load(self) -> List[Tuple[int, float, str]]:
+        entries = []
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            value = self.client.get(key)
+            if not value:
+                continue
+            created_at, _, payload = str(value).partition("|")
+            phash = int(str(key)[len(self.prefix) :], 16)
+            entries.append((phash, float(created_at), payload))
+        return entries
+
+    def save(self, phash: int, created_at: float, payload: str) -> None:
+        self.client.set(
+            self._key(phash), f"{created_at!r}|{payload}", ex=max(1, int(self.ttl))
+        )
+
+    def delete(self, phash: int) -> None:
+        self.client.delete(self._key(phash))
+
+
+class SqliteVisionBacking(VisionCacheBacking):
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vision_cache "
+            "(phash TEXT PRIMARY KEY, created_at REAL, payload TEXT)"
+        )
+        self._db.commit()
+
+    def load(self) -> List[Tuple[int, float, str]]:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM vision_cache WHERE created_at < ?",
+                (time.time() - self.ttl,),
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT phash, created_at, payload FROM vision_cache"
+            ).fetchall()
+        return [
+            (int(phash, 16), created_at, payload) for phash, created_at, payload in rows
+        ]
+
+    def save(self, phash: int, created_at: float, payload: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO vision_cache VALUES (?, ?, ?)",
+                (f"{phash:016x}", created_at, payload),
+            )
+            self._db.commit()
+
+    def delete(self, phash: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM vision_cache WHERE phash = ?", (f"{phash:016x}",)
+            )
+            self._db.commit()
+
+
+class VisionCache:
+    """
+    LRU cache of vision results keyed by the perceptual hash of the frame
+    they describe. A lookup also matches entries whose hash is within
+    `max_distance` bits, so near-identical views of the same spot hit.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 256,
+        ttl: float = 600.0,
+        max_distance: int = 4,
+        backing: VisionCacheBacking | None = None,
+        reporter: Reporter | None = None,
+    ):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.backing = backing
+        self.reporter = reporter
+
+        self._entries: OrderedDict[int, Tuple[float, ChatCompletion]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+        if backing:
+            self._warm(backing)
+
+    def _warm(self, backing: VisionCacheBacking) -> None:
+        try:
+            entries = sorted(backing.load(), key=lambda entry: entry[1])
+        except Exception as e:
+            if self.reporter:
+                self.reporter.log_error(f"Could not load vision cache: {e}")
+            return
+
+        now = time.time()
+        for phash, created_at, payload in entries[-self.capacity :]:
+            if now - created_at > self.ttl:
+                continue
+            try:
+                result = ChatCompletion.model_validate_json(payload)
+            except ValueError:
+                continue
+            self._entries[phash] = (created_at, result)
+
+        self.stats.size = len(self._entries)
+
+    def _find(self, phash: int, now: float) -> Optional[int]:
+        if phash in self._entries:
+            return phash
+
+        best: Optional[int] = None
+        best_distance = self.max_distance + 1
+        for key, (created_at, _) in self._entries.items():
+            if now - created_at > self.ttl:
+                continue
+            distance = hamming(phash, key)
+            if distance < best_distance:
+                best, best_distance = key, distance
+        return best
+
+    def get(self, phash: int) -> Optional[ChatCompletion]:
+        now = time.time()
+        with self._lock:
+            key = self._find(phash, now)
+            if key is None:
+                self.stats.misses += 1
+                return None
+
+            created_at, result = self._entries[key]
+            if now - created_at > self.ttl:
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                self.stats.size = len(self._entries)
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            if key != phash:
+                self.stats.near_hits += 1
+            return result
+
+    def put(self, phash: int, result: ChatCompletion) -> None:
+        now = time.time()
+        evicted: List[int] = []
+
+        with self._lock:
+            self._entries[phash] = (now, result)
+            self._entries.move_to_end(phash)
+            while len(self._entries) > self.capacity:
+                key, _ = self._entries.popitem(last=False)
+                evicted.append(key)
+            self.stats.evictions += len(evicted)
+            self.stats.size = len(self._entries)
+
+        if self.backing:
+            try:
+                self.backing.save(phash, now, result.model_dump_json())
+                for key in evicted:
+                    self.backing.delete(key)
+            except Exception as e:
+                if self.reporter:
+                    self.reporter.log_error(
+                        f"Could not persist vision cache entry: {e}"
+                    )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats.size = 0
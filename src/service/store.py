@@ -0,0 +1,637 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from hashlib import sha1
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from .util import Frame, decode_data_url, process_env
+
+
+class CameraStore(ABC):
+    """
+    Where ingested camera frames are published for the rest of the service.
+
+    Backends assign every stored frame the next sequence number for its
+    source and wake anyone blocked in `wait_for_frame`.
+    """
+
+    @abstractmethod
+    def set_frame_bytes(
+        self,
+        src: str,
+        frame: bytes | memoryview,
+        timestamp: float | None = None,
+        variants: dict[str, bytes] | None = None,
+        phash: int | None = None,
+        scene_seq: int | None = None,
+    ) -> Frame: ...
+
+    @abstractmethod
+    def get_latest(self, src: str) -> Optional[Frame]: ...
+
+    @abstractmethod
+    def get_frame_seq(self, src: str) -> int: ...
+
+    @abstractmethod
+    def wait_for_frame(
+        self, src: str, after_seq: int, timeout: float | None = None
+    ) -> Optional[Frame]: ...
+
+    @abstractmethod
+    def clear_frames(self, src: str) -> None: ...
+
+    @abstractmethod
+    def get_all_sources(self) -> list[str]: ...
+
+    @abstractmethod
+    def clear_all(self) -> None: ...
+
+    def get_history(
+        self,
+        src: str,
+        start: float | None = None,
+        end: float | None = None,
+        count: int | None = None,
+    ) -> list[Frame]:
+        return []
+
+    def get_frame_at(self, src: str, timestamp: float) -> Optional[Frame]:
+        return None
+
+    def get_frame_bytes(self, src: str) -> Optional[bytes]:
+        frame = self.get_latest(src)
+        return frame.data if frame else None
+
+    def set_frame(self, src: str, frame: str) -> None:
+        self.set_frame_bytes(src, decode_data_url(frame))
+
+    def get_frame(self, src: str) -> Optional[str]:
+        frame = self.get_latest(src)
+        return frame.data_url if frame else None
+
+
+# Replaces a source's frame hash with the fields in ARGV[2:], keeping and
+# incrementing its sequence number, and notifies the channel in ARGV[1].
+# Replacing rather than updating the hash drops the previous frame's
+# variants that the new one lacks.
+SET_FRAME_SCRIPT = """
+local seq = redis.call('HINCRBY', KEYS[1], 'seq', 1)
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'seq', seq, unpack(ARGV, 2))
+redis.call('PUBLISH', ARGV[1], '')
+return seq
+"""
+
+
+class RedisCameraStore(CameraStore):
+    FRAME_PREFIX = "frame:"
+    CHANNEL_PREFIX = "frames:"
+    HISTORY_PREFIX = "history:"
+    VARIANT_FIELD_PREFIX = b"variant:"
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        history_maxlen: int = 0,
+    ):
+        self.client = redis.StrictRedis(
+            host=host, port=port, db=db, decode_responses=True
+        )
+        self.binary_client = redis.StrictRedis(host=host, port=port, db=db)
+        self.history_maxlen = history_maxlen
+        self._set_frame = self.binary_client.register_script(SET_FRAME_SCRIPT)
+
+        self._frames: dict[str, Frame] = {}
+
+    def _frame_key(self, src: str) -> str:
+        return f"{self.FRAME_PREFIX}{src}"
+
+    def _channel(self, src: str) -> str:
+        return f"{self.CHANNEL_PREFIX}{src}"
+
+    def _history_key(self, src: str) -> str:
+        return f"{self.HISTORY_PREFIX}{src}"
+
+    @classmethod
+    def _decode_frame(cls, fields: dict[bytes, bytes]) -> Frame:
+        prefix = cls.VARIANT_FIELD_PREFIX
+        phash = fields.get(b"phash")
+        scene_seq = fields.get(b"scene_seq")
+        return Frame(
+            bytes(fields[b"data"]),
+            seq=int(fields[b"seq"]),
+            timestamp=float(fields[b"ts"]),
+            phash=int(phash) if phash else None,
+            scene_seq=int(scene_seq) if scene_seq else None,
+            variants={
+                name[len(prefix) :].decode(): bytes(value)
+                for name, value in fields.items()
+                if name.startswith(prefix)
+            },
+        )
+
+    def set_frame_bytes(
+        self,
+        src: str,
+        frame: bytes | memoryview,
+        timestamp: float | None = None,
+        variants: dict[str, bytes] | None = None,
+        phash: int | None = None,
+        scene_seq: int | None = None,
+    ) -> Frame:
+        """
+        Stores a raw JPEG frame and its preprocessed variants, assigning it
+        the next sequence number for `src`, and notifies anyone blocked in
+        `wait_for_frame`. Leaving `scene_seq` unset marks the frame as the
+        start of a new scene.
+        """
+        data = bytes(frame)
+        timestamp = time.time() if timestamp is None else timestamp
+        variants = variants or {}
+        key = self._frame_key(src)
+
+        fields: List[bytes] = [b"data", data, b"ts", repr(timestamp).encode()]
+        for name, variant in variants.items():
+            fields += [self.VARIANT_FIELD_PREFIX + name.encode(), variant]
+        if phash is not None:
+            fields += [b"phash", str(phash).encode()]
+        if scene_seq is not None:
+            fields += [b"scene_seq", str(scene_seq).encode()]
+
+        seq = int(self._set_frame(keys=[key], args=[self._channel(src), *fields]))
+
+        if self.history_maxlen:
+            self.binary_client.xadd(
+                self._history_key(src),
+                {"seq": seq, "ts": repr(timestamp), "data": data},
+                maxlen=self.history_maxlen,
+                approximate=False,
+            )
+
+        stored = Frame(
+            data,
+            seq=seq,
+            timestamp=timestamp,
+            variants=variants,
+            phash=phash,
+            scene_seq=scene_seq,
+        )
+        self._frames[src] = stored
+        return stored
+
+    def get_frame_seq(self, src: str) -> int:
+        seq = self.client.hget(self._frame_key(src), "seq")
+        return int(seq) if seq else 0
+
+    def get_latest(self, src: str) -> Optional[Frame]:
+        cached = self._frames.get(src)
+        if cached is not None and self.get_frame_seq(src) == cached.seq:
+            return cached
+
+        fields: Any = self.binary_client.hgetall(self._frame_key(src))
+        if not fields or not fields.get(b"data"):
+            self._frames.pop(src, None)
+            return None
+
+        frame = self._decode_frame(fields)
+        self._frames[src] = frame
+        return frame
+
+    def wait_for_frame(
+        self, src: str, after_seq: int, timeout: float | None = None
+    ) -> Optional[Frame]:
+        """
+        Blocks until a frame newer than `after_seq` is stored for `src`, which
+        may happen in another process. Returns None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)  # type: ignore[no-untyped-call]
+        with pubsub:
+            pubsub.subscribe(self._channel(src))
+
+            while True:
+                frame = self.get_latest(src)
+                if frame is not None and frame.seq > after_seq:
+                    return frame
+
+                remaining = 1.0 if deadline is None else deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+
+                pubsub.get_message(timeout=remaining)
+
+    def get_history(
+        self,
+        src: str,
+        start: float | None = None,
+        end: float | None = None,
+        count: int | None = None,
+    ) -> list[Frame]:
+        """
+        Returns frames from the capped Redis stream kept when `history_maxlen`
+        is set, oldest first. Stream IDs are insert times, so `start` and `end`
+        select frames to within the write latency of their capture time.
+        """
+        entries: Any = self.binary_client.xrange(
+            self._history_key(src),
+            min="-" if start is None else str(int(start * 1000)),
+            max="+" if end is None else str(int(end * 1000)),
+            count=count,
+        )
+        return [self._decode_frame(fields) for _, fields in entries]
+
+    def get_frame_at(self, src: str, timestamp: float) -> Optional[Frame]:
+        entries: Any = self.binary_client.xrevrange(
+            self._history_key(src), max=str(int(timestamp * 1000)), count=1
+        )
+        if not entries:
+            return None
+
+        _, fields = entries[0]
+        return self._decode_frame(fields)
+
+    def clear_frames(self, src: str) -> None:
+        self._frames.pop(src, None)
+        self.client.delete(self._frame_key(src), self._history_key(src))
+
+    def get_all_sources(self) -> list[str]:
+        prefix = self.FRAME_PREFIX
+        return [str(key)[len(prefix) :] for key in self.client.scan_iter(f"{prefix}*")]
+
+    def clear_all(self) -> None:
+        """
+        Deletes every source's frame and history, leaving the other keys in
+        the database, such as the shared quota and caches, alone.
+        """
+        self._frames.clear()
+        pipe = self.client.pipeline(transaction=False)
+        for prefix in (self.FRAME_PREFIX, self.HISTORY_PREFIX):
+            for key in self.client.scan_iter(f"{prefix}*", count=1000):
+                pipe.delete(key)
+        pipe.execute()
+
+
+class MemoryCameraStore(CameraStore):
+    """
+    Keeps frames in this process only. Suited to a single-process robot
+    where the ingest thread and its readers share the interpreter.
+    """
+
+    def __init__(self) -> None:
+        self._frames: Dict[str, Frame] = {}
+        self._seqs: Dict[str, int] = {}
+        self._changed = threading.Condition()
+
+    def set_frame_bytes(
+        self,
+        src: str,
+        frame: bytes | memoryview,
+        timestamp: float | None = None,
+        variants: dict[str, bytes] | None = None,
+        phash: int | None = None,
+        scene_seq: int | None = None,
+    ) -> Frame:
+        with self._changed:
+            seq = self._seqs.get(src, 0) + 1
+            stored = Frame(
+                bytes(frame),
+                seq=seq,
+                timestamp=timestamp,
+                variants=variants,
+                phash=phash,
+                scene_seq=scene_seq,
+            )
+            self._seqs[src] = seq
+            self._frames[src] = stored
+            self._changed.notify_all()
+        return stored
+
+    def get_latest(self, src: str) -> Optional[Frame]:
+        return self._frames.get(src)
+
+    def get_frame_seq(self, src: str) -> int:
+        frame = self._frames.get(src)
+        return frame.seq if frame else 0
+
+    def wait_for_frame(
+        self, src: str, after_seq: int, timeout: float | None = None
+    ) -> Optional[Frame]:
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.get_frame_seq(src) > after_seq, timeout=timeout
+            )
+        frame = self._frames.get(src)
+        return frame if frame is not None and frame.seq > after_seq else None
+
+    def clear_frames(self, src: str) -> None:
+        with self._changed:
+            self._frames.pop(src, None)
+            self._seqs.pop(src, None)
+
+    def get_all_sources(self) -> list[str]:
+        return list(self._frames)
+
+    def clear_all(self) -> None:
+        with self._changed:
+            self._frames.clear()
+            self._seqs.clear()
+
+
+class SharedMemoryCameraStore(CameraStore):
+    """
+    Publishes the latest frame of each source in a memory-mapped file (on
+    tmpfs under /dev/shm when available) so other worker processes on the
+    same host can read frames without a socket round-trip or serialization.
+
+    Each file holds a fixed header, the source name and a payload region.
+    Writes are guarded by a sequence lock: the writer makes the lock count
+    odd while it writes and even when done, and readers retry if the count
+    changed under them. Readers that already hold the current frame only
+    read the header; a new frame is copied out once, as the writer may
+    overwrite the region as soon as the copy is checked. One writer per
+    source is assumed, which matches one ingest thread per camera.
+
+    Clearing a source flags its file as unlinked before removing it, so
+    readers in other processes drop their mapping and map the file the
+    writer creates next.
+    """
+
+    # lock, seq, timestamp, phash, scene_seq, flags, data_len, extra_len, src_len
+    HEADER = struct.Struct("<QQdQqIIII")
+    LOCK = struct.Struct("<Q")
+    SEQ = struct.Struct("<QQ")
+    VARIANT = struct.Struct("<HI")
+    SOURCE_SIZE = 1024
+    FLAGS = struct.Struct("<I")
+    FLAGS_OFFSET = struct.calcsize("<QQdQq")
+    HAS_PHASH = 1
+    UNLINKED = 2
+    MAX_READ_ATTEMPTS = 1000
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        capacity: int = 8 << 20,
+        poll_interval: float = 0.002,
+    ):
+        if directory is None:
+            root = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            directory = os.path.join(root, "av5c-frames")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+
+        self._payload_offset = self.HEADER.size + self.SOURCE_SIZE
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._frames: Dict[str, Frame] = {}
+        self._changed = threading.Condition()
+
+    def _path(self, src: str) -> str:
+        return os.path.join(self.directory, f"{sha1(src.encode()).hexdigest()}.frame")
+
+    def _flags(self, mapped: mmap.mmap) -> int:
+        return int(self.FLAGS.unpack_from(mapped, self.FLAGS_OFFSET)[0])
+
+    def _map(self, src: str, create: bool) -> Optional[mmap.mmap]:
+        mapped = self._maps.get(src)
+        if mapped is not None:
+            if not self._flags(mapped) & self.UNLINKED:
+                return mapped
+            del self._maps[src]
+            self._frames.pop(src, None)
+            mapped.close()
+
+        path = self._path(src)
+        size = self._payload_offset + self.capacity
+        try:
+            fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o600)
+        except FileNotFoundError:
+            return None
+
+        try:
+            if os.fstat(fd).st_size < size:
+                if not create:
+                    return None
+                os.ftruncate(fd, size)
+            mapped = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+
+        self._maps[src] = mapped
+        return mapped
+
+    @classmethod
+    def _encode_variants(cls, variants: dict[str, bytes]) -> bytes:
+        parts: List[bytes] = []
+        for name, data in variants.items():
+            encoded = name.encode()
+            parts += [cls.VARIANT.pack(len(encoded), len(data)), encoded, data]
+        return b"".join(parts)
+
+    @classmethod
+    def _decode_variants(cls, extra: bytes) -> dict[str, bytes]:
+        variants: dict[str, bytes] = {}
+        offset = 0
+        while offset < len(extra):
+            name_len, data_len = cls.VARIANT.unpack_from(extra, offset)
+            offset += cls.VARIANT.size
+            name = extra[offset : offset + name_len].decode()
+            offset += name_len
+            variants[name] = extra[offset : offset + data_len]
+            offset += data_len
+        return variants
+
+    def set_frame_bytes(
+        self,
+        src: str,
+        frame: bytes | memoryview,
+        timestamp: float | None = None,
+        variants: dict[str, bytes] | None = None,
+        phash: int | None = None,
+        scene_seq: int | None = None,
+    ) -> Frame:
+        data = bytes(frame)
+        timestamp = time.time() if timestamp is None else timestamp
+        variants = variants or {}
+        extra = self._encode_variants(variants)
+        source = src.encode()
+
+        if len(data) + len(extra) > self.capacity:
+            raise ValueError(
+                f"Frame of {len(data) + len(extra)} bytes exceeds shared memory capacity."
+            )
+        if len(source) > self.SOURCE_SIZE:
+            raise ValueError("Camera source name is too long for shared memory.")
+
+        with self._changed:
+            mapped = self._map(src, create=True)
+            assert mapped is not None
+
+            lock, seq = self.SEQ.unpack_from(mapped, 0)
+            lock |= 1
+            seq += 1
+            stored = Frame(
+                data,
+                seq=seq,
+                timestamp=timestamp,
+                variants=variants,
+                phash=phash,
+                scene_seq=scene_seq,
+            )
+
+            self.LOCK.pack_into(mapped, 0, lock)
+            offset = self._payload_offset
+            mapped[offset : offset + len(data)] = data
+            mapped[offset + len(data) : offset + len(data) + len(extra)] = extra
+            mapped[self.HEADER.size : self.HEADER.size + len(source)] = source
+            self.HEADER.pack_into(
+                mapped,
+                0,
+                lock,
+                seq,
+                timestamp,
+                phash or 0,
+                stored.scene_seq,
+                self.HAS_PHASH if phash is not None else 0,
+                len(data),
+                len(extra),
+                len(source),
+            )
+            self.LOCK.pack_into(mapped, 0, lock + 1)
+
+            self._frames[src] = stored
+            self._changed.notify_all()
+
+        return stored
+
+    def get_frame_seq(self, src: str) -> int:
+        mapped = self._map(src, create=False)
+        return self.SEQ.unpack_from(mapped, 0)[1] if mapped is not None else 0
+
+    def get_latest(self, src: str) -> Optional[Frame]:
+        mapped = self._map(src, create=False)
+        if mapped is None:
+            return None
+
+        cached = self._frames.get(src)
+        offset = self._payload_offset
+
+        for _ in range(self.MAX_READ_ATTEMPTS):
+            header = self.HEADER.unpack_from(mapped, 0)
+            lock, seq = header[0], header[1]
+            if lock & 1:
+                time.sleep(0)
+                continue
+            if seq == 0:
+                return None
+            if cached is not None and cached.seq == seq:
+                return cached
+
+            _, _, timestamp, phash, scene_seq, flags, data_len, extra_len, _ = header
+            data = mapped[offset : offset + data_len]
+            extra = mapped[offset + data_len : offset + data_len + extra_len]
+
+            if self.LOCK.unpack_from(mapped, 0)[0] != lock:
+                continue
+
+            frame = Frame(
+                data,
+                seq=seq,
+                timestamp=timestamp,
+                variants=self._decode_variants(extra),
+                phash=phash if flags & self.HAS_PHASH else None,
+                scene_seq=scene_seq,
+            )
+            self._frames[src] = frame
+            return frame
+
+        # The writer died mid-write or is writing continuously; serve what we had.
+        return cached
+
+    def wait_for_frame(
+        self, src: str, after_seq: int, timeout: float | None = None
+    ) -> Optional[Frame]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            if self.get_frame_seq(src) > after_seq:
+                return self.get_latest(src)
+
+            remaining = (
+                self.poll_interval
+                if deadline is None
+                else min(self.poll_interval, deadline - time.monotonic())
+            )
+            if remaining <= 0:
+                return None
+
+            # Local writers wake us immediately; other processes are polled.
+            with self._changed:
+                self._changed.wait(remaining)
+
+    def clear_frames(self, src: str) -> None:
+        with self._changed:
+            mapped = self._map(src, create=False)
+            self._maps.pop(src, None)
+            if mapped is not None:
+                flags = self._flags(mapped)
+                self.FLAGS.pack_into(mapped, self.FLAGS_OFFSET, flags | self.UNLINKED)
+                mapped.close()
+            self._frames.pop(src, None)
+            try:
+                os.unlink(self._path(src))
+            except FileNotFoundError:
+                pass
+
+    def get_all_sources(self) -> list[str]:
+        sources: List[str] = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".frame"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    header = f.read(self.HEADER.size + self.SOURCE_SIZE)
+            except OSError:
+                continue
+            if len(header) < self.HEADER.size:
+                continue
+            src_len = self.HEADER.unpack_from(header, 0)[-1]
+            source = header[self.HEADER.size : self.HEADER.size + src_len]
+            sources.append(source.decode())
+        return sources
+
+    def clear_all(self) -> None:
+        for src in self.get_all_sources():
+            self.clear_frames(src)
+
+
+def create_camera_store(backend: str | None = None) -> CameraStore:
+    """
+    Builds the camera store named by `backend`, or by the CAMERA_STORE
+    setting: `redis` (default), `memory` or `shm`.
+    """
+    backend = (backend or process_env("CAMERA_STORE", "redis") or "redis").lower()
+
+    if backend == "redis":
+        return RedisCameraStore(
+            host=process_env("REDIS_HOST", "localhost") or "localhost",
+            port=int(process_env("REDIS_PORT", "6379") or 6379),
+            history_maxlen=int(process_env("CAMERA_HISTORY_MAXLEN", "0") or 0),
+        )
+    if backend == "memory":
+        return MemoryCameraStore()
+    if backend in ("shm", "shared_memory"):
+        return SharedMemoryCameraStore(directory=process_env("CAMERA_STORE_PATH"))
+
+    raise ValueError(f"Unknown camera store backend: {backend}")
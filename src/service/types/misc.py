@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field
 
 
 class LogEntry(BaseModel):
@@ -9,3 +9,48 @@ class LogEntry(BaseModel):
 class GoalSubmission(BaseModel):
     goal_id: str
     goal_request: str
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    near_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResponseCacheStats(BaseModel):
+    total: CacheStats
+    intents: dict[str, CacheStats]
+
+
+class ModelRouteStats(BaseModel):
+    tier: str
+    vision: bool
+    samples: int
+    p50_ms: float | None
+    p90_ms: float | None
+    expected_ms: float
+    error_rate: float
+    healthy: bool
+
+
+class ModelUsage(BaseModel):
+    requests_used: int
+    requests_max: int
+    tokens_used: int
+    tokens_max: int
+    spend_cad: float
+
+
+class UsageReport(BaseModel):
+    models: dict[str, ModelUsage]
+    total_spend_cad: float
+    max_spend_cad: float
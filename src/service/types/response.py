@@ -1,8 +1,8 @@
-from typing import List
+from typing import Dict, List
 from pydantic import BaseModel
 
 from .misc import LogEntry
-from .status import DeviceStatus
+from .status import DeviceStatus, IngestStatus
 
 
 class CameraResponse(BaseModel):
@@ -10,11 +10,20 @@ class CameraResponse(BaseModel):
     status: DeviceStatus
 
 
+class CamerasResponse(BaseModel):
+    cameras: Dict[str, IngestStatus]
+    primary: str | None
+
+
 class GoalResponse(BaseModel):
     goals: List[dict[str, str]] | None
     next_goal: dict[str, str] | None
     goals_size: int
     current_goal: dict[str, str] | None
+    # Submitted goals still waiting to be accepted or denied.
+    pending_goals: List[dict[str, str]] = []
+    # Recently vetted goals, newest first, with why they were accepted or denied.
+    decided_goals: List[dict[str, str]] = []
 
 
 class LogsResponse(BaseModel):
@@ -9,3 +9,28 @@ class ServiceStatus(BaseModel):
     goal: str | None
     commands_executed: int
     log_size: int
+
+
+class IngestStatus(DeviceStatus):
+    connected: bool
+    frames: int
+    dropped: int
+    skipped: int
+    reconnects: int
+    fps: float
+    latency_ms: float
+    max_latency_ms: float
+    heartbeat_age: float | None
+    last_error: str | None
+
+
+class StageOccupancy(BaseModel):
+    processed: int
+    dropped: int
+    errors: int
+    queued: int
+    capacity: int
+    # Fractions of the time since the stage started.
+    busy: float
+    blocked: float
+    mean_ms: float | None
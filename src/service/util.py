@@ -1,4 +1,6 @@
-import redis
+import base64
+import binascii
+import time
 from typing import Optional
 from dotenv import get_key, load_dotenv
 
@@ -10,23 +12,90 @@ def process_env(
     return get_key(path, key_to_get=key, encoding="utf-8") or fallback
 
 
-class CameraStore:
-    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0):
-        self.client = redis.StrictRedis(
-            host=host, port=port, db=db, decode_responses=True
-        )
+JPEG_DATA_URL_PREFIX = "data:image/jpeg;base64,"
 
-    def set_frame(self, src: str, frame: str) -> None:
-        self.client.set(src, frame)
 
-    def get_frame(self, src: str) -> Optional[str]:
-        return self.client.get(src)
+def jpeg_data_url(frame: bytes) -> str:
+    return JPEG_DATA_URL_PREFIX + base64.b64encode(frame).decode("ascii")
 
-    def clear_frames(self, src: str) -> None:
-        self.client.delete(src)
 
-    def get_all_sources(self) -> list[str]:
-        return self.client.keys()
+def decode_data_url(data_url: str) -> bytes:
+    _, _, payload = data_url.partition("base64,")
+    try:
+        return base64.b64decode(payload, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 data URL: {e}") from e
 
-    def clear_all(self) -> None:
-        self.client.flushdb()
+
+class Frame:
+    """
+    A raw JPEG frame with the monotonic sequence number and capture time it
+    was stored under, plus any preprocessed JPEG variants of it. Base64 data
+    URLs are only built on first use and are then kept for the lifetime of
+    the frame.
+
+    `scene_seq` is the sequence number of the frame that started the scene
+    this frame belongs to, so two frames with the same `scene_seq` show the
+    same scene as far as scene-change detection can tell.
+    """
+
+    __slots__ = (
+        "data",
+        "seq",
+        "timestamp",
+        "variants",
+        "phash",
+        "scene_seq",
+        "_data_urls",
+    )
+
+    def __init__(
+        self,
+        data: bytes,
+        seq: int = 0,
+        timestamp: float | None = None,
+        variants: dict[str, bytes] | None = None,
+        phash: int | None = None,
+        scene_seq: int | None = None,
+    ):
+        self.data = data
+        self.seq = seq
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.variants = variants or {}
+        self.phash = phash
+        self.scene_seq = seq if scene_seq is None else scene_seq
+        self._data_urls: dict[str | None, str] = {}
+
+    @property
+    def scene_changed(self) -> bool:
+        return self.scene_seq == self.seq
+
+    @property
+    def data_url(self) -> str:
+        return self.data_url_for(None)
+
+    def variant_bytes(self, variant: str | None) -> bytes:
+        if variant is None:
+            return self.data
+        return self.variants.get(variant, self.data)
+
+    def data_url_for(self, variant: str | None) -> str:
+        """
+        Returns the data URL of a preprocessed variant, or of the raw frame
+        when `variant` is None or was not produced for this frame.
+        """
+        if variant not in self.variants:
+            variant = None
+
+        url = self._data_urls.get(variant)
+        if url is None:
+            url = jpeg_data_url(self.variant_bytes(variant))
+            self._data_urls[variant] = url
+        return url
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+    def __len__(self) -> int:
+        return len(self.data)
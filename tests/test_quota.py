@@ -0,0 +1,174 @@
+from typing import Any, Callable, Iterator, List
+
+import pytest
+
+from src.dev.models import ModelInfo, ModelLimits
+from src.dev.quota import RedisQuota
+from src.dev.ratelimiter import RateLimiter, RateLimitExceeded
+from src.dev.reporting import Reporter
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+LIMITS = ModelLimits(
+    requests_per_minute=10,
+    requests_per_day=1000,
+    tokens_per_minute=1000,
+    tokens_per_day=100000,
+)
+WINDOWS = LIMITS.model_dump()
+MODEL = "m"
+
+
+class SharedClock:
+    """
+    Wall time, as every process sees it.
+    """
+
+    def __init__(self) -> None:
+        self.now = 1_700_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+QuotaFactory = Callable[..., RedisQuota]
+
+
+@pytest.fixture
+def clock() -> SharedClock:
+    return SharedClock()
+
+
+@pytest.fixture
+def make_quota(clock: SharedClock) -> Iterator[QuotaFactory]:
+    """
+    Builds the quota of another process on the same Redis server.
+    """
+    server = fakeredis.FakeServer()
+    made: List[RedisQuota] = []
+
+    def make(**options: Any) -> RedisQuota:
+        client = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+        # Leases are only handed back by close(), unless a test says so.
+        options.setdefault("lease_ttl", 3600.0)
+        quota = RedisQuota(client, clock=clock, **options)
+        made.append(quota)
+        return quota
+
+    yield make
+    for quota in made:
+        quota.close()
+
+
+def limiter_for(quota: RedisQuota, max_spend_cad: float = 20.0) -> RateLimiter:
+    return RateLimiter(
+        reporter=Reporter(),
+        quota=quota,
+        max_spend_cad=max_spend_cad,
+        max_wait=0,
+        models={
+            MODEL: ModelInfo(
+                name=MODEL,
+                tier="basic",
+                input_price=1_000_000,
+                output_price=1_000_000,
+                limits=LIMITS,
+            )
+        },
+    )
+
+
+def test_admission_is_shared(make_quota: QuotaFactory, clock: SharedClock) -> None:
+    first, second = make_quota(), make_quota()
+
+    admitted = 0
+    for index in range(2 * LIMITS.requests_per_minute):
+        quota = first if index % 2 else second
+        if quota.reserve(MODEL, 10, WINDOWS) == 0:
+            admitted += 1
+    assert admitted == LIMITS.requests_per_minute
+
+    assert first.reserve(MODEL, 10, WINDOWS) == pytest.approx(60)
+    clock.now += 60
+    assert second.reserve(MODEL, 10, WINDOWS) == 0
+
+
+def test_tokens_are_shared(make_quota: QuotaFactory, clock: SharedClock) -> None:
+    first, second = make_quota(), make_quota()
+
+    assert first.reserve(MODEL, 600, WINDOWS) == 0
+    clock.now += 10
+    assert second.reserve(MODEL, 300, WINDOWS) == 0
+    assert first.wait_time(MODEL, 500, WINDOWS) == pytest.approx(50)
+
+    # A refund from either process frees the tokens for both.
+    second.adjust(MODEL, 0, -500, WINDOWS)
+    assert first.reserve(MODEL, 500, WINDOWS) == 0
+
+
+def test_leases_stay_within_limits(
+    make_quota: QuotaFactory, clock: SharedClock
+) -> None:
+    leasing = make_quota(lease_fraction=0.3)
+    other = make_quota()
+
+    admitted = 0
+    for index in range(3 * LIMITS.requests_per_minute):
+        quota = leasing if index % 3 else other
+        if quota.reserve(MODEL, 10, WINDOWS) == 0:
+            admitted += 1
+        clock.now += 0.1
+    assert admitted == LIMITS.requests_per_minute
+
+
+def test_unused_lease_is_returned(make_quota: QuotaFactory) -> None:
+    leasing = make_quota(lease_fraction=0.5)
+    other = make_quota()
+
+    # The first call leases half the minute's requests.
+    assert leasing.reserve(MODEL, 10, WINDOWS) == 0
+    for _ in range(LIMITS.requests_per_minute // 2):
+        assert other.reserve(MODEL, 10, WINDOWS) == 0
+    assert other.reserve(MODEL, 10, WINDOWS) > 0
+
+    leasing.close()
+    unused = LIMITS.requests_per_minute // 2 - 1
+    for _ in range(unused):
+        assert other.reserve(MODEL, 10, WINDOWS) == 0
+    assert other.reserve(MODEL, 10, WINDOWS) > 0
+
+
+def test_written_behind_spend_stops_others(make_quota: QuotaFactory) -> None:
+    batching = make_quota(flush_interval=3600.0)
+    other = make_quota(flush_interval=3600.0)
+    spender, watcher = limiter_for(batching, 1.0), limiter_for(other, 1.0)
+
+    # One token costs 1 USD, or 1.725 CAD with conversion and tax.
+    spender.record_usage(MODEL, 1, 0)
+    assert spender.total_spent() == pytest.approx(1.725)
+    assert watcher.total_spent() == 0
+    assert other.expenses() == {}
+
+    batching.flush()
+    assert other.expenses() == {MODEL: pytest.approx(1.725)}
+    # Admission goes by the spend cached at the watcher's last flush.
+    assert watcher.admit(MODEL, 10) == MODEL
+
+    other.flush()
+    assert watcher.total_spent() == pytest.approx(1.725)
+    with pytest.raises(RateLimitExceeded):
+        watcher.admit(MODEL, 10)
+
+
+def test_written_behind_usage(make_quota: QuotaFactory) -> None:
+    batching = make_quota(flush_interval=3600.0)
+    other = make_quota()
+
+    batching.record(MODEL, 2, 300, 0.5)
+    assert batching.usage(MODEL) == {"requests_used": 2, "tokens_used": 300}
+    assert other.usage(MODEL) == {"requests_used": 0, "tokens_used": 0}
+
+    batching.flush()
+    assert other.usage(MODEL) == {"requests_used": 2, "tokens_used": 300}
+    assert other.record(MODEL, 1, 100, 0.25) == pytest.approx(0.75)
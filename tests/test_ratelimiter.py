@@ -0,0 +1,172 @@
+import asyncio
+import bisect
+import random
+from typing import List, Tuple
+
+import pytest
+
+from src.dev.models import ModelInfo, ModelLimits
+from src.dev.ratelimiter import RateLimiter
+from src.dev.reporting import Reporter
+
+LIMITS = ModelLimits(
+    requests_per_minute=5,
+    requests_per_day=1000,
+    tokens_per_minute=1000,
+    tokens_per_day=100000,
+)
+
+
+class SimulatedClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+    async def async_sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> SimulatedClock:
+    return SimulatedClock()
+
+
+@pytest.fixture
+def limiter(clock: SimulatedClock) -> RateLimiter:
+    return RateLimiter(
+        reporter=Reporter(),
+        clock=clock,
+        sleep=clock.sleep,
+        async_sleep=clock.async_sleep,
+        models={
+            name: ModelInfo(name=name, tier="basic", limits=LIMITS)
+            for name in ("a", "b")
+        },
+    )
+
+
+def busiest_window(admitted: List[Tuple[float, int]]) -> Tuple[int, int]:
+    """
+    The most requests and tokens admitted within any 60 s window.
+    """
+    times = [at for at, _ in admitted]
+    requests = tokens = 0
+    for index, at in enumerate(times):
+        end = bisect.bisect_left(times, at + 60)
+        requests = max(requests, end - index)
+        tokens = max(tokens, sum(used for _, used in admitted[index:end]))
+    return requests, tokens
+
+
+def test_no_window_overshoots(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    rng = random.Random(7)
+    admitted: List[Tuple[float, int]] = []
+
+    while clock() < 600:
+        tokens = rng.randint(1, 400)
+        assert limiter.acquire("a", tokens)
+        admitted.append((clock(), tokens))
+        clock.sleep(rng.uniform(0, 3))
+
+    requests, tokens = busiest_window(admitted)
+    assert requests <= LIMITS.requests_per_minute
+    assert tokens <= LIMITS.tokens_per_minute
+    # Back to back calls keep one of the limits saturated.
+    assert len(admitted) >= 10 * LIMITS.requests_per_minute * 0.5
+
+
+def test_refund_never_overshoots(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    admitted: List[Tuple[float, int]] = []
+
+    while clock() < 600:
+        # Reserve generously and report less, as BaseBrain does.
+        assert limiter.acquire("a", 400)
+        limiter.record_usage("a", 100, 50, reserved_tokens=400)
+        admitted.append((clock(), 150))
+        clock.sleep(1)
+
+    requests, tokens = busiest_window(admitted)
+    assert requests <= LIMITS.requests_per_minute
+    assert tokens <= LIMITS.tokens_per_minute
+
+
+def test_wait_is_exact(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    for _ in range(LIMITS.requests_per_minute):
+        assert limiter.acquire("a", 10, timeout=0)
+        clock.sleep(2)
+
+    # The first call leaves the window 60 s after it was admitted.
+    wait = limiter.wait_time("a", 10)
+    assert wait == pytest.approx(60 - clock())
+
+    clock.sleep(wait - 0.01)
+    assert not limiter.acquire("a", 10, timeout=0)
+    clock.sleep(0.01)
+    assert limiter.wait_time("a", 10) == 0
+    assert limiter.acquire("a", 10, timeout=0)
+
+
+def test_token_wait_is_exact(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    assert limiter.acquire("a", 600)
+    clock.sleep(10)
+    assert limiter.acquire("a", 300)
+
+    # 500 tokens only fit once the first call's 600 have left the window.
+    assert limiter.wait_time("a", 500) == pytest.approx(50)
+    assert limiter.wait_time("a", 100) == 0
+
+
+def test_timeout_does_not_reserve(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    assert limiter.acquire("a", 900)
+    wait = limiter.wait_time("a", 500)
+
+    assert not limiter.acquire("a", 500, timeout=wait - 1)
+    assert clock() == 0
+    assert limiter.wait_time("a", 500) == wait
+    # The capacity that was left is still there.
+    assert limiter.acquire("a", 100, timeout=0)
+    assert limiter.wait_time("a", 1) == wait
+
+
+def test_timeout_waits_when_it_can(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    assert limiter.acquire("a", 900)
+    wait = limiter.wait_time("a", 500)
+
+    assert limiter.acquire("a", 500, timeout=wait)
+    assert clock() == pytest.approx(wait)
+
+
+def test_async_acquire(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    async def run() -> None:
+        for _ in range(LIMITS.requests_per_minute):
+            assert await limiter.aacquire("a", 10)
+        assert clock() == 0
+
+        assert not await limiter.aacquire("a", 10, timeout=30)
+        assert clock() == 0
+
+        assert await limiter.aacquire("a", 10)
+        assert clock() == pytest.approx(60)
+
+    asyncio.run(run())
+
+
+def test_models_are_independent(limiter: RateLimiter, clock: SimulatedClock) -> None:
+    for _ in range(LIMITS.requests_per_minute):
+        assert limiter.acquire("a", 100, timeout=0)
+    assert not limiter.acquire("a", 100, timeout=0)
+
+    assert limiter.wait_time("b", 100) == 0
+    for _ in range(LIMITS.requests_per_minute):
+        assert limiter.acquire("b", 100, timeout=0)
+    assert clock() == 0
+
+
+def test_request_over_limit_is_rejected(limiter: RateLimiter) -> None:
+    with pytest.raises(ValueError):
+        limiter.acquire("a", LIMITS.tokens_per_minute + 1)